@@ -0,0 +1,132 @@
+"""
+Objets Discord factices (très légers) pour exercer les handlers de main.py hors ligne.
+
+Seuls les attributs réellement lus par les handlers sont fournis ; tout le reste
+lèverait AttributeError, ce qui signale qu'un handler a commencé à dépendre de
+quelque chose de nouveau.
+"""
+import os
+import sys
+from datetime import datetime, timezone
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Fichiers de données pilotés par variables d'environnement dans main.py
+DATA_FILES = {
+    "POINTS_DB_PATH": "points.json",
+    "SHOP_DB_PATH": "shop.json",
+    "PURCHASES_DB_PATH": "purchases.json",
+    "INVITES_DB_PATH": "invites.json",
+    "DAILY_DB_PATH": "daily.json",
+    "INVITE_REWARDS_DB_PATH": "invites_rewards.json",
+    "QUESTS_DB_PATH": "quests.json",
+    "QUESTS_PROGRESS_DB_PATH": "quests_progress.json",
+    "AVENT_DB_PATH": "avent.json",
+    "TICKETS_DB_PATH": "tickets.json",
+    "ACTIVITY_DB_PATH": "activity.json",
+}
+
+
+async def _no_prefix_commands(message):
+    return None
+
+
+def load_bot(data_dir: str):
+    """Importe main.py en pointant tous les fichiers de données vers data_dir (aucune connexion Discord)."""
+    os.makedirs(data_dir, exist_ok=True)
+    os.environ.setdefault("DISCORD_TOKEN", "bench")
+    for var, fname in DATA_FILES.items():
+        os.environ[var] = os.path.join(data_dir, fname)
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    import main  # noqa: E402  (import tardif : dépend des variables ci-dessus)
+
+    main.bot.process_commands = _no_prefix_commands  # pas de commandes préfixées en bench
+    main._INVITE_DETECT_DELAYS = (0,)                # pas d'attente de propagation API
+    main._migrate_data()                             # comme au démarrage du bot
+    return main
+
+
+class FakePermissions:
+    def __init__(self, administrator: bool = False, manage_messages: bool = False):
+        self.administrator = administrator
+        self.manage_messages = manage_messages
+
+
+class FakeRole:
+    def __init__(self, role_id: int, moderator: bool = False):
+        self.id = role_id
+        self.permissions = FakePermissions(manage_messages=moderator)
+
+
+class FakeChannel:
+    def __init__(self, channel_id: int, name: str = "bench"):
+        self.id = channel_id
+        self.name = name
+
+
+class FakeMember:
+    def __init__(self, user_id: int, guild: "FakeGuild", roles: list | None = None, bot: bool = False):
+        self.id = user_id
+        self.guild = guild
+        self.roles = roles or []
+        self.bot = bot
+        self.premium_since = None
+        self.display_name = f"user{user_id}"
+        self.name = self.display_name
+        self.mention = f"<@{user_id}>"
+
+
+class FakeInvite:
+    def __init__(self, code: str, inviter: FakeMember, uses: int = 0):
+        self.code = code
+        self.inviter = inviter
+        self.uses = uses
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int):
+        self.id = guild_id
+        self.members: dict[int, FakeMember] = {}
+        self.invite_map: dict[str, FakeInvite] = {}
+        self.system_channel = None
+
+    def add_member(self, member: FakeMember):
+        self.members[member.id] = member
+
+    def get_member(self, user_id: int):
+        return self.members.get(user_id)
+
+    def get_channel(self, channel_id: int):
+        return None
+
+    async def invites(self):
+        return list(self.invite_map.values())
+
+    async def vanity_invite(self):
+        return None
+
+
+class FakeReaction:
+    def __init__(self, message: "FakeMessage", count: int):
+        self.message = message
+        self.count = count
+
+
+class FakeMessage:
+    def __init__(self, message_id: int, author: FakeMember, channel: FakeChannel, content: str,
+                 created_at: datetime | None = None):
+        self.id = message_id
+        self.author = author
+        self.guild = author.guild
+        self.channel = channel
+        self.content = content
+        self.created_at = created_at or datetime.now(timezone.utc)
+        self.mentions: list = []
+        self.embeds: list = []
+        self.reactions: list[FakeReaction] = []
+
+
+class FakeVoiceState:
+    def __init__(self, channel: FakeChannel | None):
+        self.channel = channel
@@ -0,0 +1,234 @@
+"""
+Rejoue un mélange d'événements gateway synthétiques contre les handlers de main.py,
+sans Discord : on_message, on_reaction_add, on_voice_state_update, on_member_join
+et _mark_command_use, sur un dossier de données temporaire.
+
+Exemples :
+    python bench/replay_events.py
+    python bench/replay_events.py --users 2000 --duration 20 --msg-rate 300 --join-burst 100
+    python bench/replay_events.py --no-pace --json > bench_output.txt
+
+Rapport : événements/s, latence p50/p99 par handler (depuis l'instant prévu, donc
+attente derrière les verrous comprise), octets écrits par fichier.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _fakes import (  # noqa: E402
+    FakeChannel, FakeGuild, FakeInvite, FakeMember, FakeMessage, FakeReaction, FakeRole,
+    FakeVoiceState, load_bot,
+)
+
+GUILD_ID = 1_000_000
+CHANNEL_IDS = [2_000_001, 2_000_002, 2_000_003]
+VOICE_IDS = [3_000_001, 3_000_002]
+MOD_ROLE_ID = 4_000_001
+CONTENTS = ["salut", "MEOW", "gg", "Coucou <@1227330764321067039>", "lol", "ça va ?"]
+COMMANDS = ["/daily", "/profile", "/bump", "/avent", "/roulette"]
+
+
+def _pct(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Scenario:
+    def __init__(self, main, args):
+        self.main = main
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.guild = FakeGuild(GUILD_ID)
+        self.channels = [FakeChannel(cid) for cid in CHANNEL_IDS]
+        self.voice = [FakeChannel(cid, "vocal") for cid in VOICE_IDS]
+        mod_role = FakeRole(MOD_ROLE_ID, moderator=True)
+        self.users: list[FakeMember] = []
+        for n in range(args.users):
+            roles = [mod_role] if n % 50 == 0 else []
+            m = FakeMember(10_000 + n, self.guild, roles=roles)
+            self.guild.add_member(m)
+            self.users.append(m)
+        # quelques parrains avec un lien d'invitation chacun
+        self.inviters = self.users[: max(1, min(len(self.users), 20))]
+        for m in self.inviters:
+            code = f"inv{m.id}"
+            self.guild.invite_map[code] = FakeInvite(code, m)
+        self.in_voice: dict[int, FakeChannel] = {}
+        self.next_message_id = 1
+        self.next_member_id = 900_000
+        self.recent_messages: list[FakeMessage] = []
+
+    # --- fabriques d'événements (retournent une coroutine prête à attendre) ---
+    def message(self):
+        author = self.rng.choice(self.users)
+        msg = FakeMessage(self.next_message_id, author, self.rng.choice(self.channels), self.rng.choice(CONTENTS))
+        self.next_message_id += 1
+        self.recent_messages.append(msg)
+        del self.recent_messages[:-200]
+        return "on_message", self.main.on_message(msg)
+
+    def reaction(self):
+        if not self.recent_messages:
+            return self.message()
+        msg = self.rng.choice(self.recent_messages)
+        reactor = self.rng.choice(self.users)
+        if msg.reactions:
+            msg.reactions[0].count += 1
+        else:
+            msg.reactions.append(FakeReaction(msg, 1))
+        return "on_reaction_add", self.main.on_reaction_add(msg.reactions[0], reactor)
+
+    def voice_churn(self):
+        member = self.rng.choice(self.users)
+        current = self.in_voice.get(member.id)
+        if current is None:
+            after = self.rng.choice(self.voice)
+            self.in_voice[member.id] = after
+            return "on_voice_state_update", self.main.on_voice_state_update(
+                member, FakeVoiceState(None), FakeVoiceState(after))
+        # session vieillie artificiellement pour qu'elle crédite des minutes
+        key = (self.guild.id, member.id)
+        if key in self.main._voice_sessions:
+            self.main._voice_sessions[key] -= self.rng.randint(60, 1800)
+        if self.rng.random() < 0.3:
+            after = self.rng.choice([c for c in self.voice if c is not current] or self.voice)
+            self.in_voice[member.id] = after
+            return "on_voice_state_update", self.main.on_voice_state_update(
+                member, FakeVoiceState(current), FakeVoiceState(after))
+        del self.in_voice[member.id]
+        return "on_voice_state_update", self.main.on_voice_state_update(
+            member, FakeVoiceState(current), FakeVoiceState(None))
+
+    def join(self):
+        inviter = self.rng.choice(self.inviters)
+        newcomer = FakeMember(self.next_member_id, self.guild)
+        self.next_member_id += 1
+        self.guild.add_member(newcomer)
+        self.guild.invite_map[f"inv{inviter.id}"].uses += 1
+        return "on_member_join", self.main.on_member_join(newcomer)
+
+    def command(self):
+        user = self.rng.choice(self.users)
+        return "_mark_command_use", self.main._mark_command_use(self.guild.id, user.id, self.rng.choice(COMMANDS))
+
+    def schedule(self) -> list[tuple[float, str]]:
+        a = self.args
+        plan: list[tuple[float, str]] = []
+        for kind, rate in (("message", a.msg_rate), ("reaction", a.reaction_rate),
+                           ("voice_churn", a.voice_rate), ("command", a.command_rate)):
+            for _ in range(int(rate * a.duration)):
+                plan.append((self.rng.uniform(0, a.duration), kind))
+        for n in range(a.join_burst):
+            plan.append((a.join_at + n * 0.001, "join"))
+        plan.sort()
+        return plan
+
+
+async def run(args) -> dict:
+    data_dir = tempfile.mkdtemp(prefix="bench_replay_")
+    try:
+        main = load_bot(data_dir)
+        sc = Scenario(main, args)
+        await main._refresh_invite_cache(sc.guild)
+        plan = sc.schedule()
+
+        latencies: dict[str, list[float]] = {}
+        errors: dict[str, int] = {}
+        loop = asyncio.get_running_loop()
+
+        async def timed(kind: str, coro, scheduled: float):
+            try:
+                await coro
+            except Exception:
+                errors[kind] = errors.get(kind, 0) + 1
+            latencies.setdefault(kind, []).append(loop.time() - scheduled)
+
+        tasks = []
+        t_start = loop.time()
+        wall_start = time.perf_counter()
+        for at, kind in plan:
+            due = t_start + at
+            if args.pace:
+                delay = due - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            else:
+                due = loop.time()
+            handler, coro = getattr(sc, kind)()
+            tasks.append(asyncio.create_task(timed(handler, coro, due)))
+        await asyncio.gather(*tasks)
+        main._activity_log.flush()  # ce qu'activity_flusher écrirait au fil de l'eau
+        elapsed = time.perf_counter() - wall_start
+
+        written = {os.path.basename(p): {"writes": n, "bytes": b} for p, (n, b, _s) in main._io_stats.items()}
+        return {
+            "users": args.users,
+            "events": len(plan),
+            "elapsed_s": round(elapsed, 3),
+            "events_per_s": round(len(plan) / elapsed, 1) if elapsed else None,
+            "handlers": {
+                kind: {
+                    "count": len(vals),
+                    "p50_ms": round(_pct(vals, 0.50) * 1000, 2),
+                    "p99_ms": round(_pct(vals, 0.99) * 1000, 2),
+                    "max_ms": round(max(vals) * 1000, 2),
+                    "errors": errors.get(kind, 0),
+                }
+                for kind, vals in sorted(latencies.items())
+            },
+            "bytes_written": sum(v["bytes"] for v in written.values()),
+            "files": written,
+        }
+    finally:
+        if args.keep_data:
+            print(f"données conservées dans {data_dir}", file=sys.stderr)
+        else:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def _print_report(rep: dict):
+    print(f"{rep['events']} événements / {rep['users']} utilisateurs en {rep['elapsed_s']} s "
+          f"→ {rep['events_per_s']} évt/s")
+    print(f"{'handler':<24}{'n':>7}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}{'err':>6}")
+    for kind, h in rep["handlers"].items():
+        print(f"{kind:<24}{h['count']:>7}{h['p50_ms']:>10}{h['p99_ms']:>10}{h['max_ms']:>10}{h['errors']:>6}")
+    print(f"octets écrits : {rep['bytes_written']:,}")
+    for name, f in sorted(rep["files"].items(), key=lambda kv: -kv[1]["bytes"]):
+        print(f"  {name:<24}{f['writes']:>7} écritures {f['bytes']:>14,} o")
+
+
+def main_cli(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--users", type=int, default=500, help="nombre de membres simulés")
+    ap.add_argument("--duration", type=float, default=5.0, help="durée du scénario (s)")
+    ap.add_argument("--msg-rate", type=float, default=50.0, help="messages par seconde")
+    ap.add_argument("--reaction-rate", type=float, default=10.0, help="réactions par seconde")
+    ap.add_argument("--voice-rate", type=float, default=5.0, help="changements d'état vocal par seconde")
+    ap.add_argument("--command-rate", type=float, default=5.0, help="appels _mark_command_use par seconde")
+    ap.add_argument("--join-burst", type=int, default=20, help="nombre d'arrivées groupées")
+    ap.add_argument("--join-at", type=float, default=1.0, help="instant de la vague d'arrivées (s)")
+    ap.add_argument("--no-pace", dest="pace", action="store_false",
+                    help="tout envoyer d'un coup (débit max) au lieu de respecter les horaires")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--json", action="store_true", help="rapport JSON sur stdout")
+    ap.add_argument("--keep-data", action="store_true", help="ne pas effacer le dossier de données")
+    args = ap.parse_args(argv)
+
+    rep = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(rep, indent=2))
+    else:
+        _print_report(rep)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,221 @@
+"""
+Coût des opérations de stockage en fonction de la taille des fichiers de données.
+
+Pour chaque taille (nombre d'utilisateurs), génère points.json, purchases.json,
+invites.json, daily.json et quests_progress.json via les fonctions de sauvegarde de
+main.py, puis mesure :
+  add_points, increment_purchase, _add_invite_for, la mise à jour d'état de /daily,
+  _full_leaderboard et la progression de quêtes dans on_message.
+
+Chaque taille tourne dans un sous-processus (import propre, RSS max par taille).
+Le rapport est du JSON (un objet par taille et par opération) :
+
+    python bench/storage_scaling.py --sizes 1000,10000 --repeat 5 --out bench_output.txt
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _fakes import FakeChannel, FakeGuild, FakeMember, FakeMessage, load_bot  # noqa: E402
+
+GUILD_ID = 1_000_000
+BASE_UID = 100_000_000_000_000_000
+DEFAULT_SIZES = "1000,10000,100000,1000000"
+
+
+class LazyGuild(FakeGuild):
+    """Tous les utilisateurs générés sont membres, sans en matérialiser un million à l'avance."""
+    def get_member(self, user_id: int):
+        return FakeMember(user_id, self)
+
+
+def generate(main, n_users: int, rng: random.Random) -> dict:
+    """Écrit les fichiers de données pour n_users via les _save_* de main.py ; renvoie leurs tailles."""
+    now_ts = int(time.time())
+    uids = [str(BASE_UID + i) for i in range(n_users)]
+    shop_keys = list(main._load_shop().keys()) or ["ticket1"]
+    qcfg = main._load_quests()
+    daily_keys = list(qcfg.get("daily", {}).keys())
+    weekly_keys = list(qcfg.get("weekly", {}).keys())
+    lifetime_keys = list(qcfg.get("lifetime", {}).keys())
+    date_key, week_key = main._today_str(), main._week_str()
+
+    main._save_points({uid: rng.randint(0, 50_000) for uid in uids})
+    main._save_purchases({uid: {rng.choice(shop_keys): rng.randint(1, 5)}
+                          for uid in uids[: max(1, n_users // 5)]})
+    refs = {str(BASE_UID + n_users + i): int(rng.choice(uids)) for i in range(n_users // 2)}
+    counts: dict[str, int] = {}
+    for inviter in refs.values():
+        counts[str(inviter)] = counts.get(str(inviter), 0) + 1
+    main._save_invites({"counts": counts, "refs": refs})
+    main._save_daily({uid: {"last": now_ts - rng.randint(0, 200_000), "streak": rng.randint(0, 4), "warned": False}
+                      for uid in uids})
+
+    def slots(keys: list[str], k: int) -> dict:
+        picked = rng.sample(keys, min(k, len(keys)))
+        d = {q: {"progress": rng.randint(0, 20), "claimed": 0} for q in picked}
+        d["__assigned"] = picked
+        return d
+
+    g = str(GUILD_ID)
+    main._save_quests_progress({
+        "daily": {date_key: {g: {uid: slots(daily_keys, 3) for uid in uids}}},
+        "weekly": {week_key: {g: {uid: slots(weekly_keys, 3) for uid in uids}}},
+        "lifetime": {main.LIFETIME_PERIOD_KEY: {g: {
+            uid: {q: {"progress": rng.randint(0, 100), "claimed": 0} for q in lifetime_keys} for uid in uids}}},
+    })
+    paths = {
+        "points": main.POINTS_DB_PATH, "purchases": main.PURCHASES_DB_PATH, "invites": main.INVITES_DB_PATH,
+        "daily": main.DAILY_DB_PATH, "quests_progress": main.QUESTS_PROGRESS_DB_PATH,
+    }
+    return {name: os.path.getsize(p) for name, p in paths.items() if os.path.exists(p)}
+
+
+def build_ops(main, n_users: int, rng: random.Random) -> dict:
+    guild = LazyGuild(GUILD_ID)
+    channel = FakeChannel(2_000_001)
+    shop_key = next(iter(main._load_shop()), "ticket1")
+    counter = iter(range(10**9))
+
+    def uid() -> int:
+        return BASE_UID + rng.randrange(n_users)
+
+    async def add_points():
+        await main.add_points(uid(), 5)
+
+    async def increment_purchase():
+        await main.increment_purchase(uid(), shop_key)
+
+    async def add_invite():
+        await main._add_invite_for(uid(), BASE_UID + 10 * n_users + next(counter))
+
+    async def daily_state_update():
+        # Même séquence que daily_cmd autour de _daily_lock (sans l'interaction Discord)
+        user = str(uid())
+        now_ts = int(datetime.now(timezone.utc).timestamp())
+        async with main._daily_lock:
+            daily = dict(main._load_daily())
+            state = daily.get(user, {"last": 0, "streak": 0})
+            streak = min(int(state.get("streak", 0)) + 1, main.STREAK_MAX)
+            daily[user] = {"last": now_ts, "streak": streak, "warned": False}
+            main._save_daily(daily)
+
+    async def full_leaderboard():
+        await main._full_leaderboard(guild)
+
+    async def on_message_progress():
+        author = FakeMember(uid(), guild)
+        await main.on_message(FakeMessage(next(counter), author, channel, "salut"))
+
+    return {
+        "add_points": add_points,
+        "increment_purchase": increment_purchase,
+        "_add_invite_for": add_invite,
+        "daily_state_update": daily_state_update,
+        "_full_leaderboard": full_leaderboard,
+        "on_message_progress": on_message_progress,
+    }
+
+
+async def measure(fn, repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        await fn()
+        timings.append(time.perf_counter() - t0)
+    # passe séparée sous tracemalloc : le traçage fausserait les temps
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    await fn()
+    _cur, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "median_ms": round(statistics.median(timings) * 1000, 3),
+        "min_ms": round(min(timings) * 1000, 3),
+        "max_ms": round(max(timings) * 1000, 3),
+        "peak_alloc_bytes": peak,
+    }
+
+
+def worker(n_users: int, repeat: int, seed: int, only: list[str] | None) -> list[dict]:
+    data_dir = tempfile.mkdtemp(prefix="bench_storage_")
+    try:
+        main = load_bot(data_dir)
+        rng = random.Random(seed)
+        t0 = time.perf_counter()
+        file_sizes = generate(main, n_users, rng)
+        gen_s = time.perf_counter() - t0
+        ops = build_ops(main, n_users, rng)
+        rows = []
+
+        async def run_all():
+            for name, fn in ops.items():
+                if only and name not in only:
+                    continue
+                res = await measure(fn, repeat)
+                rows.append({
+                    "users": n_users, "op": name, "repeat": repeat, **res,
+                    "rss_high_water_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                    "generate_s": round(gen_s, 2), "file_bytes": file_sizes,
+                })
+
+        asyncio.run(run_all())
+        return rows
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def main_cli(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", default=DEFAULT_SIZES, help=f"tailles séparées par des virgules (défaut {DEFAULT_SIZES})")
+    ap.add_argument("--repeat", type=int, default=3, help="répétitions par opération")
+    ap.add_argument("--ops", default="", help="sous-ensemble d'opérations (virgules)")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--out", default="-", help="fichier de sortie JSON (défaut stdout)")
+    ap.add_argument("--_worker", type=int, help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+    only = [o for o in args.ops.split(",") if o] or None
+
+    if args._worker is not None:
+        json.dump(worker(args._worker, args.repeat, args.seed, only), sys.stdout)
+        return
+
+    results = []
+    for size in (int(s) for s in args.sizes.split(",") if s):
+        cmd = [sys.executable, os.path.abspath(__file__), "--_worker", str(size),
+               "--repeat", str(args.repeat), "--seed", str(args.seed), "--ops", args.ops]
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(proc.stderr, file=sys.stderr)
+            results.append({"users": size, "error": proc.stderr.strip().splitlines()[-1:]})
+            continue
+        rows = json.loads(proc.stdout)
+        for r in rows:
+            print(f"{r['users']:>9} {r['op']:<22} median {r['median_ms']:>10.2f} ms  "
+                  f"peak {r['peak_alloc_bytes']/1e6:>8.1f} Mo", file=sys.stderr)
+        results.extend(rows)
+
+    report = {"generated_at": datetime.now(timezone.utc).isoformat(), "python": sys.version.split()[0],
+              "results": results}
+    if args.out == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,538 @@
+"""
+Outils hors ligne sur les données du bot (mêmes chemins que main.py : .env / variables d'environnement).
+
+    python datatool.py export points --top 100 --out top100.csv
+    python datatool.py export purchases --format ndjson --since 2025-01-01 > achats.ndjson
+    python datatool.py export tickets --ids membres.txt --out tickets.csv
+    python datatool.py fsck            # vérifie tous les fichiers (code retour 1 si problème)
+    python datatool.py fsck --fix      # corrige ce qui peut l'être
+    python datatool.py prune --keep-days 2 --keep-weeks 2
+    python datatool.py compact         # compaction du journal des points + réécriture (encodage configuré)
+    python datatool.py convert quests_progress --to msgpack
+    python datatool.py pretty points | less
+    python datatool.py stats
+    python datatool.py migrate         # migrations de format (aussi faites au démarrage du bot)
+
+Les lignes d'export sont écrites au fil de l'eau (mémoire bornée par les fichiers source).
+Les commandes qui écrivent prennent les verrous de main.py : à lancer bot arrêté, ou avec
+DATA_SHARED_LOCKS=1 des deux côtés (les verrous fichier sérialisent alors avec le bot).
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+
+def load_main(check_schema: bool = True):
+    """
+    Importe main.py sans démarrer le bot (le token n'est pas nécessaire hors ligne).
+    Les chargeurs lisent le format courant : sur des fichiers pas encore migrés, on refuse
+    de travailler (sauf pour `migrate` lui-même) plutôt que de produire des résultats faux.
+    """
+    os.environ.setdefault("DISCORD_TOKEN", "offline")
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import main  # noqa: E402  (import tardif : lit .env et les variables ci-dessus)
+    global _main
+    _main = main
+    if check_schema:
+        pending = main._pending_migrations()
+        if pending:
+            raise SystemExit(f"fichiers à migrer ({', '.join(pending)}) : lancer d'abord `python datatool.py migrate`")
+    return main
+
+
+def _read_ids(path: str) -> set[str]:
+    with open(path, "r", encoding="utf-8") as f:
+        return {line.strip().strip("<@!>") for line in f if line.strip()}
+
+
+def cmd_export(main, args) -> int:
+    since_ts = None
+    if args.since:
+        since_ts = int(datetime.strptime(args.since, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp())
+    user_ids = _read_ids(args.ids) if args.ids else None
+    src = main._export_source(args.table)
+    rows = main._export_rows(args.table, src, args.top, user_ids, since_ts)
+    if args.out == "-":
+        n = main._write_export(sys.stdout, args.table, rows, args.format)
+    else:
+        with open(args.out, "w", encoding="utf-8", newline="") as f:
+            n = main._write_export(f, args.table, rows, args.format)
+    print(f"{n} ligne(s) exportée(s)", file=sys.stderr)
+    return 0
+
+
+# Fichiers gérés (chemins : main.DATA_STORE_PATHS) → verrou dans main.py
+STORES = {
+    "points":          "_points_lock",
+    "shop":            "_shop_lock",
+    "purchases":       "_purchases_lock",
+    "invites":         "_invites_lock",
+    "invites_rewards": "_invite_rewards_lock",
+    "daily":           "_daily_lock",
+    "tickets":         "_tickets_lock",
+    "avent":           "_avent_lock",
+    "quests":          "_quests_lock",
+    "quests_progress": "_quests_progress_lock",
+    "activity":        "_activity_lock",
+}
+_main = None  # main.py importé (load_main)
+
+
+def _path(main, store: str) -> str:
+    return main.DATA_STORE_PATHS[store]
+
+
+def _lock(main, store: str):
+    return getattr(main, STORES[store])
+
+
+def _read_json(path: str):
+    """Contenu d'un fichier de données, quel que soit son encodage (JSON ou msgpack)."""
+    return _main._read_data(path)
+
+
+def _is_int(v) -> bool:
+    return isinstance(v, int) and not isinstance(v, bool)
+
+
+# ---------- fsck ----------
+# Chaque vérification lit le fichier une fois, renvoie ses problèmes et, si fix, réécrit sous verrou.
+
+async def _fsck_points(main, fix: bool) -> list[str]:
+    issues = []
+    raw = _read_json(main.POINTS_DB_PATH)
+    bad = [k for k, v in raw.items() if not _is_int(v) or not str(k).isdigit()]
+    if bad:
+        issues.append(f"{len(bad)} entrée(s) non entières dans l'instantané (ex: {bad[0]!r})")
+    async with main._points_lock:
+        main._points_ledger.refresh()
+        negative = {uid: bal for uid, bal in main._points_ledger.balances.items() if bal < 0}
+        if negative:
+            issues.append(f"{len(negative)} solde(s) négatif(s) (ex: {next(iter(negative))} = {min(negative.values())})")
+            if fix:
+                main._points_ledger.apply_many([(uid, 0, "admin.fsck", None) for uid in negative])
+        if bad and fix:
+            main._points_ledger.replace_all(
+                {str(k): max(0, int(v)) for k, v in main._points_ledger.balances.items() if str(k).isdigit()})
+    try:
+        with open(main.POINTS_LEDGER_PATH, "rb") as f:
+            tail = f.read()
+        if tail and not tail.endswith(b"\n"):
+            issues.append("dernière ligne du journal incomplète (coupée à la prochaine écriture)")
+    except FileNotFoundError:
+        pass
+    return issues
+
+
+async def _fsck_shop(main, fix: bool) -> list[str]:
+    issues = []
+    raw = _read_json(main.SHOP_DB_PATH)
+    for key, it in raw.items():
+        if not isinstance(it, dict):
+            issues.append(f"item `{key}` n'est pas un objet")
+            continue
+        try:
+            if int(it.get("cost", 0)) < 1:
+                issues.append(f"item `{key}` : coût < 1")
+            int(it.get("role_id") or 0); int(it.get("max_per_user", -1))
+        except (TypeError, ValueError):
+            issues.append(f"item `{key}` : champ numérique invalide")
+    if issues and fix:
+        async with main._shop_lock:
+            good = {k: it for k, it in raw.items() if isinstance(it, dict)}
+            shop = {}
+            for k, it in good.items():
+                try:
+                    shop[k] = main._normalize_shop({k: it})[k]
+                except (TypeError, ValueError):
+                    continue
+                shop[k]["cost"] = max(1, shop[k]["cost"])
+            main._save_shop(shop)
+    return issues
+
+
+async def _fsck_purchases(main, fix: bool) -> list[str]:
+    issues = []
+    raw = _read_json(main.PURCHASES_DB_PATH)
+    shop = _read_json(main.SHOP_DB_PATH) if os.path.exists(main.SHOP_DB_PATH) else {}
+    bad = sum(1 for items in raw.values() for v in items.values() if not _is_int(v) or v <= 0)
+    empty = sum(1 for items in raw.values() if not items)
+    unknown = Counter(k for items in raw.values() for k in items if k not in shop)
+    if bad:
+        issues.append(f"{bad} compteur(s) d'achat nul(s), négatif(s) ou non entier(s)")
+    if empty:
+        issues.append(f"{empty} utilisateur(s) sans achat")
+    if unknown:
+        # informatif : un item retiré de la boutique garde son historique
+        print(f"  (info) achats d'items absents de la boutique : {dict(unknown.most_common(5))}")
+    if (bad or empty) and fix:
+        async with main._purchases_lock:
+            p = main._migrate_purchases_v1(_read_json(main.PURCHASES_DB_PATH))
+            cleaned = {}
+            for uid, items in p.items():
+                items = {k: v for k, v in items.items() if v > 0}
+                if items:
+                    cleaned[uid] = items
+            main._save_purchases(cleaned)
+    return issues
+
+
+async def _fsck_invites(main, fix: bool) -> list[str]:
+    issues = []
+    raw = _read_json(main.INVITES_DB_PATH)
+    if not isinstance(raw.get("counts"), dict) or not isinstance(raw.get("refs"), dict):
+        issues.append("clés `counts` / `refs` manquantes")
+    db = main._migrate_invites_v1(raw)
+    expected = Counter(str(i) for i in db["refs"].values())
+    wrong = {uid for uid in set(db["counts"]) | set(expected)
+             if int(db["counts"].get(uid, 0)) != expected.get(uid, 0)}
+    if wrong:
+        uid = next(iter(wrong))
+        issues.append(f"{len(wrong)} total(aux) `counts` en désaccord avec `refs` "
+                      f"(ex: {uid} : {db['counts'].get(uid, 0)} au lieu de {expected.get(uid, 0)})")
+    if issues and fix:
+        async with main._invites_lock:
+            db = main._migrate_invites_v1(_read_json(main.INVITES_DB_PATH))
+            db["counts"] = dict(Counter(str(i) for i in db["refs"].values()))
+            main._save_invites(db)
+    return issues
+
+
+async def _fsck_daily(main, fix: bool) -> list[str]:
+    issues = []
+    raw = _read_json(main.DAILY_DB_PATH)
+    legacy = sum(1 for v in raw.values() if not isinstance(v, dict))
+    horizon = datetime.now(timezone.utc).timestamp() + 3600
+    data = main._migrate_daily_v1(raw)
+    bad_streak = sum(1 for st in data.values() if not 0 <= st["streak"] <= main.STREAK_MAX)
+    future = sum(1 for st in data.values() if st["last"] > horizon)
+    if legacy:
+        issues.append(f"{legacy} entrée(s) à l'ancien format (timestamp seul)")
+    if bad_streak:
+        issues.append(f"{bad_streak} streak(s) hors de [0, {main.STREAK_MAX}]")
+    if future:
+        issues.append(f"{future} dernier(s) /daily dans le futur")
+    if issues and fix:
+        async with main._daily_lock:
+            data = main._migrate_daily_v1(_read_json(main.DAILY_DB_PATH))  # normalise l'ancien format
+            for st in data.values():
+                st["streak"] = min(max(0, st["streak"]), main.STREAK_MAX)
+                if st["last"] > horizon:
+                    st["last"] = 0
+            main._save_daily(data)
+    return issues
+
+
+async def _fsck_tickets(main, fix: bool) -> list[str]:
+    raw = _read_json(main.TICKETS_DB_PATH)
+    bad = [k for k, v in raw.items() if not _is_int(v) or v < 0]
+    if not bad:
+        return []
+    if fix:
+        async with main._tickets_lock:
+            data = _read_json(main.TICKETS_DB_PATH)
+            main._save_tickets({str(k): int(v) for k, v in data.items() if _is_int(v) and v > 0})
+    return [f"{len(bad)} compteur(s) de tickets négatif(s) ou non entier(s)"]
+
+
+async def _fsck_avent(main, fix: bool) -> list[str]:
+    issues = []
+    raw = _read_json(main.AVENT_DB_PATH)
+    masks = [m for years in raw.values() for m in years.values()]
+    legacy = sum(1 for m in masks if isinstance(m, list))
+    bad = sum(1 for m in masks if _is_int(m) and not 0 <= m < 1 << 24)
+    if legacy:
+        issues.append(f"{legacy} année(s) à l'ancien format (liste de jours)")
+    if bad:
+        issues.append(f"{bad} masque(s) hors 24 bits")
+    if issues and fix:
+        async with main._avent_lock:
+            store = main._avent_store
+            store.masks = main._migrate_avent_v1(_read_json(main.AVENT_DB_PATH))  # convertit les listes
+            for years in store.masks.values():
+                for y in years:
+                    years[y] &= (1 << 24) - 1
+            store.flush()
+    return issues
+
+
+async def _fsck_quests(main, fix: bool) -> list[str]:
+    qcfg = _read_json(main.QUESTS_DB_PATH)
+    issues = []
+    for bucket in ("daily", "weekly", "lifetime"):
+        for key, q in qcfg.get(bucket, {}).items():
+            qtype = q.get("type")
+            if qtype not in main._QUEST_TYPES and qtype != "manual_actor":
+                issues.append(f"quête {bucket}/{key} : type inconnu {qtype!r}")
+            if not _is_int(q.get("target", 1)) or q.get("target", 1) < 1:
+                issues.append(f"quête {bucket}/{key} : target invalide")
+    return issues  # catalogue édité à la main : signalé, jamais corrigé automatiquement
+
+
+async def _fsck_quests_progress(main, fix: bool) -> list[str]:
+    raw = _read_json(main.QUESTS_PROGRESS_DB_PATH)
+    issues = []
+    if not any(b in raw for b in ("daily", "weekly", "lifetime")):
+        issues.append("ancien format « plat » (sans daily/weekly/lifetime)")
+        if fix:
+            async with main._quests_progress_lock:
+                main._save_quests_progress(main._migrate_quests_progress_v1(_read_json(main.QUESTS_PROGRESS_DB_PATH)))
+    expired = sum(len(v) for v in _expired_periods(main, raw, 2, 2).values())
+    if expired:
+        print(f"  (info) {expired} période(s) expirée(s) : `datatool.py prune` pour les retirer")
+    return issues
+
+
+async def _fsck_activity(main, fix: bool) -> list[str]:
+    raw = main._load_activity()  # instantané + journal
+    over = sum(1 for users in raw.values() for ua in users.values()
+               if len(ua.get("days", {})) > main.ACTIVITY_KEEP_DAYS)
+    return [f"{over} utilisateur(s) avec plus de {main.ACTIVITY_KEEP_DAYS} jours de compteurs "
+            "(`datatool.py prune`)"] if over else []
+
+
+FSCK_CHECKS = {
+    "points": _fsck_points,
+    "shop": _fsck_shop,
+    "purchases": _fsck_purchases,
+    "invites": _fsck_invites,
+    "daily": _fsck_daily,
+    "tickets": _fsck_tickets,
+    "avent": _fsck_avent,
+    "quests": _fsck_quests,
+    "quests_progress": _fsck_quests_progress,
+    "activity": _fsck_activity,
+}
+
+
+def cmd_fsck(main, args) -> int:
+    async def run() -> int:
+        problems = 0
+        for store, check in FSCK_CHECKS.items():
+            path = _path(main, store)
+            if not os.path.exists(path):
+                print(f"{store}: absent ({path})")
+                continue
+            try:
+                issues = await check(main, args.fix)
+            except json.JSONDecodeError as e:
+                issues = [f"JSON illisible : {e}"]
+            except Exception as e:
+                issues = [f"structure inattendue : {e!r}"]
+            problems += len(issues)
+            print(f"{store}: " + ("ok" if not issues else f"{len(issues)} problème(s)"))
+            for msg in issues:
+                print(f"  - {msg}")
+        if problems:
+            print(f"{problems} problème(s)" + (" (corrections appliquées)" if args.fix else " ; --fix pour corriger"))
+        return 1 if problems and not args.fix else 0
+    return asyncio.run(run())
+
+
+# ---------- migrate ----------
+
+def cmd_migrate(main, args) -> int:
+    applied = main._migrate_data()
+    print("\n".join(applied) if applied else "déjà à jour")
+    for store, version in sorted(main._load_schema().items()):
+        print(f"  {store:<16} v{version}")
+    return 0
+
+
+# ---------- prune ----------
+
+def _positive_int(text: str) -> int:
+    """Type argparse : entier >= 1 (la période en cours est toujours conservée)."""
+    try:
+        n = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"entier attendu : {text!r}")
+    if n < 1:
+        raise argparse.ArgumentTypeError(f"doit valoir au moins 1 (période en cours) : {n}")
+    return n
+
+
+def _expired_periods(main, pdb: dict, keep_days: int, keep_weeks: int) -> dict[str, list[str]]:
+    """Périodes plus anciennes que les keep_* dernières ; la période en cours n'en fait jamais partie."""
+    keep_days, keep_weeks = max(1, keep_days), max(1, keep_weeks)
+    today = datetime.now(timezone.utc).date()
+    oldest_day = (today - timedelta(days=keep_days - 1)).isoformat()
+    weeks = set()
+    for n in range(keep_weeks):
+        y, w, _d = (today - timedelta(weeks=n)).isocalendar()
+        weeks.add(f"{y}-W{w:02d}")
+    current_day, current_week = main._today_str(), main._week_str()
+    return {
+        "daily": [k for k in pdb.get("daily", {}) if k < oldest_day and k != current_day],
+        "weekly": [k for k in pdb.get("weekly", {})
+                   if k not in weeks and k < max(weeks) and k != current_week],
+    }
+
+
+def cmd_prune(main, args) -> int:
+    async def run():
+        async with main._quests_progress_lock:
+            pdb = main._load_quests_progress()
+            expired = _expired_periods(main, pdb, args.keep_days, args.keep_weeks)
+            for bucket, keys in expired.items():
+                for k in keys:
+                    del pdb[bucket][k]
+            n_periods = sum(len(v) for v in expired.values())
+            if n_periods:
+                main._save_quests_progress(pdb)
+        async with main._activity_lock:
+            adb = main._load_activity()
+            n_days = 0
+            for users in adb.values():
+                for ua in users.values():
+                    days = ua.get("days", {})
+                    for old in sorted(days)[:-main.ACTIVITY_KEEP_DAYS]:
+                        del days[old]
+                        n_days += 1
+            if n_days:
+                main._save_activity(adb)
+        print(f"quests_progress : {n_periods} période(s) retirée(s) "
+              f"({', '.join(k for v in expired.values() for k in v) or '—'})")
+        print(f"activity : {n_days} jour(s) de compteurs retiré(s)")
+    asyncio.run(run())
+    return 0
+
+
+# ---------- compact / convert / pretty ----------
+
+def cmd_compact(main, args) -> int:
+    """Compaction du journal des points, puis réécriture de chaque fichier dans son encodage configuré."""
+    async def run():
+        async with main._points_lock:
+            done = await main._points_ledger.compact()
+        print("journal des points : " + ("compacté" if done else "rien à compacter"))
+        async with main._activity_lock:
+            done = await main._activity_log.compact()
+        print("journal d'activité : " + ("compacté" if done else "rien à compacter"))
+        for store in STORES:
+            path = _path(main, store)
+            if not os.path.exists(path):
+                continue
+            async with _lock(main, store):
+                before = os.path.getsize(path)
+                main._atomic_write(path, main._read_data(path))
+            print(f"{store}: {before:,} → {os.path.getsize(path):,} o "
+                  f"({main._PATH_ENCODINGS.get(path, main.DATA_ENCODING)})")
+    asyncio.run(run())
+    return 0
+
+
+def cmd_convert(main, args) -> int:
+    """
+    Réécrit dans un encodage donné. Le bot relit tous les formats, mais réécrira ensuite dans
+    l'encodage configuré : pour un changement durable, régler aussi DATA_ENCODINGS.
+    """
+    if args.to == "msgpack" and main.msgpack is None:
+        print("le module msgpack n'est pas installé (pip install msgpack)", file=sys.stderr)
+        return 1
+
+    async def run():
+        stores = list(STORES) if args.store == "all" else [args.store]
+        for store in stores:
+            path = _path(main, store)
+            if not os.path.exists(path):
+                continue
+            async with _lock(main, store):
+                before = os.path.getsize(path)
+                main._atomic_write(path, main._read_data(path), encoding=args.to)
+            print(f"{store}: {before:,} → {os.path.getsize(path):,} o ({args.to})")
+    asyncio.run(run())
+    return 0
+
+
+def cmd_pretty(main, args) -> int:
+    """Affiche un fichier (JSON ou msgpack) en JSON indenté, pour lecture humaine."""
+    data = _read_json(_path(main, args.store))
+    json.dump(data, sys.stdout, ensure_ascii=False, indent=2)
+    print()
+    return 0
+
+
+# ---------- stats ----------
+
+def cmd_stats(main, args) -> int:
+    for store in STORES:
+        path = _path(main, store)
+        if not os.path.exists(path):
+            print(f"{store:<16} absent")
+            continue
+        data = _read_json(path)
+        if store == "invites":
+            detail = f"{len(data.get('counts', {}))} parrains, {len(data.get('refs', {}))} filleuls"
+        elif store == "invites_rewards":
+            detail = f"{len(data.get('rewarded', {}))} récompenses"
+        elif store == "quests":
+            detail = ", ".join(f"{b}={len(data.get(b, {}))}" for b in ("daily", "weekly", "lifetime"))
+        elif store == "quests_progress":
+            detail = ", ".join(f"{b}: {len(data.get(b, {}))} période(s)" for b in ("daily", "weekly", "lifetime"))
+        elif store == "activity":
+            detail = f"{sum(len(u) for u in data.values())} utilisateurs sur {len(data)} serveur(s)"
+        elif store in ("points", "tickets"):
+            detail = f"{len(data)} utilisateurs, total {sum(int(v) for v in data.values()):,}"
+        else:
+            detail = f"{len(data)} entrées"
+        print(f"{store:<16} {os.path.getsize(path):>14,} o  {detail}")
+    segments = main._ledger_segments(main.POINTS_LEDGER_PATH)
+    live = os.path.getsize(main.POINTS_LEDGER_PATH) if os.path.exists(main.POINTS_LEDGER_PATH) else 0
+    archived = sum(os.path.getsize(p) for p in segments)
+    print(f"{'points.ledger':<16} {live:>14,} o  courant ; {len(segments)} segment(s) archivé(s), {archived:,} o")
+    journal = os.path.getsize(main.ACTIVITY_LOG_PATH) if os.path.exists(main.ACTIVITY_LOG_PATH) else 0
+    print(f"{'activity.journal':<16} {journal:>14,} o  (repris dans activity.json à la compaction)")
+    return 0
+
+
+def main_cli(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    ex = sub.add_parser("export", help="exporter une table en CSV / NDJSON")
+    ex.add_argument("table", choices=["points", "purchases", "invites", "tickets", "streaks"])
+    ex.add_argument("--format", choices=["csv", "ndjson"], default="csv")
+    ex.add_argument("--top", type=int, help="seulement les N premiers (par solde / total)")
+    ex.add_argument("--ids", help="fichier d'identifiants (un par ligne) à conserver")
+    ex.add_argument("--since", help="seulement les membres actifs depuis AAAA-MM-JJ (UTC)")
+    ex.add_argument("--out", default="-", help="fichier de sortie (défaut stdout)")
+    ex.set_defaults(fn=cmd_export)
+
+    fs = sub.add_parser("fsck", help="vérifier la structure et la cohérence des fichiers")
+    fs.add_argument("--fix", action="store_true", help="corriger ce qui peut l'être")
+    fs.set_defaults(fn=cmd_fsck)
+
+    pr = sub.add_parser("prune", help="retirer les périodes de quêtes expirées et les vieux compteurs")
+    pr.add_argument("--keep-days", type=_positive_int, default=2, help="périodes daily conservées, >= 1 (défaut 2)")
+    pr.add_argument("--keep-weeks", type=_positive_int, default=2, help="périodes weekly conservées, >= 1 (défaut 2)")
+    pr.set_defaults(fn=cmd_prune)
+
+    co = sub.add_parser("compact", help="compacter le journal des points et réécrire les fichiers (encodage configuré)")
+    co.set_defaults(fn=cmd_compact)
+
+    cv = sub.add_parser("convert", help="réécrire un fichier (ou all) dans un encodage donné")
+    cv.add_argument("store", choices=[*STORES, "all"])
+    cv.add_argument("--to", required=True, choices=["compact", "pretty", "orjson", "msgpack"])
+    cv.set_defaults(fn=cmd_convert)
+
+    pp = sub.add_parser("pretty", help="afficher un fichier en JSON indenté")
+    pp.add_argument("store", choices=list(STORES))
+    pp.set_defaults(fn=cmd_pretty)
+
+    st = sub.add_parser("stats", help="tailles et cardinalités")
+    st.set_defaults(fn=cmd_stats)
+
+    mi = sub.add_parser("migrate", help="convertir les anciens formats et noter les versions (schema.json)")
+    mi.set_defaults(fn=cmd_migrate)
+
+    args = ap.parse_args(argv)
+    return args.fn(load_main(check_schema=args.cmd != "migrate"), args)
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -1,12 +1,26 @@
-import asyncio, json, logging, os, tempfile, random
+import asyncio, csv, glob, heapq, io, json, logging, os, sys, tempfile, threading, time, traceback, random
+from array import array
+from collections import deque
 from zoneinfo import ZoneInfo
-from typing import Dict, Tuple, List, Optional
+from typing import Callable, Dict, Tuple, List, Optional
 import discord
 from discord import Intents, app_commands
 from discord.ext import commands
 from discord.ui import View, Select
 from dotenv import load_dotenv
 from datetime import datetime, timezone, timedelta
+try:
+    import fcntl  # verrous inter-processus (optionnel, POSIX)
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+try:
+    import orjson  # encodeur JSON rapide (optionnel, DATA_ENCODING=orjson)
+except ImportError:
+    orjson = None
+try:
+    import msgpack  # format binaire (optionnel, DATA_ENCODING=msgpack)
+except ImportError:
+    msgpack = None
 
 if not logging.getLogger().handlers: 
     logging.basicConfig(
@@ -35,8 +49,47 @@ DAILY_DB_PATH = os.getenv("DAILY_DB_PATH", "data/daily.json")
 INVITE_REWARDS_DB_PATH = os.getenv("INVITE_REWARDS_DB_PATH", "data/invites_rewards.json")
 QUESTS_DB_PATH = os.getenv("QUESTS_DB_PATH", "data/quests.json")            
 QUESTS_PROGRESS_DB_PATH = os.getenv("QUESTS_PROGRESS_DB_PATH", "data/quests_progress.json")
+# Compteurs d'activité par jour (messages, vocal, invites...) dont dérive la progression des quêtes
+ACTIVITY_DB_PATH = os.getenv("ACTIVITY_DB_PATH", "data/activity.json")
+ACTIVITY_KEEP_DAYS = 14  # jours conservés par utilisateur (une semaine ISO + marge)
+# Les compteurs vivent en mémoire ; leurs changements sont ajoutés à ce journal par lots
+ACTIVITY_LOG_PATH = os.getenv("ACTIVITY_LOG_PATH", os.path.splitext(ACTIVITY_DB_PATH)[0] + ".journal.jsonl")
+ACTIVITY_FLUSH_INTERVAL = float(os.getenv("ACTIVITY_FLUSH_INTERVAL", "2"))
+ACTIVITY_COMPACT_BYTES = int(os.getenv("ACTIVITY_COMPACT_BYTES", str(4 * 1024 * 1024)))
 AVENT_DB_PATH = os.getenv("AVENT_DB_PATH", "data/avent.json")
 TICKETS_DB_PATH = os.getenv("TICKETS_DB_PATH", "data/tickets.json")
+# Journal des mouvements de points (append-only) ; points.json n'est plus que l'instantané compacté
+POINTS_LEDGER_PATH = os.getenv("POINTS_LEDGER_PATH", os.path.splitext(POINTS_DB_PATH)[0] + ".ledger.jsonl")
+POINTS_LEDGER_COMPACT_BYTES = int(os.getenv("POINTS_LEDGER_COMPACT_BYTES", str(4 * 1024 * 1024)))
+POINTS_LEDGER_COMPACT_INTERVAL = int(os.getenv("POINTS_LEDGER_COMPACT_INTERVAL", "300"))
+# Version de format de chaque fichier, mise à jour par _migrate_data() au démarrage
+SCHEMA_PATH = os.getenv("SCHEMA_PATH", os.path.join(os.path.dirname(POINTS_DB_PATH) or ".", "schema.json"))
+
+# --- Encodage des fichiers de données ---
+# DATA_ENCODING : compact (défaut, JSON sans indentation) | pretty (indent=2) | orjson (JSON compact
+# via orjson, repli sur compact s'il manque) | msgpack (binaire, module requis).
+# DATA_ENCODINGS="quests_progress=msgpack,points=orjson" : réglage par fichier. shop.json et
+# quests.json restent en pretty par défaut (édités à la main). La lecture reconnaît le format tout
+# seul : changer d'encodage ne demande aucune conversion (datatool.py convert pour le faire d'avance).
+DATA_STORE_PATHS = {
+    "points": POINTS_DB_PATH, "shop": SHOP_DB_PATH, "purchases": PURCHASES_DB_PATH,
+    "invites": INVITES_DB_PATH, "invites_rewards": INVITE_REWARDS_DB_PATH, "daily": DAILY_DB_PATH,
+    "tickets": TICKETS_DB_PATH, "avent": AVENT_DB_PATH, "quests": QUESTS_DB_PATH,
+    "quests_progress": QUESTS_PROGRESS_DB_PATH, "activity": ACTIVITY_DB_PATH,
+}
+_DATA_ENCODINGS_ALLOWED = ("compact", "pretty", "orjson", "msgpack")
+DATA_ENCODING = os.getenv("DATA_ENCODING", "compact").strip().lower()
+_PATH_ENCODINGS: Dict[str, str] = {SHOP_DB_PATH: "pretty", QUESTS_DB_PATH: "pretty", SCHEMA_PATH: "pretty"}
+for _item in filter(None, (x.strip() for x in os.getenv("DATA_ENCODINGS", "").split(","))):
+    _store, _, _enc = _item.partition("=")
+    if _store.strip() not in DATA_STORE_PATHS:
+        raise RuntimeError(f"DATA_ENCODINGS : fichier inconnu {_store.strip()!r}")
+    _PATH_ENCODINGS[DATA_STORE_PATHS[_store.strip()]] = _enc.strip().lower()
+for _enc in {DATA_ENCODING, *_PATH_ENCODINGS.values()}:
+    if _enc not in _DATA_ENCODINGS_ALLOWED:
+        raise RuntimeError(f"Encodage inconnu {_enc!r} (choix : {', '.join(_DATA_ENCODINGS_ALLOWED)})")
+    if _enc == "msgpack" and msgpack is None:
+        raise RuntimeError("Encodage msgpack demandé mais le module msgpack n'est pas installé")
 
 
 LIFETIME_PERIOD_KEY = "permanent"
@@ -58,20 +111,171 @@ DAILY_FLAT_BONUS   = {BRONZE: 1, ARGENT: 2, OR: 4}
 SHOP_DISCOUNT      = {BRONZE: 0.05, ARGENT: 0.10, OR: 0.15}
 POINTS_BONUS_CAP   = 1.50  # sécurité : max +50%
 
+# --- Sharding (optionnel) ---
+# SHARD_COUNT > 0 active commands.AutoShardedBot ; SHARD_IDS="0,1" limite ce processus à ces shards.
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "0"))
+SHARD_IDS = [int(x) for x in os.getenv("SHARD_IDS", "").split(",") if x.strip()] or None
+
+# --- Watchdog boucle asyncio ---
+LOOP_STALL_THRESHOLD_MS = int(os.getenv("LOOP_STALL_THRESHOLD_MS", "500"))
+LOOP_STALL_TOP_N = int(os.getenv("LOOP_STALL_TOP_N", "10"))
+
+# --- Plusieurs processus sur le même dossier data/ ---
+# DATA_SHARED_LOCKS=1 : chaque verrou prend aussi un verrou fichier (flock) "<fichier>.lock",
+# pour que les cycles charger → modifier → sauver restent atomiques entre processus (shards, admin, web).
+DATA_SHARED_LOCKS = os.getenv("DATA_SHARED_LOCKS", "0").strip().lower() in ("1", "true", "yes", "on")
+if DATA_SHARED_LOCKS and fcntl is None:
+    raise RuntimeError("DATA_SHARED_LOCKS nécessite fcntl (Linux/macOS)")
+
 # --- Verrous (internes, pas dans .env) ---
-_points_lock = asyncio.Lock()
-_shop_lock = asyncio.Lock()
-_purchases_lock = asyncio.Lock()
-_invites_lock = asyncio.Lock()
-_daily_lock = asyncio.Lock()
-_invite_rewards_lock = asyncio.Lock()
-_quests_lock = asyncio.Lock()
-_quests_progress_lock = asyncio.Lock()
-_avent_lock = asyncio.Lock()
-_tickets_lock = asyncio.Lock()
+class _InstrumentedLock:
+    """
+    asyncio.Lock instrumenté : temps d'attente, temps de détention, profondeur de file
+    et site d'appel (fonction:ligne) du détenteur courant. S'utilise comme un asyncio.Lock.
+    Si `path` est donné et DATA_SHARED_LOCKS actif, un flock exclusif sur `path + ".lock"`
+    est pris après le verrou asyncio (l'attente est comptée dans le temps d'attente).
+    """
+    _SAMPLES = 512  # fenêtre glissante pour p50/p99
+
+    def __init__(self, name: str, path: str | None = None):
+        self.name = name
+        self._lock = asyncio.Lock()
+        self._lock_path = f"{path}.lock" if (path and DATA_SHARED_LOCKS) else None
+        self._fd: int | None = None
+        # état courant du verrou : jamais remis à zéro par reset()
+        self.waiting = 0            # file d'attente actuelle
+        self.holder_site: str | None = None
+        self._acquired_at = 0.0
+        self.reset()
+
+    def reset(self):
+        """Remet les statistiques à zéro (/lockstats reset), sans toucher à l'état courant."""
+        self.acquisitions = 0
+        self.contended = 0          # acquisitions qui ont dû attendre
+        self.max_waiting = self.waiting
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.wait_max_site: str | None = None
+        self.hold_total = 0.0
+        self.hold_max = 0.0
+        self.hold_max_site: str | None = None
+        self._waits: deque[float] = deque(maxlen=self._SAMPLES)
+        self._holds: deque[float] = deque(maxlen=self._SAMPLES)
+
+    @staticmethod
+    def _site(depth: int) -> str:
+        f = sys._getframe(depth)
+        return f"{f.f_code.co_name}:{f.f_lineno}"
+
+    def locked(self) -> bool:
+        return self._lock.locked()
+
+    async def acquire(self, _site: str | None = None) -> bool:
+        site = _site or self._site(2)
+        t0 = time.perf_counter()
+        if self._lock.locked():
+            self.contended += 1
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        try:
+            await self._lock.acquire()
+            if self._lock_path:
+                try:
+                    await self._acquire_file()
+                except BaseException:
+                    self._lock.release()
+                    raise
+        finally:
+            self.waiting -= 1
+        now = time.perf_counter()
+        waited = now - t0
+        self.acquisitions += 1
+        self.wait_total += waited
+        self._waits.append(waited)
+        if waited > self.wait_max:
+            self.wait_max, self.wait_max_site = waited, site
+        self.holder_site = site
+        self._acquired_at = now
+        return True
+
+    async def _acquire_file(self):
+        if self._fd is None:
+            os.makedirs(os.path.dirname(self._lock_path) or ".", exist_ok=True)
+            self._fd = os.open(self._lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        delay = 0.002
+        while True:
+            try:
+                fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return
+            except BlockingIOError:
+                # tenu par un autre processus : on rend la main à la boucle
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 0.05)
+
+    def release(self):
+        held = time.perf_counter() - self._acquired_at
+        self.hold_total += held
+        self._holds.append(held)
+        if held > self.hold_max:
+            self.hold_max, self.hold_max_site = held, self.holder_site
+        self.holder_site = None
+        if self._lock_path and self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._lock.release()
+
+    async def __aenter__(self):
+        await self.acquire(_site=self._site(2))
+        return None
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+
+    @staticmethod
+    def _pct(samples, q: float) -> float:
+        if not samples:
+            return 0.0
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def stats(self) -> dict:
+        n = max(1, self.acquisitions)
+        return {
+            "name": self.name,
+            "acquisitions": self.acquisitions,
+            "contended": self.contended,
+            "waiting": self.waiting,
+            "max_waiting": self.max_waiting,
+            "wait_avg_ms": self.wait_total / n * 1000,
+            "wait_p99_ms": self._pct(self._waits, 0.99) * 1000,
+            "wait_max_ms": self.wait_max * 1000,
+            "wait_max_site": self.wait_max_site,
+            "hold_avg_ms": self.hold_total / n * 1000,
+            "hold_p99_ms": self._pct(self._holds, 0.99) * 1000,
+            "hold_max_ms": self.hold_max * 1000,
+            "hold_max_site": self.hold_max_site,
+            "holder_site": self.holder_site,
+        }
+
+_points_lock = _InstrumentedLock("points", POINTS_DB_PATH)
+_shop_lock = _InstrumentedLock("shop", SHOP_DB_PATH)
+_purchases_lock = _InstrumentedLock("purchases", PURCHASES_DB_PATH)
+_invites_lock = _InstrumentedLock("invites", INVITES_DB_PATH)
+_daily_lock = _InstrumentedLock("daily", DAILY_DB_PATH)
+_invite_rewards_lock = _InstrumentedLock("invite_rewards", INVITE_REWARDS_DB_PATH)
+_quests_lock = _InstrumentedLock("quests", QUESTS_DB_PATH)
+_quests_progress_lock = _InstrumentedLock("quests_progress", QUESTS_PROGRESS_DB_PATH)
+_avent_lock = _InstrumentedLock("avent", AVENT_DB_PATH)
+_tickets_lock = _InstrumentedLock("tickets", TICKETS_DB_PATH)
+_activity_lock = _InstrumentedLock("activity", ACTIVITY_DB_PATH)
 
 _roulette_in_progress: set[int] = set()
-_roulette_sessions_lock = asyncio.Lock()
+_roulette_sessions_lock = _InstrumentedLock("roulette_sessions")
+
+_ALL_LOCKS: list[_InstrumentedLock] = [
+    _points_lock, _shop_lock, _purchases_lock, _invites_lock, _daily_lock,
+    _invite_rewards_lock, _quests_lock, _quests_progress_lock, _avent_lock,
+    _tickets_lock, _activity_lock, _roulette_sessions_lock,
+]
 
 _voice_sessions: dict[tuple[int, int], int] = {}
 # ---------- Intents & client ----------
@@ -81,11 +285,37 @@ intents.members = True
 intents.message_content = True   
 intents.voice_states = True  
 
-bot = commands.Bot(
-    command_prefix=commands.when_mentioned, 
-    intents=intents,
-    help_command=None
-)
+if SHARD_COUNT > 0:
+    bot = commands.AutoShardedBot(
+        command_prefix=commands.when_mentioned,
+        intents=intents,
+        help_command=None,
+        shard_count=SHARD_COUNT,
+        shard_ids=SHARD_IDS,
+    )
+else:
+    bot = commands.Bot(
+        command_prefix=commands.when_mentioned, 
+        intents=intents,
+        help_command=None
+    )
+
+_shards_ready: set[int] = set()
+
+def _owns_guild(guild_id: int) -> bool:
+    """Vrai si la guilde est servie par un shard de CE processus."""
+    return bot.get_guild(guild_id) is not None
+
+def _runs_global_tasks() -> bool:
+    """
+    Les tâches qui ne dépendent pas d'une guilde (ex: rappels de streak en MP) ne doivent
+    tourner que dans un seul processus : celui qui possède GUILD_ID, sinon celui du shard 0.
+    """
+    if SHARD_COUNT <= 0:
+        return True
+    if GUILD_ID:
+        return _owns_guild(GUILD_ID)
+    return SHARD_IDS is None or 0 in SHARD_IDS
 
 tree = bot.tree
 
@@ -229,28 +459,78 @@ async def _send_admin_log(
     except Exception:
         pass
 
+# ---------- Instantanés versionnés (lecture sans verrou) ----------
+class _Snapshot:
+    """
+    Dernière version publiée d'un fichier de données, partagée et immuable par convention
+    (même principe que _shop_catalog). Les lecteurs la prennent sans verrou ; un écrivain,
+    sous le verrou du fichier, construit la version suivante par copie sur écriture (on ne
+    copie que ce qui change) puis la publie. Une écriture d'un autre processus ou une
+    édition à la main est détectée à l'identité du fichier et relue une fois.
+    Les abonnés (subscribe) reçoivent les utilisateurs touchés par chaque nouvelle version,
+    ou None quand on ne sait pas lesquels (relecture, réécriture complète).
+    """
+    def __init__(self, path: str, ensure):
+        self.path = path
+        self._ensure = ensure
+        self._id: tuple | None = None
+        self.version = 0
+        self.data: dict = {}
+        self._listeners: list = []
+
+    def subscribe(self, fn) -> None:
+        self._listeners.append(fn)
+
+    def _notify(self, changed) -> None:
+        for fn in self._listeners:
+            fn(changed)
+
+    def get(self) -> tuple[int, dict]:
+        file_id = _PointsLedger._file_id(self.path)
+        if file_id is None:
+            self._ensure()
+            file_id = _PointsLedger._file_id(self.path)
+        if file_id != self._id:
+            self.data = _read_data(self.path)
+            self._id = file_id
+            self.version += 1
+            self._notify(None)
+        return self.version, self.data
+
+    def publish(self, data: dict, changed=None) -> None:
+        """Écrit `data` (qui ne doit plus être modifié ensuite) et en fait la version courante.
+        `changed` : ids des utilisateurs modifiés, si connus."""
+        _atomic_write(self.path, data)
+        self._id = _PointsLedger._file_id(self.path)
+        self.version += 1
+        self.data = data
+        self._notify(changed)
+
 # ---------- Points (JSON) ----------
 def _ensure_tickets_exists():
     if not os.path.exists(TICKETS_DB_PATH):
         with open(TICKETS_DB_PATH, "w", encoding="utf-8") as f:
             json.dump({}, f)
 
+_tickets_snapshot = _Snapshot(TICKETS_DB_PATH, _ensure_tickets_exists)
+
 def _load_tickets() -> Dict[str, int]:
-    _ensure_tickets_exists()
-    with open(TICKETS_DB_PATH, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    return {str(k): int(v) for k, v in data.items()}
+    """Version publiée { user_id(str): tickets } — lecture seule, copier (dict(...)) pour modifier."""
+    return _tickets_snapshot.get()[1]
+
+def _save_tickets(data: Dict[str, int], changed=None):
+    _tickets_snapshot.publish(data, changed)
 
-def _save_tickets(data: Dict[str, int]):
-    _atomic_write(TICKETS_DB_PATH, data)
+def get_tickets(user_id: int) -> int:
+    return int(_load_tickets().get(str(user_id), 0))
 
 async def add_tickets(user_id: int, amount: int) -> int:
     """Ajoute N tickets à un joueur."""
     async with _tickets_lock:
-        data = _load_tickets()
+        data = dict(_load_tickets())
         new_val = int(data.get(str(user_id), 0)) + amount
         data[str(user_id)] = new_val
-        _save_tickets(data)
+        _save_tickets(data, changed=(user_id,))
         return new_val
 
 def _ensure_points_exists():
@@ -258,34 +538,334 @@ def _ensure_points_exists():
         with open(POINTS_DB_PATH, "w", encoding="utf-8") as f:
             json.dump({}, f)
 
+class _PointsLedger:
+    """
+    Soldes = dernier instantané (points.json) + queue du journal (points.ledger.jsonl).
+    Chaque mouvement est une ligne JSON [ts, uid, delta, raison, ref, solde] ajoutée en O(1).
+    Le solde résultant est inclus : rejouer une ligne déjà couverte par l'instantané est sans
+    effet, ce qui rend la compaction sûre même interrompue. Écritures sous _points_lock.
+    """
+    def __init__(self, snapshot_path: str, ledger_path: str):
+        self.snapshot_path = snapshot_path
+        self.ledger_path = ledger_path
+        self.balances: Dict[str, int] | None = None
+        self.tail_entries = 0       # lignes depuis la dernière compaction
+        self._offset = 0            # octets du journal déjà appliqués
+        self._ledger_id: tuple | None = None
+        self._snapshot_id: tuple | None = None
+
+    @staticmethod
+    def _file_id(path: str) -> tuple | None:
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (st.st_dev, st.st_ino, st.st_mtime_ns)
+
+    def _load(self):
+        _ensure_points_exists()
+        self.balances = _read_data(self.snapshot_path)
+        self._snapshot_id = self._file_id(self.snapshot_path)
+        self._offset = 0
+        self._ledger_id = None
+        self.tail_entries = 0
+        self._read_tail()
+
+    def _read_tail(self):
+        try:
+            with open(self.ledger_path, "rb") as f:
+                st = os.fstat(f.fileno())
+                self._ledger_id = (st.st_dev, st.st_ino)
+                f.seek(self._offset)
+                chunk = f.read()
+        except FileNotFoundError:
+            self._ledger_id = None
+            return
+        end = chunk.rfind(b"\n") + 1  # une ligne incomplète (écriture en cours) attend le prochain passage
+        for line in chunk[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                _ts, uid, _delta, _reason, _ref, bal = json.loads(line)
+            except Exception:
+                logging.warning("Ligne illisible ignorée dans %s: %r", self.ledger_path, line[:120])
+                continue
+            self.balances[str(uid)] = int(bal)
+            self.tail_entries += 1
+        self._offset += end
+
+    def refresh(self):
+        """Charge au premier accès ; en mode multi-processus, intègre les écritures des autres."""
+        if self.balances is None:
+            self._load()
+            return
+        if not DATA_SHARED_LOCKS:
+            return
+        if self._file_id(self.snapshot_path) != self._snapshot_id:
+            self._load()  # compaction faite par un autre processus
+            return
+        try:
+            st = os.stat(self.ledger_path)
+        except FileNotFoundError:
+            if self._ledger_id is not None:
+                self._load()
+            return
+        if (st.st_dev, st.st_ino) != self._ledger_id or st.st_size < self._offset:
+            self._load()
+        elif st.st_size > self._offset:
+            self._read_tail()
+
+    def get(self, uid: str) -> int:
+        self.refresh()
+        return self.balances.get(uid, 0)
+
+    def apply_many(self, changes: list[tuple[str, int, str, str | None]]) -> list[int]:
+        """changes = [(uid, nouveau_solde, raison, ref)] → un seul append (+fsync) pour le lot."""
+        self.refresh()
+        now = int(time.time())
+        lines = []
+        after: Dict[str, int] = {}  # soldes appliqués en mémoire seulement une fois la ligne écrite
+        for uid, new_bal, reason, ref in changes:
+            old = after.get(uid, self.balances.get(uid, 0))
+            lines.append(json.dumps([now, int(uid), new_bal - old, reason, ref, new_bal],
+                                    ensure_ascii=False, separators=(",", ":")))
+            after[uid] = new_bal
+        payload = ("\n".join(lines) + "\n").encode("utf-8")
+        t0 = time.perf_counter()
+        os.makedirs(os.path.dirname(self.ledger_path) or ".", exist_ok=True)
+        with open(self.ledger_path, "ab") as f:
+            if os.fstat(f.fileno()).st_size > self._offset:
+                # Reste d'une écriture interrompue (crash) : on le coupe pour ne pas souder deux lignes
+                f.truncate(self._offset)
+            f.write(payload)
+            f.flush(); os.fsync(f.fileno())
+            st = os.fstat(f.fileno())
+        self.balances.update(after)
+        # Sous verrou (fichier si multi-processus), personne d'autre n'a pu écrire entre-temps
+        self._ledger_id = (st.st_dev, st.st_ino)
+        self._offset = st.st_size
+        self.tail_entries += len(lines)
+        io = _io_stats.setdefault(self.ledger_path, [0, 0, 0.0])
+        io[0] += 1; io[1] += len(payload); io[2] += time.perf_counter() - t0
+        return [bal for _uid, bal, _r, _ref in changes]
+
+    def apply(self, uid: str, new_balance: int, reason: str, ref: str | None = None) -> int:
+        return self.apply_many([(uid, new_balance, reason, ref)])[0]
+
+    def _next_segment_path(self) -> str:
+        return _segment_path(self.ledger_path, _active_segment_number(self.ledger_path))
+
+    def _rotate(self):
+        """Archive le journal courant (historique conservé pour audit) ; appelé après l'instantané."""
+        if os.path.exists(self.ledger_path):
+            os.replace(self.ledger_path, self._next_segment_path())
+        self._snapshot_id = self._file_id(self.snapshot_path)
+        self._offset = 0
+        self._ledger_id = None
+        self.tail_entries = 0
+
+    async def compact(self) -> bool:
+        """Instantané + rotation du journal. À appeler sous _points_lock."""
+        self.refresh()
+        if not self.tail_entries:
+            return False
+        # Écriture dans un thread : la boucle continue de servir les lectures pendant ce temps
+        await asyncio.to_thread(_atomic_write, self.snapshot_path, self.balances)
+        self._rotate()
+        return True
+
+    def replace_all(self, balances: Dict[str, int]):
+        """Remplace tous les soldes (import / outillage) : nouvel instantané, journal archivé."""
+        _atomic_write(self.snapshot_path, {str(k): int(v) for k, v in balances.items()})
+        self._rotate()
+        self.balances = None
+
+def _ledger_base(ledger_path: str) -> str:
+    return ledger_path[:-len(".jsonl")] if ledger_path.endswith(".jsonl") else ledger_path
+
+def _segment_path(ledger_path: str, n: int) -> str:
+    return f"{_ledger_base(ledger_path)}.{n:06d}.jsonl"
+
+def _segment_number(segment_path: str) -> int:
+    return int(segment_path[-len("000000.jsonl"):-len(".jsonl")])
+
+def _ledger_segments(ledger_path: str) -> list[str]:
+    """Segments archivés du journal, du plus ancien au plus récent."""
+    return sorted(glob.glob(glob.escape(_ledger_base(ledger_path)) + ".[0-9][0-9][0-9][0-9][0-9][0-9].jsonl"))
+
+def _active_segment_number(ledger_path: str) -> int:
+    """Numéro que recevra le journal courant à sa prochaine rotation."""
+    return max((_segment_number(p) for p in _ledger_segments(ledger_path)), default=0) + 1
+
+class _LedgerHistoryIndex:
+    """
+    Index par utilisateur des lignes du journal : uid → array('Q') de (segment << 40 | position).
+    Construit une fois en parcourant tous les segments, puis complété avec les seuls octets
+    ajoutés depuis ; une page d'historique coûte alors O(taille de page) lectures positionnées.
+    Le journal courant est indexé sous le numéro qu'il recevra à la rotation, donc les
+    positions restent valables une fois archivé.
+    """
+    _OFFSET_MASK = (1 << 40) - 1
+
+    def __init__(self, ledger_path: str):
+        self.ledger_path = ledger_path
+        self.by_user: Dict[str, array] = {}
+        self._done: set[int] = set()   # segments archivés entièrement indexés
+        self._active = 0
+        self._active_off = 0
+        self._mutex = threading.Lock()  # sync() tourne dans un thread (asyncio.to_thread)
+
+    def _scan(self, seg: int, path: str, start: int, expect: tuple | None = None) -> int | None:
+        """Indexe `path` à partir de `start` ; None (rien d'indexé) si ce n'est plus le fichier `expect`."""
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            return start
+        with f:
+            if expect is not None:
+                st = os.fstat(f.fileno())
+                if (st.st_dev, st.st_ino) != expect:
+                    return None
+            f.seek(start)
+            pos = start
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # écriture en cours : reprise au prochain sync
+                parts = line.split(b",", 2)
+                if len(parts) == 3 and parts[1].isdigit():
+                    self.by_user.setdefault(parts[1].decode(), array("Q")).append(seg << 40 | pos)
+                pos += len(line)
+        return pos
+
+    def sync(self):
+        """
+        Tourne dans un thread, sans _points_lock : une rotation peut survenir à tout moment.
+        L'identité du journal courant est relevée AVANT de lister les segments ; si le fichier
+        ouvert n'est plus celui-là, il a été archivé entre-temps et on recommence (il apparaîtra
+        alors dans les segments, repris à l'offset déjà atteint).
+        """
+        with self._mutex:
+            while True:
+                try:
+                    st = os.stat(self.ledger_path)
+                    live = (st.st_dev, st.st_ino)
+                except FileNotFoundError:
+                    live = None
+                segs = {_segment_number(p): p for p in _ledger_segments(self.ledger_path)}
+                for n in sorted(segs):
+                    if n in self._done:
+                        continue
+                    # l'ancien journal courant a été archivé : on reprend là où on s'était arrêté
+                    self._scan(n, segs[n], self._active_off if n == self._active else 0)
+                    self._done.add(n)
+                active = max(segs, default=0) + 1
+                if active != self._active:
+                    self._active, self._active_off = active, 0
+                if live is None:
+                    return  # pas encore de journal courant : rien de plus à indexer
+                off = self._scan(active, self.ledger_path, self._active_off, expect=live)
+                if off is not None:
+                    self._active_off = off
+                    return
+
+    def count(self, user_id: int) -> int:
+        return len(self.by_user.get(str(user_id), ()))
+
+    def page(self, user_id: int, start: int, size: int) -> list[list]:
+        """Mouvements [start, start+size) du plus récent au plus ancien. Appeler sync() avant."""
+        arr = self.by_user.get(str(user_id))
+        if not arr:
+            return []
+        hi = len(arr) - start
+        lo = max(0, hi - size)
+        out: list[list] = []
+        files: dict[int, io.BufferedReader] = {}
+        try:
+            for packed in reversed(arr[lo:max(lo, hi)]):
+                seg, off = packed >> 40, packed & self._OFFSET_MASK
+                f = files.get(seg)
+                if f is None:
+                    path = _segment_path(self.ledger_path, seg)
+                    if seg == self._active and not os.path.exists(path):
+                        path = self.ledger_path
+                    try:
+                        f = files[seg] = open(path, "rb")
+                    except FileNotFoundError:
+                        continue  # segment purgé
+                f.seek(off)
+                try:
+                    entry = json.loads(f.readline())
+                except ValueError:
+                    continue
+                if str(entry[1]) == str(user_id):
+                    out.append(entry)
+        finally:
+            for f in files.values():
+                f.close()
+        return out
+
+_points_ledger = _PointsLedger(POINTS_DB_PATH, POINTS_LEDGER_PATH)
+_points_history = _LedgerHistoryIndex(POINTS_LEDGER_PATH)
+
 def _load_points() -> Dict[str, int]:
-    _ensure_points_exists()
-    with open(POINTS_DB_PATH, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    return {str(k): int(v) for k, v in data.items()}
+    """Vue vivante des soldes { user_id(str): points } — lecture seule, ne pas modifier."""
+    _points_ledger.refresh()
+    return _points_ledger.balances
 
 def _save_points(points: Dict[str, int]) -> None:
-    _atomic_write(POINTS_DB_PATH, points)
+    _points_ledger.replace_all(points)
+
+def get_points(user_id: int) -> int:
+    return _points_ledger.get(str(user_id))
 
-async def add_points(user_id: int, amount: int) -> int:
+async def add_points(user_id: int, amount: int, reason: str = "", ref: str | None = None) -> int:
     async with _points_lock:
-        data = _load_points()
-        new_val = max(0, int(data.get(str(user_id), 0)) + amount)
-        data[str(user_id)] = new_val
-        _save_points(data)
-        return new_val
+        new_val = max(0, _points_ledger.get(str(user_id)) + amount)
+        return _points_ledger.apply(str(user_id), new_val, reason, ref)
 
-async def remove_points(user_id: int, amount: int) -> int:
+async def add_points_many(deltas: Dict[int, int], reason: str = "", ref: str | None = None) -> Dict[int, int]:
+    """{user_id: delta} appliqué en un seul lot (un append au journal). Retourne {user_id: nouveau solde}."""
     async with _points_lock:
-        data = _load_points()
-        new_val = max(0, int(data.get(str(user_id), 0)) - amount)
-        data[str(user_id)] = new_val
-        _save_points(data)
-        return new_val
+        changes = []
+        out: Dict[int, int] = {}
+        for uid, delta in deltas.items():
+            out[uid] = max(0, _points_ledger.get(str(uid)) + int(delta))
+            changes.append((str(uid), out[uid], reason, ref))
+        if changes:
+            _points_ledger.apply_many(changes)
+        return out
+
+async def remove_points(user_id: int, amount: int, reason: str = "", ref: str | None = None) -> int:
+    return await add_points(user_id, -amount, reason, ref)
+
+async def set_points(user_id: int, value: int, reason: str = "", ref: str | None = None) -> int:
+    async with _points_lock:
+        return _points_ledger.apply(str(user_id), max(0, int(value)), reason, ref)
 
-async def get_leaderboard(guild: discord.Guild, top: int = 10) -> List[Tuple[str, int]]:
+async def spend_points(user_id: int, cost: int, reason: str = "", ref: str | None = None) -> tuple[bool, int]:
+    """Débite `cost` si le solde suffit. Retourne (ok, solde)."""
     async with _points_lock:
-        data = _load_points()
+        current = _points_ledger.get(str(user_id))
+        if current < cost:
+            return False, current
+        return True, _points_ledger.apply(str(user_id), current - cost, reason, ref)
+
+async def points_ledger_compactor():
+    """Compacte périodiquement le journal des points quand il dépasse POINTS_LEDGER_COMPACT_BYTES."""
+    await bot.wait_until_ready()
+    while not bot.is_closed():
+        try:
+            size = os.path.getsize(POINTS_LEDGER_PATH) if os.path.exists(POINTS_LEDGER_PATH) else 0
+            if size >= POINTS_LEDGER_COMPACT_BYTES:
+                async with _points_lock:
+                    if await _points_ledger.compact():
+                        logging.info("Journal des points compacté (%d Ko)", size // 1024)
+        except Exception:
+            logging.exception("Erreur points_ledger_compactor")
+        await asyncio.sleep(POINTS_LEDGER_COMPACT_INTERVAL)
+
+async def get_leaderboard(guild: discord.Guild, top: int = 10) -> List[Tuple[str, int]]:
+    data = _load_points()
     sorted_items = sorted(((int(uid), pts) for uid, pts in data.items()),
                           key=lambda x: x[1], reverse=True)[:top]
     results: List[Tuple[str, int]] = []
@@ -340,10 +920,7 @@ def _ensure_shop_exists():
                 }
             }, f, ensure_ascii=False, indent=2)
 
-def _load_shop() -> Dict[str, dict]:
-    _ensure_shop_exists()
-    with open(SHOP_DB_PATH, "r", encoding="utf-8") as f:
-        data = json.load(f)
+def _normalize_shop(data: dict) -> Dict[str, dict]:
     shop = {}
     for key, item in data.items():
         shop[str(key)] = {
@@ -355,8 +932,39 @@ def _load_shop() -> Dict[str, dict]:
         }
     return shop
 
+# Catalogue en mémoire : relu seulement si shop.json change sur disque (édition à la main,
+# autre processus) ; /shopadmin écrit à travers _save_shop qui le met à jour directement.
+# "version" augmente à chaque changement : les vues ouvertes comparent pour se savoir périmées.
+_shop_cache: dict = {"id": None, "version": 0, "items": {}}
+
+def _shop_catalog() -> tuple[int, Dict[str, dict]]:
+    """(version, items) du catalogue. Lecture seule : passer par _edit_shop pour modifier."""
+    file_id = _PointsLedger._file_id(SHOP_DB_PATH)
+    if file_id is None:
+        _ensure_shop_exists()
+        file_id = _PointsLedger._file_id(SHOP_DB_PATH)
+    cache = _shop_cache
+    if cache["id"] != file_id:
+        items = _normalize_shop(_read_data(SHOP_DB_PATH))
+        cache.update(id=file_id, version=cache["version"] + 1, items=items)
+    return cache["version"], cache["items"]
+
+def _shop_version() -> int:
+    return _shop_catalog()[0]
+
+def _load_shop() -> Dict[str, dict]:
+    """Catalogue courant (dict partagé, lecture seule)."""
+    return _shop_catalog()[1]
+
+def _edit_shop() -> Dict[str, dict]:
+    """Copie modifiable du catalogue, à repasser à _save_shop (sous _shop_lock)."""
+    return {k: dict(it) for k, it in _load_shop().items()}
+
 def _save_shop(shop: Dict[str, dict]) -> None:
-    _atomic_write(SHOP_DB_PATH, shop)
+    items = _normalize_shop(shop)
+    _atomic_write(SHOP_DB_PATH, items)
+    # write-through : pas de relecture, la version suivante est déjà en mémoire
+    _shop_cache.update(id=_PointsLedger._file_id(SHOP_DB_PATH), version=_shop_cache["version"] + 1, items=items)
 
 # ---------- Achats par utilisateur (JSON) ----------
 def _ensure_purchases_exists():
@@ -364,27 +972,28 @@ def _ensure_purchases_exists():
         with open(PURCHASES_DB_PATH, "w", encoding="utf-8") as f:
             json.dump({}, f)
 
+_purchases_snapshot = _Snapshot(PURCHASES_DB_PATH, _ensure_purchases_exists)
+
 def _load_purchases() -> Dict[str, Dict[str, int]]:
-    """Structure: { user_id(str): { item_key(str): count(int) } }"""
-    _ensure_purchases_exists()
-    with open(PURCHASES_DB_PATH, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    return {str(uid): {str(k): int(v) for k, v in items.items()} for uid, items in data.items()}
+    """Version publiée { user_id(str): { item_key(str): count(int) } } — lecture seule."""
+    return _purchases_snapshot.get()[1]
 
-def _save_purchases(p: Dict[str, Dict[str, int]]) -> None:
-    _atomic_write(PURCHASES_DB_PATH, p)
+def _save_purchases(p: Dict[str, Dict[str, int]], changed=None) -> None:
+    _purchases_snapshot.publish(p, changed)
 
 async def get_user_purchase_count(user_id: int, key: str) -> int:
-    async with _purchases_lock:
-        p = _load_purchases()
-        return int(p.get(str(user_id), {}).get(str(key), 0))
+    return int(_load_purchases().get(str(user_id), {}).get(str(key), 0))
+
+async def get_user_purchases(user_id: int) -> Dict[str, int]:
+    return {k: int(v) for k, v in _load_purchases().get(str(user_id), {}).items()}
 
 async def increment_purchase(user_id: int, key: str) -> int:
     async with _purchases_lock:
-        p = _load_purchases()
-        u = p.setdefault(str(user_id), {})
+        # copie sur écriture : la table et l'entrée du joueur, le reste est partagé
+        p = dict(_load_purchases())
+        u = p[str(user_id)] = dict(p.get(str(user_id), {}))
         u[str(key)] = int(u.get(str(key), 0)) + 1
-        _save_purchases(p)
+        _save_purchases(p, changed=(user_id,))
         return u[str(key)]
 
 # ---------- Invite tracker (JSON + cache) ----------
@@ -394,47 +1003,51 @@ def _ensure_invites_exists():
             # structure: { "counts": {inviter_id: total}, "refs": {member_id: inviter_id} }
             json.dump({"counts": {}, "refs": {}}, f)
 
+_invites_snapshot = _Snapshot(INVITES_DB_PATH, _ensure_invites_exists)
+
 def _load_invites() -> Dict[str, Dict[str, int]]:
-    _ensure_invites_exists()
-    with open(INVITES_DB_PATH, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    data["counts"] = {str(k): int(v) for k, v in data.get("counts", {}).items()}
-    data["refs"] = {str(k): int(v) for k, v in data.get("refs", {}).items()}
-    return data
+    """Version publiée — lecture seule : passer par _edit_invites pour modifier."""
+    return _invites_snapshot.get()[1]
 
-def _save_invites(data: Dict[str, Dict[str, int]]) -> None:
-    _atomic_write(INVITES_DB_PATH, data)
+def _edit_invites() -> Dict[str, Dict[str, int]]:
+    """Copie modifiable (counts et refs copiés), à repasser à _save_invites sous _invites_lock."""
+    db = _load_invites()
+    return {**db, "counts": dict(db.get("counts", {})), "refs": dict(db.get("refs", {}))}
+
+def _save_invites(data: Dict[str, Dict[str, int]], changed=None) -> None:
+    _invites_snapshot.publish(data, changed)
 
 
 async def _add_invite_for(inviter_id: int, member_id: int) -> int:
     async with _invites_lock:
-        db = _load_invites()
+        db = _edit_invites()
         counts = db.setdefault("counts", {})
         refs = db.setdefault("refs", {})
         counts[str(inviter_id)] = int(counts.get(str(inviter_id), 0)) + 1
         refs[str(member_id)] = int(inviter_id)
-        _save_invites(db)
+        _save_invites(db, changed=(inviter_id,))
         return counts[str(inviter_id)]
 
 async def _remove_invite_for_member(member_id: int) -> tuple[int | None, int | None]:
     """Retourne (inviter_id, nouveau_total) si on a pu décrémenter, sinon (None, None)."""
     async with _invites_lock:
-        db = _load_invites()
+        db = _edit_invites()
         counts = db.setdefault("counts", {})
         refs = db.setdefault("refs", {})
         inviter_id = refs.pop(str(member_id), None)
         if inviter_id is None:
-            _save_invites(db)
+            _save_invites(db, changed=())
             return None, None
         new_total = max(0, int(counts.get(str(inviter_id), 0)) - 1)
         counts[str(inviter_id)] = new_total
-        _save_invites(db)
+        _save_invites(db, changed=(inviter_id,))
         return inviter_id, new_total
 
 async def _get_invite_count(inviter_id: int) -> int:
-    async with _invites_lock:
-        db = _load_invites()
-        return int(db.get("counts", {}).get(str(inviter_id), 0))
+    return int(_load_invites().get("counts", {}).get(str(inviter_id), 0))
+
+# Délais (s) entre les re-lectures des invites après un join (propagation des "uses" côté API)
+_INVITE_DETECT_DELAYS: tuple[float, ...] = (0.5, 1.5, 3.0)
 
 # Cache des invites: par guilde -> code -> (uses, inviter_id)
 InviteCache = Dict[int, Dict[str, tuple[int, int]]]
@@ -484,24 +1097,7 @@ async def _send_invite_log(guild: discord.Guild, text: str):
             pass
 # ---------- Helper ----------
 async def _mark_command_use(guild_id: int, user_id: int, command_str: str):
-    command_norm = command_str.strip().lower()
-    date_key = _today_str()
-    async with _quests_progress_lock:
-        pdb  = _load_quests_progress()
-        qcfg = _load_quests()
-
-        # Assigner l’utilisateur si besoin pour aujourd’hui
-        assigned_daily = _ensure_assignments(pdb, qcfg, "daily", date_key, guild_id, user_id, k=3)
-
-        for qkey, q in qcfg.get("daily", {}).items():
-            if qkey not in assigned_daily:
-                continue
-            if q.get("type") == "command_use" and str(q.get("command","")).strip().lower() == command_norm:
-                slot = _ensure_user_quest_slot(pdb, "daily", date_key, guild_id, user_id, qkey)
-                target = int(q.get("target", 1))
-                slot["progress"] = min(target, int(slot.get("progress", 0)) + 1)
-
-        _save_quests_progress(pdb)
+    await _quest_event(guild_id, user_id, "command", command=command_str.strip().lower())
 
 def _get_assigned(progress_db: dict, bucket: str, period_key: str, guild_id: int, user_id: int) -> list[str]:
     return (progress_db
@@ -515,6 +1111,7 @@ def _ensure_assignments(progress_db: dict, qcfg: dict, bucket: str, period_key:
                         guild_id: int, user_id: int, k: int = 3) -> list[str]:
     assigned = _get_assigned(progress_db, bucket, period_key, guild_id, user_id)
     if assigned:
+        _note_assignment(guild_id, user_id, bucket, period_key, assigned)  # tirage d'un autre processus
         return assigned
     # pioche parmi les clés disponibles
     keys = list(qcfg.get(bucket, {}).keys())
@@ -526,6 +1123,7 @@ def _ensure_assignments(progress_db: dict, qcfg: dict, bucket: str, period_key:
         assigned = random.sample(keys, min(k, len(keys)))
     # on persist
     (progress_db[bucket][period_key][str(guild_id)][str(user_id)])["__assigned"] = assigned
+    _note_assignment(guild_id, user_id, bucket, period_key, assigned)
     return assigned
                             
 def tier_info(member: discord.Member) -> tuple[str | None, str | None, list[str]]:
@@ -546,12 +1144,23 @@ def tier_info(member: discord.Member) -> tuple[str | None, str | None, list[str]
         return "bronze", "🥉 **Bronze**", ["Rôle exclusif", "Couleur du pseudo", "Badge dans /profile"]
     return None, None, []
 
-def member_tier_role(member: discord.Member) -> int | None:
+# Cache des paliers : { guild_id: { member_id: role_id du palier (0 = aucun) } }
+# Rempli à la demande, tenu à jour par on_member_update / on_member_remove / on_guild_role_delete.
+_tier_cache: Dict[int, Dict[int, int]] = {}
+
+def _compute_tier_role(member: discord.Member) -> int:
     ids = {r.id for r in member.roles}
     for rid in (OR, ARGENT, BRONZE):
         if rid and rid in ids:
             return rid
-    return None
+    return 0
+
+def member_tier_role(member: discord.Member) -> int | None:
+    tiers = _tier_cache.setdefault(member.guild.id, {})
+    rid = tiers.get(member.id)
+    if rid is None:
+        rid = tiers[member.id] = _compute_tier_role(member)
+    return rid or None
 
 def points_multiplier_for(member: discord.Member) -> float:
     rid = member_tier_role(member)
@@ -566,6 +1175,94 @@ def shop_discount_for(member: discord.Member) -> float:
     rid = member_tier_role(member)
     return float(SHOP_DISCOUNT.get(rid, 0.0))
 
+# ---------- Boutique : pages précalculées par palier ----------
+# La partie statique d'une carte (prix remisé, rôle, description, badges fixes) ne dépend que
+# du catalogue et du palier ; elle est calculée une fois par (version, palier, tri, page).
+# Le solde et les achats de l'utilisateur (barre, statut, restant) s'appliquent par-dessus.
+SHOP_PAGE_SIZE = 5
+_shop_entries_cache: Dict[tuple, list[dict]] = {}    # (version, palier) -> entrées, ordre du catalogue
+_shop_page_cache: Dict[tuple, tuple[int, list[dict]]] = {}  # (version, palier, tri, page) -> (nb pages, entrées)
+_shop_render_version = 0
+
+def _shop_entries(version: int, shop: Dict[str, dict], tier: int) -> list[dict]:
+    global _shop_render_version
+    if version != _shop_render_version:
+        _shop_entries_cache.clear()
+        _shop_page_cache.clear()
+        _shop_render_version = version
+    entries = _shop_entries_cache.get((version, tier))
+    if entries is None:
+        disc = float(SHOP_DISCOUNT.get(tier, 0.0)) if tier else 0.0
+        entries = []
+        for key, it in shop.items():
+            base_cost = int(it.get("cost", 0))
+            cost = max(1, int(round(base_cost * (1.0 - disc))))
+            role_id = int(it.get("role_id", 0))
+            max_per = int(it.get("max_per_user", -1))
+            role_txt = f" | rôle: <@&{role_id}>" if role_id else ""
+            old = f" ~~{base_cost}~~" if base_cost > cost else ""
+            desc = (it.get("description") or "").strip() or "_Aucune description_"
+            badges_pre = (["🎖 rôle"] if role_id else []) + ([f"🔢 {max_per} max"] if max_per >= 0 else [])
+            badges_post = [f"💸 -{int(disc*100)}%"] if disc > 0 else []
+            entries.append({
+                "key": key,
+                "name": it.get("name", key),
+                "cost": cost,
+                "base_cost": base_cost,
+                "role_id": role_id,
+                "max_per": max_per,
+                "head": f"{it.get('name', key)}** — **{cost}** pts{old}{role_txt}\n    {desc}\n    ",
+                "badges_pre": badges_pre,
+                "badges_post": badges_post,
+            })
+        _shop_entries_cache[(version, tier)] = entries
+    return entries
+
+def _shop_page(tier: int, sort_mode: str, page: int, owned: Dict[str, int]) -> tuple[int, int, list[dict]]:
+    """
+    (version du catalogue, nb de pages, entrées statiques de la page).
+    Le tri "remaining" dépend des achats de l'utilisateur (`owned`) : trié à la volée, non mis en cache.
+    """
+    version, shop = _shop_catalog()
+    entries = _shop_entries(version, shop, tier)
+    total_pages = max(1, (len(entries) + SHOP_PAGE_SIZE - 1) // SHOP_PAGE_SIZE)
+    page = min(max(0, page), total_pages - 1)
+    if sort_mode == "remaining":
+        def remaining(e):
+            return (e["max_per"] - int(owned.get(e["key"], 0))) if e["max_per"] >= 0 else -1
+        # items illimités (= -1) en bas
+        ordered = sorted(entries, key=lambda e: (remaining(e) == -1, remaining(e) if remaining(e) != -1 else 1_000_000))
+        return version, total_pages, ordered[page * SHOP_PAGE_SIZE:(page + 1) * SHOP_PAGE_SIZE]
+    ck = (version, tier, sort_mode, page)
+    hit = _shop_page_cache.get(ck)
+    if hit is None:
+        if sort_mode == "price_desc":
+            ordered = sorted(entries, key=lambda e: (-e["cost"], e["name"].lower()))
+        elif sort_mode == "name":
+            ordered = sorted(entries, key=lambda e: e["name"].lower())
+        else:  # price_asc
+            ordered = sorted(entries, key=lambda e: (e["cost"], e["name"].lower()))
+        hit = _shop_page_cache[ck] = (total_pages, ordered[page * SHOP_PAGE_SIZE:(page + 1) * SHOP_PAGE_SIZE])
+    return version, hit[0], hit[1]
+
+def _shop_overlay(e: dict, balance: int, owned: Dict[str, int]) -> tuple[int, bool]:
+    """(restant, achetable selon le solde) ; restant = -1 si illimité."""
+    remaining = (e["max_per"] - int(owned.get(e["key"], 0))) if e["max_per"] >= 0 else -1
+    return remaining, balance >= e["cost"]
+
+def _shop_card(i: int, e: dict, balance: int, owned: Dict[str, int]) -> str:
+    remaining, affordable = _shop_overlay(e, balance, owned)
+    cost = e["cost"]
+    have = min(balance, cost)
+    filled = int((have / cost) * 10) if cost > 0 else 10
+    bar = "▰" * filled + "▱" * (10 - filled) if cost > 0 else "──────────"
+    lim_txt = "∞" if e["max_per"] < 0 else f"{max(0, remaining)}/{e['max_per']}"
+    can_buy = affordable and remaining != 0
+    status = "🟢 Achetable" if can_buy else ("🟡 Solde insuffisant" if not affordable else "🔴 Limite atteinte")
+    badges = e["badges_pre"] + (["⛔ limite atteinte"] if remaining == 0 else []) + e["badges_post"]
+    return (f"**{i}. {e['head']}`{bar}`  •  {status}  •  limite: **{lim_txt}**\n"
+            f"    *{' • '.join(badges) if badges else '—'}*")
+
 # ---------- Quêtes : JSON + helpers ----------
 def _ensure_quests_exists():
     """Crée un petit catalogue de quêtes si absent."""
@@ -798,8 +1495,7 @@ def _ensure_quests_exists():
 
 def _load_quests() -> dict:
     _ensure_quests_exists()
-    with open(QUESTS_DB_PATH, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return _read_data(QUESTS_DB_PATH)
 
 def _ensure_quests_progress_exists():
     if not os.path.exists(QUESTS_PROGRESS_DB_PATH):
@@ -809,15 +1505,7 @@ def _ensure_quests_progress_exists():
 
 def _load_quests_progress() -> dict:
     _ensure_quests_progress_exists()
-    with open(QUESTS_PROGRESS_DB_PATH, "r", encoding="utf-8") as f:
-        pdb = json.load(f)
-    # rétro-compat: ancien format “plat” -> ranger dans daily
-    if "daily" not in pdb and "weekly" not in pdb and "lifetime" not in pdb:
-        pdb = {"daily": pdb, "weekly": {}, "lifetime": {}}
-    if "daily" not in pdb:    pdb["daily"]    = {}
-    if "weekly" not in pdb:   pdb["weekly"]   = {}
-    if "lifetime" not in pdb: pdb["lifetime"] = {}
-    return pdb
+    return _read_data(QUESTS_PROGRESS_DB_PATH)
 
 def _save_quests_progress(data: dict):
     _atomic_write(QUESTS_PROGRESS_DB_PATH, data)
@@ -856,14 +1544,525 @@ def _get_user_all_quests(progress_db: dict, bucket: str, period_key: str,
             .get(str(user_id), {})
             or {})
 
-def _atomic_write(path: str, data: dict):
+# ---------- Quêtes : moteur de progression ----------
+# La progression n'est plus incrémentée quête par quête : les événements alimentent des
+# compteurs d'activité par utilisateur et par jour (activity.json), et la progression d'une
+# quête est calculée à la lecture depuis le compteur qu'elle référence.
+# Chaque type de quête déclare l'événement écouté, la clé de son compteur et un handler
+# (quête, événement) -> incrément (0 = non concernée). Plusieurs quêtes qui lisent le même
+# compteur (ex: messages_20 / messages_200 / messages_2000) coûtent un seul incrément.
+_QUEST_TYPES: Dict[str, dict] = {}
+
+def _quest_type(qtype: str, event: str, counter, agg: str = "sum", progress: Callable | None = None,
+                compile: Callable | None = None):
+    """
+    counter: clé fixe ou fonction(quête) -> clé ; agg: "sum" | "max" ; progress(quête, valeur) optionnel.
+    compile(quête) -> objet passé au handler à la place de la quête (précalcul au chargement du catalogue).
+    """
+    def deco(fn):
+        _QUEST_TYPES[qtype] = {"event": event, "counter": counter, "agg": agg, "progress": progress,
+                               "compile": compile, "fn": fn}
+        return fn
+    return deco
+
+@_quest_type("messages", "message", counter="msg")
+def _qh_messages(q: dict, ev: dict) -> int:
+    return 1
+
+@_quest_type("message_exact", "message",
+             counter=lambda q: f"msg_exact:{str(q.get('text', '')).strip()}|{q.get('channel_id') or ''}")
+def _qh_message_exact(q: dict, ev: dict) -> int:
+    wanted = str(q.get("text", "")).strip()
+    if not wanted or ev["content"].strip() != wanted:
+        return 0
+    cid = q.get("channel_id")
+    return 0 if cid and int(cid) != ev["channel_id"] else 1
+
+class _HourWindow:
+    """
+    Fenêtre horaire locale [start_hour, end_hour) d'un fuseau (ex: 22 -> 5 en Europe/Paris),
+    compilée en intervalles de timestamps UTC pour le jour UTC courant. Le test d'un message
+    est une comparaison de flottants ; les intervalles ne sont recalculés qu'au changement
+    de jour UTC (changements d'heure compris).
+    """
+    __slots__ = ("tz", "start_h", "end_h", "_day_start", "_day_end", "_intervals")
+
+    def __init__(self, tz_name: str, start_h: int, end_h: int):
+        self.tz = ZoneInfo(tz_name)
+        self.start_h = start_h
+        self.end_h = end_h
+        self._day_start = self._day_end = 0.0
+        self._intervals: tuple[tuple[float, float], ...] = ()
+
+    def _at(self, d, hour: int) -> float:
+        """Timestamp de `hour`:00 heure locale le jour d ; 24 = minuit du lendemain (fin de journée)."""
+        return (datetime(d.year, d.month, d.day, tzinfo=self.tz) + timedelta(hours=hour)).timestamp()
+
+    def _compile_day(self, ts: float):
+        day = datetime.fromtimestamp(ts, timezone.utc).date()
+        self._day_start = datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp()
+        self._day_end = self._day_start + 86400
+        # le jour UTC chevauche au plus deux dates locales ; la veille couvre les fenêtres à cheval sur minuit
+        local_day = datetime.fromtimestamp(self._day_start, self.tz).date()
+        intervals = []
+        for d in (local_day - timedelta(days=1), local_day, local_day + timedelta(days=1)):
+            end_d = d if self.end_h > self.start_h else d + timedelta(days=1)
+            lo = self._at(d, self.start_h)
+            hi = self._at(end_d, self.end_h)
+            lo, hi = max(lo, self._day_start), min(hi, self._day_end)
+            if lo < hi:
+                intervals.append((lo, hi))
+        self._intervals = tuple(intervals)
+
+    def contains(self, ts: float) -> bool:
+        if self.start_h == self.end_h:
+            return True  # toute la journée (cas limite)
+        if not (self._day_start <= ts < self._day_end):
+            self._compile_day(ts)
+        for lo, hi in self._intervals:
+            if lo <= ts < hi:
+                return True
+        return False
+
+@_quest_type("messages_time_window", "message",
+             counter=lambda q: f"msg_window:{q.get('tz', 'UTC')}|{int(q.get('start_hour', 0))}|{int(q.get('end_hour', 0))}",
+             compile=lambda q: _HourWindow(str(q.get("tz", "UTC")), int(q.get("start_hour", 0)), int(q.get("end_hour", 0))))
+def _qh_messages_time_window(window: _HourWindow, ev: dict) -> int:
+    return 1 if window.contains(ev["ts"]) else 0
+
+@_quest_type("voice_minutes", "voice", counter="voice")
+def _qh_voice_minutes(q: dict, ev: dict) -> int:
+    return int(ev["minutes"])
+
+@_quest_type("invites", "invite", counter="invite")
+def _qh_invites(q: dict, ev: dict) -> int:
+    return 1
+
+@_quest_type("reaction_mod", "reaction", counter="react_mod")
+def _qh_reaction_mod(q: dict, ev: dict) -> int:
+    return 1 if ev["from_mod"] else 0
+
+@_quest_type("reaction_total", "reaction", counter="react_max", agg="max",
+             progress=lambda q, v: int(q.get("target", 1)) if v >= int(q.get("target", 1)) else 0)
+def _qh_reaction_total(q: dict, ev: dict) -> int:
+    return int(ev["total"])  # meilleur total de réactions sur un message de la période
+
+@_quest_type("command_use", "command", counter=lambda q: f"cmd:{str(q.get('command', '')).strip().lower()}")
+def _qh_command_use(q: dict, ev: dict) -> int:
+    return 1 if str(q.get("command", "")).strip().lower() == ev["command"] else 0
+
+@_quest_type("daily_claims_week", "daily_claim", counter="daily_claim")
+def _qh_daily_claims_week(q: dict, ev: dict) -> int:
+    return 1
+
+@_quest_type("server_boost", "boost", counter="boost")
+def _qh_server_boost(q: dict, ev: dict) -> int:
+    return 1
+
+@_quest_type("quests_completed", "quests_completed", counter="quests_done")
+def _qh_quests_completed(q: dict, ev: dict) -> int:
+    return int(ev["count"])
+
+# Un bit par événement de quête (masques de pertinence par utilisateur, cf. _user_event_mask)
+_QUEST_EVENT_BITS: Dict[str, int] = {}
+for _spec in _QUEST_TYPES.values():
+    _QUEST_EVENT_BITS.setdefault(_spec["event"], 1 << len(_QUEST_EVENT_BITS))
+_ALL_QUEST_EVENTS = (1 << len(_QUEST_EVENT_BITS)) - 1
+
+# Catalogue compilé : relu seulement quand quests.json change
+_quest_catalog_cache: dict = {"id": None, "qcfg": {}, "events": {}, "quests": {}, "bits": {}, "lifetime_mask": 0}
+
+def _quest_catalog() -> tuple[dict, dict, dict]:
+    """
+    Retourne (qcfg, events, quests) :
+      events = { événement: { clé_compteur: (agg, handler, quête compilée) } }  (compteurs à alimenter)
+      quests = { (bucket, clé_quête): (clé_compteur, agg, progress) }   (compteur lu par chaque quête)
+    Lecture seule : ne pas modifier qcfg.
+    """
+    _ensure_quests_exists()
+    st = os.stat(QUESTS_DB_PATH)
+    file_id = (st.st_ino, st.st_mtime_ns, st.st_size)
+    cache = _quest_catalog_cache
+    if cache["id"] != file_id:
+        qcfg = _load_quests()
+        events: dict = {}
+        quests: dict = {}
+        bits: dict = {}
+        for bucket in ("daily", "weekly", "lifetime"):
+            for qkey, q in qcfg.get(bucket, {}).items():
+                spec = _QUEST_TYPES.get(q.get("type"))
+                if not spec:  # types manuels (ex: manual_actor) : pas de compteur
+                    continue
+                ckey = spec["counter"](q) if callable(spec["counter"]) else spec["counter"]
+                if ckey not in events.get(spec["event"], {}):
+                    ctx = spec["compile"](q) if spec["compile"] else q
+                    events.setdefault(spec["event"], {})[ckey] = (spec["agg"], spec["fn"], ctx)
+                quests[(bucket, qkey)] = (ckey, spec["agg"], spec["progress"])
+                bits[(bucket, qkey)] = _QUEST_EVENT_BITS[spec["event"]]
+        lifetime_mask = 0
+        for (bucket, _qkey), bit in bits.items():
+            if bucket == "lifetime":
+                lifetime_mask |= bit
+        cache.update(id=file_id, qcfg=qcfg, events=events, quests=quests, bits=bits, lifetime_mask=lifetime_mask)
+    return cache["qcfg"], cache["events"], cache["quests"]
+
+def _quest_has_subscribers(event: str) -> bool:
+    return bool(_quest_catalog()[1].get(event))
+
+def _ensure_activity_exists():
+    if not os.path.exists(ACTIVITY_DB_PATH):
+        os.makedirs(os.path.dirname(ACTIVITY_DB_PATH) or ".", exist_ok=True)
+        with open(ACTIVITY_DB_PATH, "w", encoding="utf-8") as f:
+            json.dump({}, f)
+
+def _record_activity(adb: dict, guild_id: int, user_id: int, event: str, ev: dict,
+                     day: str | None = None) -> list[tuple[str, str, int, int]]:
+    """Incrémente les compteurs touchés par l'événement (jour UTC courant par défaut).
+    Retourne [(jour, compteur, valeur du jour, total)] des compteurs modifiés."""
+    counters = _quest_catalog()[1].get(event)
+    if not counters:
+        return []
+    incs = []
+    for ckey, (agg, fn, q) in counters.items():
+        v = fn(q, ev)
+        if v:
+            incs.append((ckey, agg, v))
+    if not incs:
+        return []
+    day = day or _today_str()
+    u = adb.setdefault(str(guild_id), {}).setdefault(str(user_id), {})
+    days = u.setdefault("days", {})
+    today = days.setdefault(day, {})
+    total = u.setdefault("total", {})
+    out = []
+    for ckey, agg, v in incs:
+        if agg == "max":
+            today[ckey] = max(today.get(ckey, 0), v)
+            total[ckey] = max(total.get(ckey, 0), v)
+        else:
+            today[ckey] = today.get(ckey, 0) + v
+            total[ckey] = total.get(ckey, 0) + v
+        out.append((day, ckey, today[ckey], total[ckey]))
+    if len(days) > ACTIVITY_KEEP_DAYS:
+        for old in sorted(days)[:-ACTIVITY_KEEP_DAYS]:
+            del days[old]
+    return out
+
+class _ActivityLog:
+    """
+    Compteurs d'activité en mémoire = instantané (activity.json) + journal (activity.journal.jsonl).
+    Un événement n'incrémente que la mémoire et met en file une ligne
+    [jour, guilde, utilisateur, compteur, valeur du jour, total] par compteur touché ;
+    activity_flusher ajoute la file au journal en un seul append (+fsync) toutes les
+    ACTIVITY_FLUSH_INTERVAL s et compacte au-delà de ACTIVITY_COMPACT_BYTES. Comme pour le
+    journal des points, les lignes portent les valeurs résultantes : les rejouer est sans effet.
+    Un arrêt brutal perd au plus les ACTIVITY_FLUSH_INTERVAL dernières secondes de compteurs.
+    Multi-processus : chaque processus compte les événements de ses guildes et relit le journal
+    des autres ; flush et compaction se font sous _activity_lock.
+    """
+    def __init__(self, snapshot_path: str, log_path: str):
+        self.snapshot_path = snapshot_path
+        self.log_path = log_path
+        self.data: dict | None = None
+        self._pending: list[bytes] = []   # lignes pas encore ajoutées au journal
+        self._offset = 0
+        self._log_id: tuple | None = None
+        self._snapshot_id: tuple | None = None
+
+    def _apply_line(self, line: bytes):
+        day, gid, uid, ckey, day_val, total_val = json.loads(line)
+        u = self.data.setdefault(str(gid), {}).setdefault(str(uid), {})
+        days = u.setdefault("days", {})
+        days.setdefault(day, {})[ckey] = day_val
+        u.setdefault("total", {})[ckey] = total_val
+        if len(days) > ACTIVITY_KEEP_DAYS:
+            for old in sorted(days)[:-ACTIVITY_KEEP_DAYS]:
+                del days[old]
+
+    def _load(self):
+        _ensure_activity_exists()
+        self.data = _read_data(self.snapshot_path)
+        self._snapshot_id = _PointsLedger._file_id(self.snapshot_path)
+        self._offset = 0
+        self._log_id = None
+        self._read_tail()
+        for line in self._pending:  # compteurs locaux pas encore écrits
+            self._apply_line(line)
+
+    def _read_tail(self):
+        try:
+            with open(self.log_path, "rb") as f:
+                st = os.fstat(f.fileno())
+                self._log_id = (st.st_dev, st.st_ino)
+                f.seek(self._offset)
+                chunk = f.read()
+        except FileNotFoundError:
+            self._log_id = None
+            return
+        end = chunk.rfind(b"\n") + 1  # ligne incomplète : reprise au prochain passage
+        for line in chunk[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                self._apply_line(line)
+            except Exception:
+                logging.warning("Ligne illisible ignorée dans %s: %r", self.log_path, line[:120])
+        self._offset += end
+
+    def refresh(self):
+        """Charge au premier accès ; en mode multi-processus, intègre les écritures des autres."""
+        if self.data is None:
+            self._load()
+            return
+        if not DATA_SHARED_LOCKS:
+            return
+        if _PointsLedger._file_id(self.snapshot_path) != self._snapshot_id:
+            self._load()
+            return
+        try:
+            st = os.stat(self.log_path)
+        except FileNotFoundError:
+            if self._log_id is not None:
+                self._load()
+            return
+        if (st.st_dev, st.st_ino) != self._log_id or st.st_size < self._offset:
+            self._load()
+        elif st.st_size > self._offset:
+            self._read_tail()
+
+    def view(self) -> dict:
+        """{ guild_id: { user_id: {"days": { 'YYYY-MM-DD': {compteur: n} }, "total": {compteur: n}} } } — lecture seule."""
+        self.refresh()
+        return self.data
+
+    def record(self, guild_id: int, user_id: int, event: str, ev: dict, day: str | None = None) -> bool:
+        """Compte l'événement en mémoire, sans verrou ni I/O. True si un compteur a bougé."""
+        self.refresh()
+        changes = _record_activity(self.data, guild_id, user_id, event, ev, day)
+        for d, ckey, day_val, total_val in changes:
+            self._pending.append(json.dumps([d, int(guild_id), int(user_id), ckey, day_val, total_val],
+                                            ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n")
+        return bool(changes)
+
+    def flush(self) -> int:
+        """Ajoute les lignes en attente au journal (un append + fsync). Sous _activity_lock."""
+        self.refresh()
+        if not self._pending:
+            return 0
+        payload = b"".join(self._pending)
+        t0 = time.perf_counter()
+        os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+        with open(self.log_path, "ab") as f:
+            if os.fstat(f.fileno()).st_size > self._offset:
+                f.truncate(self._offset)  # reste d'une écriture interrompue
+            f.write(payload)
+            f.flush(); os.fsync(f.fileno())
+            st = os.fstat(f.fileno())
+        n = len(self._pending)
+        self._pending = []
+        self._log_id = (st.st_dev, st.st_ino)
+        self._offset = st.st_size
+        io = _io_stats.setdefault(self.log_path, [0, 0, 0.0])
+        io[0] += 1; io[1] += len(payload); io[2] += time.perf_counter() - t0
+        return n
+
+    async def compact(self) -> bool:
+        """Nouvel instantané puis journal vidé. Sous _activity_lock."""
+        self.flush()
+        if not self._offset:
+            return False
+        # Encodé ici (la mémoire continue de bouger pendant l'écriture), écrit dans un thread ;
+        # les lignes ajoutées entre-temps restent en file pour le prochain journal.
+        payload = _encode_data(self.data, _PATH_ENCODINGS.get(self.snapshot_path, DATA_ENCODING))
+        await asyncio.to_thread(_write_payload, self.snapshot_path, payload)
+        try:
+            os.remove(self.log_path)
+        except FileNotFoundError:
+            pass
+        self._snapshot_id = _PointsLedger._file_id(self.snapshot_path)
+        self._offset = 0
+        self._log_id = None
+        return True
+
+    def replace_all(self, data: dict):
+        """Remplace tous les compteurs (outillage) : nouvel instantané, journal supprimé."""
+        _atomic_write(self.snapshot_path, data)
+        try:
+            os.remove(self.log_path)
+        except FileNotFoundError:
+            pass
+        self._pending = []
+        self.data = None
+
+_activity_log = _ActivityLog(ACTIVITY_DB_PATH, ACTIVITY_LOG_PATH)
+
+def _load_activity() -> dict:
+    """Compteurs courants (mémoire, lecture seule)."""
+    return _activity_log.view()
+
+def _save_activity(data: dict):
+    _activity_log.replace_all(data)
+
+async def activity_flusher():
+    """Écrit les compteurs d'activité par lots et compacte leur journal quand il grossit."""
+    await bot.wait_until_ready()
+    while not bot.is_closed():
+        await asyncio.sleep(ACTIVITY_FLUSH_INTERVAL)
+        try:
+            async with _activity_lock:
+                _activity_log.flush()
+                if _activity_log._offset >= ACTIVITY_COMPACT_BYTES:
+                    await _activity_log.compact()
+        except Exception:
+            logging.exception("Erreur activity_flusher")
+
+# (guild_id, user_id) -> {bucket: (période, clés assignées)} : quêtes tirées, tenues en mémoire là
+# où les tirages sont écrits (_ensure_assignments, /quests_* admin), jamais relues sur le chemin
+# des événements. Une entrée absente ou d'une autre période = pas encore tiré, donc tout compte :
+# c'est toujours sûr (surensemble), y compris au démarrage avant _load_assignments ou pour un
+# tirage fait par un autre processus.
+_assigned_quests: Dict[tuple[int, int], dict] = {}
+
+def _note_assignment(guild_id: int, user_id: int, bucket: str, period_key: str, assigned: list[str]):
+    if bucket in ("daily", "weekly"):
+        _assigned_quests.setdefault((int(guild_id), int(user_id)), {})[bucket] = (period_key, tuple(assigned))
+
+def _forget_user_mask(guild_id: int, user_id: int):
+    """À appeler quand les quêtes assignées d'un utilisateur sont effacées (reset)."""
+    _assigned_quests.pop((int(guild_id), int(user_id)), None)
+
+def _load_assignments():
+    """Relit une fois (démarrage) les tirages des périodes en cours depuis quests_progress.json."""
+    pdb = _load_quests_progress()
+    for bucket, period in (("daily", _today_str()), ("weekly", _week_str())):
+        for gid, users in pdb.get(bucket, {}).get(period, {}).items():
+            for uid, slots in users.items():
+                if isinstance(slots, dict) and slots.get("__assigned"):
+                    _note_assignment(int(gid), int(uid), bucket, period, slots["__assigned"])
+
+def _user_event_mask(guild_id: int, user_id: int) -> int:
+    """
+    Événements pouvant faire progresser une quête de l'utilisateur sur la période en cours :
+    quêtes daily/weekly assignées + toutes les lifetime. Tant qu'une période n'est pas encore
+    tirée, tout est pertinent (n'importe quelle quête peut sortir au tirage). Mémoire seule.
+    """
+    entry = _assigned_quests.get((guild_id, user_id))
+    if not entry:
+        return _ALL_QUEST_EVENTS
+    _quest_catalog()
+    cache = _quest_catalog_cache
+    mask = cache["lifetime_mask"]
+    for bucket, period in (("daily", _today_str()), ("weekly", _week_str())):
+        hit = entry.get(bucket)
+        if not hit or hit[0] != period or not hit[1]:
+            return _ALL_QUEST_EVENTS
+        for qkey in hit[1]:
+            mask |= cache["bits"].get((bucket, qkey), 0)
+    return mask
+
+async def _quest_event(guild_id: int, user_id: int, event: str, **ev):
+    """
+    Publie un événement de quête : incrément des compteurs d'activité en mémoire (écrits par
+    activity_flusher). Les quêtes ne sont pas tirées ici mais à l'ouverture de /quests : tant
+    que la période n'est pas tirée, tous les événements sont comptés, et la progression étant
+    dérivée des compteurs du jour / de la semaine, le tirage tardif voit toute l'activité de
+    la période — même résultat qu'un tirage au premier événement, sans écrire la progression.
+    """
+    if not _quest_has_subscribers(event):
+        return
+    if not _user_event_mask(guild_id, user_id) & _QUEST_EVENT_BITS[event]:
+        return  # aucune quête de l'utilisateur n'écoute cet événement
+    _activity_log.record(guild_id, user_id, event, ev)
+
+def _week_days(week_key: str) -> list[str]:
+    y, w = week_key.split("-W")
+    from datetime import date as _date
+    return [_date.fromisocalendar(int(y), int(w), d).isoformat() for d in range(1, 8)]
+
+def _derived_progress(adb: dict, guild_id: int, user_id: int, bucket: str, period_key: str) -> dict[str, int]:
+    """{clé_quête: progression issue des compteurs} pour les quêtes du bucket (hors ajustements des slots)."""
+    qcfg, _events, quests = _quest_catalog()
+    ua = adb.get(str(guild_id), {}).get(str(user_id), {})
+    days = ua.get("days", {})
+    if bucket == "daily":
+        sources = [days.get(period_key, {})]
+    elif bucket == "weekly":
+        sources = [days.get(d, {}) for d in _week_days(period_key)]
+    else:
+        sources = [ua.get("total", {})]
+    out = {}
+    for qkey, q in qcfg.get(bucket, {}).items():
+        spec = quests.get((bucket, qkey))
+        if not spec:
+            continue
+        ckey, agg, progress = spec
+        vals = [src.get(ckey, 0) for src in sources]
+        v = max(vals) if agg == "max" else sum(vals)
+        out[qkey] = progress(q, v) if progress else v
+    return out
+
+def _quest_progress_maps(pdb: dict, adb: dict, guild_id: int, user_id: int,
+                         date_key: str, week_key: str) -> tuple[dict, dict, dict]:
+    """
+    Progression effective { clé: {"progress", "claimed"} } pour daily / weekly / lifetime.
+    progress = slot["progress"] (ajustement manuel / historique) + compteurs d'activité, borné à [0, target].
+    """
+    qcfg = _quest_catalog()[0]
+    maps = []
+    for bucket, period in (("daily", date_key), ("weekly", week_key), ("lifetime", LIFETIME_PERIOD_KEY)):
+        slots = _get_user_all_quests(pdb, bucket, period, guild_id, user_id)
+        derived = _derived_progress(adb, guild_id, user_id, bucket, period)
+        m = {}
+        for qkey, q in qcfg.get(bucket, {}).items():
+            slot = slots.get(qkey) or {}
+            target = int(q.get("target", 0))
+            prog = max(0, int(slot.get("progress", 0)) + derived.get(qkey, 0))
+            m[qkey] = {"progress": min(prog, target) if target > 0 else prog, "claimed": int(slot.get("claimed", 0))}
+        maps.append(m)
+    return maps[0], maps[1], maps[2]
+
+# Compteurs d'écriture disque : { chemin: [nb_écritures, octets, secondes] }
+_io_stats: Dict[str, list] = {}
+
+def _encode_data(data, encoding: str) -> bytes:
+    if encoding == "msgpack":
+        return msgpack.packb(data, use_bin_type=True)
+    if encoding == "orjson" and orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+    if encoding == "pretty":
+        return json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def _decode_data(raw: bytes):
+    """JSON (indenté ou non) ou msgpack : un document JSON commence par '{' ou '[', une map msgpack jamais."""
+    head = raw.lstrip()[:1]
+    if head in (b"{", b"[") or not head:
+        return orjson.loads(raw) if orjson is not None else json.loads(raw)
+    if msgpack is None:
+        raise RuntimeError("Fichier encodé en msgpack mais le module msgpack n'est pas installé")
+    return msgpack.unpackb(raw, raw=False, strict_map_key=False)
+
+def _read_data(path: str):
+    with open(path, "rb") as f:
+        return _decode_data(f.read())
+
+def _atomic_write(path: str, data: dict, encoding: str | None = None):
+    """Écriture atomique dans l'encodage du fichier (DATA_ENCODING / DATA_ENCODINGS) ou celui imposé."""
+    _write_payload(path, _encode_data(data, encoding or _PATH_ENCODINGS.get(path, DATA_ENCODING)))
+
+def _write_payload(path: str, payload: bytes):
+    """Écriture atomique d'octets déjà encodés (peut tourner dans un thread)."""
+    t0 = time.perf_counter()
     os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
-    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".tmp_", text=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".tmp_")
     try:
-        with os.fdopen(fd, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
             f.flush(); os.fsync(f.fileno())
+            size = len(payload)
         os.replace(tmp, path)  # atomic
+        st = _io_stats.setdefault(path, [0, 0, 0.0])
+        st[0] += 1; st[1] += size; st[2] += time.perf_counter() - t0
     finally:
         try: os.remove(tmp)
         except FileNotFoundError: pass
@@ -873,22 +2072,205 @@ def _ensure_avent_exists():
         with open(AVENT_DB_PATH, "w", encoding="utf-8") as f:
             json.dump({}, f)
 
-def _load_avent() -> Dict[str, dict]:
-    """Structure: { user_id(str): { year(str): [days...] } }"""
-    _ensure_avent_exists()
-    with open(AVENT_DB_PATH, "r", encoding="utf-8") as f:
-        raw = json.load(f)
-    # cast propre
-    data: Dict[str, dict] = {}
-    for uid, years in raw.items():
-        years_clean = {}
-        for y, days in years.items():
-            years_clean[str(y)] = sorted(int(d) for d in days)
-        data[str(uid)] = years_clean
-    return data
+def _avent_days(mask: int) -> set[int]:
+    return {d for d in range(1, 25) if mask >> (d - 1) & 1}
+
+class _AventStore:
+    """
+    Jours ouverts en mémoire : { user_id(str): { année(str): masque 24 bits } } (bit d-1 = jour d).
+    Lecture sans verrou (ouvrir le calendrier ne touche pas au disque) ; seule l'ouverture
+    d'un jour écrit, sous _avent_lock.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.masks: Dict[str, Dict[str, int]] | None = None
+        self._file_id: tuple | None = None
+
+    def refresh(self):
+        """Charge au premier accès ; en mode multi-processus, relit si un autre processus a écrit."""
+        if self.masks is not None and not DATA_SHARED_LOCKS:
+            return
+        file_id = _PointsLedger._file_id(self.path)
+        if self.masks is not None and file_id == self._file_id:
+            return
+        _ensure_avent_exists()
+        self.masks = _read_data(self.path)
+        self._file_id = _PointsLedger._file_id(self.path)
+
+    def claimed(self, user_id: int, year: int) -> int:
+        self.refresh()
+        return self.masks.get(str(user_id), {}).get(str(year), 0)
+
+    def claim(self, user_id: int, year: int, day: int, write: bool = True) -> tuple[bool, int]:
+        """
+        Marque le jour ouvert. À appeler sous _avent_lock. Retourne (nouveau, masque).
+        write=False : l'appelant regroupe plusieurs ouvertures et appelle flush() une fois.
+        """
+        self.refresh()
+        years = self.masks.setdefault(str(user_id), {})
+        mask = years.get(str(year), 0)
+        bit = 1 << (day - 1)
+        if mask & bit:
+            return False, mask
+        years[str(year)] = mask | bit
+        if write:
+            self.flush()
+        return True, mask | bit
+
+    def flush(self):
+        _atomic_write(self.path, self.masks)
+        self._file_id = _PointsLedger._file_id(self.path)
+
+    def rollback(self, before: Dict[tuple[str, str], int]):
+        """Annule en mémoire des claim(write=False) non écrits : {(user_id, année): masque d'avant}."""
+        for (uid, year), mask in before.items():
+            years = self.masks.setdefault(uid, {})
+            if mask:
+                years[year] = mask
+            else:
+                years.pop(year, None)
+                if not years:
+                    self.masks.pop(uid, None)
+
+_avent_store = _AventStore(AVENT_DB_PATH)
+
+class _AventClaimBatcher:
+    """
+    Ouvertures du calendrier en écriture groupée : les clics arrivés pendant une écriture
+    partent ensemble à la suivante. Un lot = une écriture par fichier (avent.json, journal
+    des points, tickets.json ; les compteurs de quêtes sont en mémoire) au lieu de quatre
+    par clic ; le pic du 1er décembre à minuit s'écoule en quelques lots.
+    Ordre des verrous : avent → points → tickets, tenus ensemble : points et tickets sont
+    versés d'abord, le jour n'est marqué ouvert (avent.json) qu'en dernier. Si une étape
+    échoue, les précédentes sont compensées et le lot est rejeté : rien n'est versé, le jour
+    reste fermé et un nouvel essai est possible.
+    """
+    def __init__(self):
+        self._pending: list[tuple[dict, asyncio.Future]] = []
+        self._flushing = False
+        self.batches = 0
+        self.claims = 0
+        self.max_batch = 0
+
+    async def claim(self, guild_id: int | None, user_id: int, year: int, day: int,
+                    points: int, tickets: int) -> dict:
+        """
+        Ouvre `day` et verse points/tickets s'il ne l'était pas déjà.
+        Retourne {"new", "mask", "points_total", "tickets_total"} (totaux à None si rien versé).
+        """
+        fut = asyncio.get_running_loop().create_future()
+        self._pending.append(({"guild_id": guild_id, "user_id": user_id, "year": year, "day": day,
+                               "points": points, "tickets": tickets}, fut))
+        if not self._flushing:
+            self._flushing = True
+            asyncio.create_task(self._run())
+        return await fut
+
+    async def _run(self):
+        try:
+            await asyncio.sleep(0)  # laisse les clics du même tour de boucle rejoindre le lot
+            while self._pending:
+                batch, self._pending = self._pending, []
+                try:
+                    results = await self._commit([req for req, _f in batch])
+                except Exception as e:
+                    for _req, fut in batch:
+                        if not fut.done():
+                            fut.set_exception(e)
+                    continue
+                for (_req, fut), res in zip(batch, results):
+                    if not fut.done():
+                        fut.set_result(res)
+        finally:
+            self._flushing = False
+
+    @staticmethod
+    def _pay_points(accepted: list) -> Dict[str, int]:
+        """Verse les points du lot (un append). Retourne {user_id: solde d'avant}. Sous _points_lock."""
+        old: Dict[str, int] = {}
+        balances: Dict[str, int] = {}
+        changes = []
+        for r, res in accepted:
+            if not r["points"]:
+                continue
+            uid = str(r["user_id"])
+            cur = balances.get(uid, _points_ledger.get(uid))
+            old.setdefault(uid, cur)
+            balances[uid] = res["points_total"] = max(0, cur + r["points"])
+            changes.append((uid, balances[uid], "avent", str(r["day"])))
+        if changes:
+            _points_ledger.apply_many(changes)
+        return old
+
+    @staticmethod
+    def _undo_points(old: Dict[str, int]):
+        if old:
+            _points_ledger.apply_many([(uid, bal, "avent.annulation", None) for uid, bal in old.items()])
+
+    @staticmethod
+    def _pay_tickets(accepted: list) -> Dict[str, int] | None:
+        """Verse les tickets du lot (une écriture). Retourne la version d'avant. Sous _tickets_lock."""
+        ticketing = [(r, res) for r, res in accepted if r["tickets"]]
+        if not ticketing:
+            return None
+        old = _load_tickets()
+        data = dict(old)
+        for r, res in ticketing:
+            uid = str(r["user_id"])
+            data[uid] = res["tickets_total"] = int(data.get(uid, 0)) + r["tickets"]
+        _save_tickets(data, changed=[r["user_id"] for r, _res in ticketing])
+        return old
+
+    @staticmethod
+    def _undo_tickets(old: Dict[str, int] | None, accepted: list):
+        if old is not None:
+            _save_tickets(old, changed=[r["user_id"] for r, _res in accepted])
+
+    async def _commit(self, reqs: list[dict]) -> list[dict]:
+        self.batches += 1
+        self.claims += len(reqs)
+        self.max_batch = max(self.max_batch, len(reqs))
+        results = []
+        async with _avent_lock:
+            before: Dict[tuple[str, str], int] = {}
+            for r in reqs:
+                before.setdefault((str(r["user_id"]), str(r["year"])), _avent_store.claimed(r["user_id"], r["year"]))
+                is_new, mask = _avent_store.claim(r["user_id"], r["year"], r["day"], write=False)
+                results.append({"new": is_new, "mask": mask, "points_total": None, "tickets_total": None})
+            accepted = [(r, res) for r, res in zip(reqs, results) if res["new"]]
+            if not accepted:
+                return results
+            try:
+                async with _points_lock:
+                    old_points = self._pay_points(accepted)
+                    try:
+                        async with _tickets_lock:
+                            old_tickets = self._pay_tickets(accepted)
+                            try:
+                                _avent_store.flush()  # le jour n'est marqué qu'une fois tout versé
+                            except Exception:
+                                self._undo_tickets(old_tickets, accepted)
+                                raise
+                    except Exception:
+                        self._undo_points(old_points)
+                        raise
+            except Exception:
+                _avent_store.rollback(before)
+                raise
+
+        # Quêtes "command_use" : même filtre que _quest_event, compteurs en mémoire
+        try:
+            if _quest_has_subscribers("command"):
+                bit = _QUEST_EVENT_BITS["command"]
+                listening = [r for r, _res in accepted
+                             if r["guild_id"] and _user_event_mask(r["guild_id"], r["user_id"]) & bit]
+                for r in listening:
+                    _activity_log.record(r["guild_id"], r["user_id"], "command", {"command": "/avent"})
+        except Exception:
+            logging.exception("Avent : progression de quête non enregistrée pour le lot")
+        return results
 
-def _save_avent(data: Dict[str, dict]) -> None:
-    _atomic_write(AVENT_DB_PATH, data)
+_avent_claims = _AventClaimBatcher()
 
 def _ensure_daily_exists():
     if not os.path.exists(DAILY_DB_PATH):
@@ -903,39 +2285,80 @@ def _ensure_invite_rewards_exists():
 
 def _load_invite_rewards() -> Dict[str, Dict[str, int]]:
     _ensure_invite_rewards_exists()
-    with open(INVITE_REWARDS_DB_PATH, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    # cast en int pour sûreté
-    rewarded = {str(mid): int(iid) for mid, iid in data.get("rewarded", {}).items()}
-    return {"rewarded": rewarded}
+    return _read_data(INVITE_REWARDS_DB_PATH)
 
 def _save_invite_rewards(data: Dict[str, Dict[str, int]]) -> None:
     _atomic_write(INVITE_REWARDS_DB_PATH, data)
 
+_daily_snapshot = _Snapshot(DAILY_DB_PATH, _ensure_daily_exists)
+
 def _load_daily() -> Dict[str, dict]:
-    """{ user_id(str): { 'last': ts(int), 'streak': int, 'warned': bool } } (compat ancien format int)"""
-    _ensure_daily_exists()
-    with open(DAILY_DB_PATH, "r", encoding="utf-8") as f:
-        raw = json.load(f)
+    """Version publiée { user_id(str): { 'last': ts(int), 'streak': int, 'warned': bool } } — lecture seule.
+    Pour modifier : dict(...) puis remplacer l'état du joueur (jamais le muter en place)."""
+    return _daily_snapshot.get()[1]
 
-    data: Dict[str, dict] = {}
-    for k, v in raw.items():
-        if isinstance(v, dict):
-            last   = int(v.get("last", 0))
-            streak = int(v.get("streak", 0))
-            warned = bool(v.get("warned", False))
+def _save_daily(data: Dict[str, dict], changed=None) -> None:
+    _daily_snapshot.publish(data, changed)
+
+# ---------- Profil agrégé (lecture de /profile) ----------
+class _ProfileCache:
+    """
+    Agrégat par utilisateur pour /profile : achats (total + aperçu), invitations, état du
+    daily et tickets. Construit à la première lecture depuis les instantanés, puis invalidé
+    utilisateur par utilisateur à chaque publication qui le touche ; une publication sans
+    détail (relecture du disque, outillage) vide tout. Points et palier ont déjà leur vue en
+    mémoire (journal, _tier_cache) et sont lus en direct par _profile_view.
+    """
+    PREVIEW_ITEMS = 6
+
+    def __init__(self, snapshots: tuple):
+        self._snapshots = snapshots
+        self.entries: Dict[str, dict] = {}
+        self.hits = 0
+        self.misses = 0
+        for sn in snapshots:
+            sn.subscribe(self._invalidate)
+
+    def _invalidate(self, changed) -> None:
+        if changed is None:
+            self.entries.clear()
+            return
+        for uid in changed:
+            self.entries.pop(str(uid), None)
+
+    def _build(self, uid: str, shop: Dict[str, dict]) -> dict:
+        purchases = _load_purchases().get(uid, {})
+        top = sorted(purchases.items(), key=lambda kv: (-int(kv[1]), str(kv[0])))[:self.PREVIEW_ITEMS]
+        st = _load_daily().get(uid, {})
+        return {
+            "purchases_total": sum(int(v) for v in purchases.values()),
+            "purchases_preview": [(shop.get(k, {}).get("name", k), int(q)) for k, q in top],
+            "invites": int(_load_invites().get("counts", {}).get(uid, 0)),
+            "daily_last": int(st.get("last", 0)),
+            "streak": int(st.get("streak", 0)),
+            "tickets": int(_load_tickets().get(uid, 0)),
+        }
+
+    def get(self, uid: str) -> dict:
+        for sn in self._snapshots:
+            sn.get()  # écriture externe éventuelle → _invalidate(None)
+        shop_version, shop = _shop_catalog()
+        entry = self.entries.get(uid)
+        if entry is None or entry["shop_version"] != shop_version:
+            self.misses += 1
+            entry = self.entries[uid] = {"shop_version": shop_version, **self._build(uid, shop)}
         else:
-            # Ancien format : juste un timestamp -> on démarre à streak 1 si déjà réclamé
-            last   = int(v)
-            streak = 1 if last > 0 else 0
-            warned = False  # par défaut
+            self.hits += 1
+        return entry
 
-        data[str(k)] = {"last": last, "streak": streak, "warned": warned}
+_profiles = _ProfileCache((_tickets_snapshot, _purchases_snapshot, _invites_snapshot, _daily_snapshot))
 
-    return data
-    
-def _save_daily(data: Dict[str, dict]) -> None:
-    _atomic_write(DAILY_DB_PATH, data)
+def _profile_view(member: discord.Member) -> dict:
+    """Tout ce qu'affiche /profile pour un membre : agrégat en cache + points et palier courants."""
+    view = dict(_profiles.get(str(member.id)))
+    view["points"] = get_points(member.id)
+    view["tier"] = tier_info(member)
+    return view
     
 def _format_cooldown(secs: float) -> str:
     s = int(round(secs))
@@ -1020,45 +2443,11 @@ class AventView(OwnedView):
         ):
             return await interaction.response.send_message("❌ Mauvais jour !", ephemeral=True)
 
-        # (Re)charge et met à jour la base de données
-        async with _avent_lock:
-            adb = _load_avent()
-            u = adb.setdefault(str(interaction.user.id), {})
-            year_key = str(self.current_year)
-            days = set(int(d) for d in u.get(year_key, []))
-
-            if day in days:
-                # déjà ouvert (peut arriver si deux menus ouverts)
-                self.claimed_days = days
-                self._build_buttons()
-                await interaction.response.edit_message(
-                    embed=_avent_make_embed(
-                        interaction.user,
-                        self.current_year,
-                        day_now,
-                        self.claimed_days
-                    ),
-                    view=self,
-                )
-                try:
-                    await interaction.followup.send("Tu as déjà ouvert ce jour !", ephemeral=True)
-                except Exception:
-                    pass
-                return
-
-            # Nouveau jour ouvert
-            days.add(day)
-            u[year_key] = sorted(days)
-            _save_avent(adb)
-            self.claimed_days = days
-
         # --- Récompenses (points + tickets) ---
         reward_info = AVENT_REWARDS.get(day, {})
 
         gained_points = 0
         gained_tickets = 0
-        new_points_total = None
-        new_tickets_total = None
 
         # Points
         if "points" in reward_info:
@@ -1068,19 +2457,36 @@ class AventView(OwnedView):
             if isinstance(interaction.user, discord.Member):
                 gained_points = int(round(gained_points * points_multiplier_for(interaction.user)))
 
-            new_points_total = await add_points(interaction.user.id, gained_points)
-
         # Tickets
         if "tickets" in reward_info:
             gained_tickets = int(reward_info["tickets"])
-            new_tickets_total = await add_tickets(interaction.user.id, gained_tickets)
 
-        # Comptabiliser l'utilisation de la commande pour les quêtes "command_use"
-        try:
-            if interaction.guild:
-                await _mark_command_use(interaction.guild.id, interaction.user.id, "/avent")
-        except Exception:
-            pass
+        # Ouverture + points + tickets + quête "command_use" en une transaction groupée
+        res = await _avent_claims.claim(
+            interaction.guild.id if interaction.guild else None,
+            interaction.user.id, self.current_year, day, gained_points, gained_tickets
+        )
+        self.claimed_days = _avent_days(res["mask"])
+        new_points_total = res["points_total"]
+        new_tickets_total = res["tickets_total"]
+
+        if not res["new"]:
+            # déjà ouvert (peut arriver si deux menus ouverts)
+            self._build_buttons()
+            await interaction.response.edit_message(
+                embed=_avent_make_embed(
+                    interaction.user,
+                    self.current_year,
+                    day_now,
+                    self.claimed_days
+                ),
+                view=self,
+            )
+            try:
+                await interaction.followup.send("Tu as déjà ouvert ce jour !", ephemeral=True)
+            except Exception:
+                pass
+            return
 
         # Rafraîchir l’embed + les boutons
         self.open_day = day
@@ -1156,9 +2562,7 @@ async def roulette_cmd(
 
     try:
         # --- Récupère le solde actuel ---
-        async with _points_lock:
-            data = _load_points()
-            solde_avant = int(data.get(uid, 0))
+        solde_avant = get_points(user_id_int)
 
         if mise > solde_avant:
             await interaction.response.send_message(
@@ -1291,10 +2695,7 @@ async def roulette_cmd(
         await msg.edit(content=texte_final)
 
         # 💾 Sauvegarde APRÈS l’animation (pas de spoil pour /profile)
-        async with _points_lock:
-            data = _load_points()
-            data[uid] = solde_apres
-            _save_points(data)
+        await add_points(user_id_int, solde_apres - solde_avant, reason="game.roulette")
 
         # Envoi du message final avec l'embed
         await interaction.followup.send(embed=embed)
@@ -1336,9 +2737,7 @@ async def king_cmd(
         _roulette_in_progress.add(user_id_int)
 
     # --- Récupère le solde ---
-    async with _points_lock:
-        data = _load_points()
-        solde_avant = int(data.get(uid, 0))
+    solde_avant = get_points(user_id_int)
 
     if mise > solde_avant:
         # Important : libérer l'anti-spam si on sort ici
@@ -1387,9 +2786,7 @@ async def slots_cmd(
 
     try:
         # --- Récupère le solde ---
-        async with _points_lock:
-            data = _load_points()
-            solde_avant = int(data.get(uid, 0))
+        solde_avant = get_points(user_id_int)
 
         if mise > solde_avant:
             await interaction.response.send_message(
@@ -1519,10 +2916,7 @@ async def slots_cmd(
         embed.set_footer(text=f"Demandé par {interaction.user.display_name}")
 
         # 💾 Sauvegarde APRÈS animation (pas de spoil pour /profile)
-        async with _points_lock:
-            data = _load_points()
-            data[uid] = solde_apres
-            _save_points(data)
+        await add_points(user_id_int, solde_apres - solde_avant, reason="game.slots")
 
         await interaction.followup.send(embed=embed)
 
@@ -1571,9 +2965,7 @@ async def coinflip_cmd(
 
     try:
         # --- Récupère le solde ---
-        async with _points_lock:
-            data = _load_points()
-            solde_avant = int(data.get(uid, 0))
+        solde_avant = get_points(user_id_int)
 
         if mise > solde_avant:
             await interaction.response.send_message(
@@ -1639,10 +3031,7 @@ async def coinflip_cmd(
         embed.add_field(name="Gain / Perte", value=gain_txt, inline=False)
 
         # 💾 Sauvegarde APRÈS animation
-        async with _points_lock:
-            data = _load_points()
-            data[uid] = solde_apres
-            _save_points(data)
+        await add_points(user_id_int, solde_apres - solde_avant, reason="game.coinflip")
 
         await interaction.followup.send(embed=embed)
 
@@ -1654,15 +3043,114 @@ async def coinflip_cmd(
 @tree.command(name="tickets", description="Voir ton nombre de tickets.")
 @guilds_decorator()
 async def tickets_cmd(interaction: discord.Interaction):
-    # On lit le JSON des tickets
-    async with _tickets_lock:
-        data = _load_tickets()
-        count = int(data.get(str(interaction.user.id), 0))
+    count = get_tickets(interaction.user.id)
 
     texte = f"🎟️ Tu as actuellement **{count}** ticket(s)."
 
     await interaction.response.send_message(texte)
 
+# ---------- Tirage au sort (pondéré par les tickets) ----------
+class _TicketSampler:
+    """
+    Tirage pondéré sans remise sur un arbre de Fenwick (poids = tickets) : construction O(n),
+    puis chaque tirage et le retrait du gagnant en O(log n), quel que soit le nombre de tickets.
+    """
+    def __init__(self, holders: list[tuple[str, int]]):
+        self.ids = [uid for uid, _w in holders]
+        self.weights = [max(0, int(w)) for _uid, w in holders]
+        n = len(self.weights)
+        tree = [0] * (n + 1)
+        for i, w in enumerate(self.weights, start=1):
+            tree[i] += w
+            j = i + (i & -i)
+            if j <= n:
+                tree[j] += tree[i]
+        self.tree = tree
+        self.total = sum(self.weights)
+        self._top = 1 << (n.bit_length() - 1) if n else 0
+
+    def _add(self, i: int, delta: int):
+        n = len(self.weights)
+        i += 1
+        while i <= n:
+            self.tree[i] += delta
+            i += i & -i
+
+    def _find(self, target: int) -> int:
+        """Plus petit indice dont la somme préfixe dépasse target (0 ≤ target < total)."""
+        pos, step = 0, self._top
+        while step:
+            nxt = pos + step
+            if nxt < len(self.tree) and self.tree[nxt] <= target:
+                pos = nxt
+                target -= self.tree[nxt]
+            step >>= 1
+        return pos
+
+    def draw(self, rng: random.Random) -> tuple[str, int] | None:
+        """Tire un détenteur (proba ∝ tickets) et le retire du tirage. None s'il ne reste rien."""
+        if self.total <= 0:
+            return None
+        i = self._find(rng.randrange(self.total))
+        w = self.weights[i]
+        self._add(i, -w)
+        self.weights[i] = 0
+        self.total -= w
+        return self.ids[i], w
+
+@tree.command(name="tirage", description="Tirage au sort pondéré par les tickets (admin).")
+@guilds_decorator()
+@app_commands.default_permissions(administrator=True)
+@app_commands.checks.has_permissions(administrator=True)
+@app_commands.describe(
+    gagnants="Nombre de gagnants distincts (défaut 1)",
+    consommer="Remettre à zéro les tickets de tous les participants après le tirage",
+)
+async def tirage_cmd(interaction: discord.Interaction, gagnants: app_commands.Range[int, 1, 50] = 1, consommer: bool = False):
+    guild = interaction.guild
+    rng = random.SystemRandom()
+    async with _tickets_lock:
+        data = dict(_load_tickets())
+        # Seuls les membres encore présents participent
+        holders = [(uid, n) for uid, n in data.items()
+                   if n > 0 and (guild is None or guild.get_member(int(uid)))]
+        sampler = _TicketSampler(holders)
+        total_tickets = sampler.total
+        winners = []
+        for _ in range(int(gagnants)):
+            won = sampler.draw(rng)
+            if won is None:
+                break
+            winners.append(won)
+        if consommer and holders:
+            for uid, _n in holders:
+                data[uid] = 0
+            # une seule écriture atomique pour tous les participants
+            _save_tickets(data, changed=[uid for uid, _n in holders])
+
+    if not winners:
+        return await interaction.response.send_message("ℹ️ Aucun ticket en jeu : personne ne peut gagner.", ephemeral=True)
+
+    lines = [
+        f"**#{i}** — <@{uid}> ({n} ticket(s), {n * 100 / total_tickets:.2f}% des tickets)"
+        for i, (uid, n) in enumerate(winners, start=1)
+    ]
+    embed = discord.Embed(
+        title="🎟️ Tirage au sort",
+        description="\n".join(lines),
+        color=discord.Color.gold(),
+    )
+    foot = f"{len(holders)} participant(s), {total_tickets} ticket(s) en jeu"
+    if consommer:
+        foot += " — tickets remis à zéro"
+    embed.set_footer(text=foot)
+    await interaction.response.send_message(embed=embed)
+    await _send_admin_log(
+        guild, interaction.user, "tirage",
+        gagnants=", ".join(uid for uid, _n in winners),
+        participants=len(holders), tickets=total_tickets, consommer=consommer
+    )
+
 @tree.command(name="avent", description="Ouvre le calendrier de l'avent (1–24 décembre).")
 @guilds_decorator()
 async def avent_cmd(interaction: discord.Interaction):
@@ -1675,15 +3163,8 @@ async def avent_cmd(interaction: discord.Interaction):
             ephemeral=True,
         )
 
-    # Charge les jours déjà ouverts par l'utilisateur pour cette année
-    async with _avent_lock:
-        adb = _load_avent()
-        u = adb.setdefault(str(interaction.user.id), {})
-        year_key = str(year)
-        claimed_days = set(int(d) for d in u.get(year_key, []))
-        # on ré-enregistre proprement au cas où
-        u[year_key] = sorted(claimed_days)
-        _save_avent(adb)
+    # Jours déjà ouverts par l'utilisateur pour cette année (mémoire, sans verrou ni écriture)
+    claimed_days = _avent_days(_avent_store.claimed(interaction.user.id, year))
 
     embed = _avent_make_embed(interaction.user, year, day, claimed_days)
     view = AventView(author_id=interaction.user.id, current_year=year, open_day=day, claimed_days=claimed_days)
@@ -1837,7 +3318,16 @@ async def quests_clear_cmd(
             for bucket_name, pk in buckets:
                 removed += _clear_user_for_period(pdb, bucket_name, pk, guild_id, user_id)
 
+        # La progression dérive des compteurs d'activité : on repart de zéro pour la période
+        # en cours en posant un ajustement négatif égal à l'activité déjà comptée.
+        adb = _load_activity()
+        for bucket_name, pk in buckets:
+            for qkey, v in _derived_progress(adb, guild_id, user_id, bucket_name, pk).items():
+                if v > 0:
+                    _ensure_user_quest_slot(pdb, bucket_name, pk, guild_id, user_id, qkey)["progress"] = -v
+
         _save_quests_progress(pdb)
+    _forget_user_mask(guild_id, user_id)
 
     # feedback + log admin
     if removed == 0:
@@ -1979,10 +3469,9 @@ async def quests_preview_cmd(interaction: discord.Interaction, membre: Optional[
 
             async def ref_cb(i: discord.Interaction):
                 async with _quests_progress_lock:
-                    pdb2    = _load_quests_progress()
-                    d_map2  = _get_user_all_quests(pdb2, "daily",    date_key,            i.guild.id, target.id)   # type: ignore
-                    w_map2  = _get_user_all_quests(pdb2, "weekly",   week_key,            i.guild.id, target.id)   # type: ignore
-                    life2   = _get_user_all_quests(pdb2, "lifetime", LIFETIME_PERIOD_KEY, i.guild.id, target.id)   # type: ignore
+                    pdb2 = _load_quests_progress()
+                    d_map2, w_map2, life2 = _quest_progress_maps(
+                        pdb2, _load_activity(), i.guild.id, target.id, date_key, week_key)  # type: ignore
                     # 👉 Récupère UNIQUEMENT les quêtes assignées daily/weekly du membre
                     assigned_daily    = set(_get_assigned(pdb2, "daily",  date_key, i.guild.id, target.id))
                     assigned_weekly   = set(_get_assigned(pdb2, "weekly", week_key, i.guild.id, target.id))
@@ -1998,10 +3487,9 @@ async def quests_preview_cmd(interaction: discord.Interaction, membre: Optional[
 
     # Charge la progression + les listes assignées pour le MEMBRE ciblé
     async with _quests_progress_lock:
-        pdb      = _load_quests_progress()
-        d_map    = _get_user_all_quests(pdb, "daily",    date_key,            interaction.guild.id, target.id)  # type: ignore
-        w_map    = _get_user_all_quests(pdb, "weekly",   week_key,            interaction.guild.id, target.id)  # type: ignore
-        life_map = _get_user_all_quests(pdb, "lifetime", LIFETIME_PERIOD_KEY, interaction.guild.id, target.id)  # type: ignore
+        pdb = _load_quests_progress()
+        d_map, w_map, life_map = _quest_progress_maps(
+            pdb, _load_activity(), interaction.guild.id, target.id, date_key, week_key)  # type: ignore
         assigned_daily  = set(_get_assigned(pdb, "daily",  date_key, interaction.guild.id, target.id))
         assigned_weekly = set(_get_assigned(pdb, "weekly", week_key, interaction.guild.id, target.id))
 
@@ -2088,6 +3576,7 @@ async def quests_validate_cmd(
         assigned_list = _get_assigned(pdb, bucket, period_key, guild.id, target.id)
         if quest_id not in assigned_list:
             assigned_list.append(quest_id)
+            _note_assignment(guild.id, target.id, bucket, period_key, assigned_list)
 
         # Slot de progression
         slot = _ensure_user_quest_slot(pdb, bucket, period_key, guild.id, target.id, quest_id)
@@ -2111,31 +3600,20 @@ async def quests_validate_cmd(
         if not (bucket == "weekly" and qtype == "quests_completed"):
             meta_increment = 1
 
-        # Mise à jour des quêtes méta de type "quests_completed" (weekly)
-        if meta_increment > 0:
-            week_key = _week_str()
-            assigned_weekly = _get_assigned(pdb, "weekly", week_key, guild.id, target.id)
-            for meta_key, meta_q in qcfg.get("weekly", {}).items():
-                if meta_q.get("type") == "quests_completed" and meta_key in assigned_weekly:
-                    meta_slot = _ensure_user_quest_slot(pdb, "weekly", week_key, guild.id, target.id, meta_key)
-                    meta_slot["progress"] = int(meta_slot.get("progress", 0)) + meta_increment
-
-            for meta_key, meta_q in qcfg.get("lifetime", {}).items():
-                if meta_q.get("type") == "quests_completed":
-                    meta_slot = _ensure_user_quest_slot(
-                        pdb, "lifetime", LIFETIME_PERIOD_KEY, guild.id, target.id, meta_key
-                    )
-                    meta_slot["progress"] = int(meta_slot.get("progress", 0)) + meta_increment
-
         _save_quests_progress(pdb)
 
+    # Mise à jour des quêtes méta de type "quests_completed"
+    if meta_increment > 0:
+        await _quest_event(guild.id, target.id, "quests_completed", count=meta_increment)
+
     # --- Attribution des points (avec multiplicateur de palier)
     base_reward = target_base_reward
     effective_reward = base_reward
     if isinstance(target, discord.Member):
         effective_reward = int(round(base_reward * points_multiplier_for(target)))
 
-    new_total = await add_points(target.id, effective_reward) if effective_reward > 0 else await add_points(target.id, 0)
+    new_total = (await add_points(target.id, effective_reward, reason="quest.validate", ref=quest_id)
+                 if effective_reward > 0 else get_points(target.id))
 
     # Log quêtes
     try:
@@ -2263,10 +3741,9 @@ async def quests_cmd(interaction: discord.Interaction):
     date_key = _today_str()
     week_key = _week_str()
     async with _quests_progress_lock:
-        pdb      = _load_quests_progress()
-        d_map    = _get_user_all_quests(pdb, "daily",    date_key,             interaction.guild.id, interaction.user.id)
-        w_map    = _get_user_all_quests(pdb, "weekly",   week_key,             interaction.guild.id, interaction.user.id)
-        life_map = _get_user_all_quests(pdb, "lifetime", LIFETIME_PERIOD_KEY,  interaction.guild.id, interaction.user.id)
+        pdb = _load_quests_progress()
+        d_map, w_map, life_map = _quest_progress_maps(
+            pdb, _load_activity(), interaction.guild.id, interaction.user.id, date_key, week_key)
     
     embed = _make_embed(d_map, w_map, life_map)
 
@@ -2289,6 +3766,8 @@ async def quests_cmd(interaction: discord.Interaction):
                 
                     u_daily  = _get_user_all_quests(pdb, "daily",  date_key, i.guild.id, i.user.id)
                     u_weekly = _get_user_all_quests(pdb, "weekly", week_key,  i.guild.id, i.user.id)
+                    # progression effective (compteurs d'activité + ajustements des slots)
+                    p_daily, p_weekly, p_life = _quest_progress_maps(pdb, _load_activity(), i.guild.id, i.user.id, date_key, week_key)
                 
                     claimed_count = 0  # nombre de quêtes réellement réclamées (pour méta)
                 
@@ -2300,7 +3779,7 @@ async def quests_cmd(interaction: discord.Interaction):
                         reward = int(q.get("reward", 0))
                         maxc   = int(q.get("max_claims_per_reset", 1))
                         slot   = u_daily.setdefault(key, {"progress": 0, "claimed": 0})
-                        if slot.get("progress", 0) >= target and slot.get("claimed", 0) < maxc:
+                        if p_daily.get(key, {}).get("progress", 0) >= target and slot.get("claimed", 0) < maxc:
                             slot["claimed"] = int(slot.get("claimed", 0)) + 1
                             gained += reward
                             claimed_count += 1
@@ -2314,7 +3793,7 @@ async def quests_cmd(interaction: discord.Interaction):
                         reward = int(q.get("reward", 0))
                         maxc   = int(q.get("max_claims_per_reset", 1))
                         slot   = u_weekly.setdefault(key, {"progress": 0, "claimed": 0})
-                        if slot.get("progress", 0) >= target and slot.get("claimed", 0) < maxc:
+                        if p_weekly.get(key, {}).get("progress", 0) >= target and slot.get("claimed", 0) < maxc:
                             slot["claimed"] = int(slot.get("claimed", 0)) + 1
                             gained += reward
                             claimed_count += 1
@@ -2327,28 +3806,19 @@ async def quests_cmd(interaction: discord.Interaction):
                         reward = int(q.get("reward", 0))
                         maxc   = int(q.get("max_claims_per_reset", 1))
                         slot   = _ensure_user_quest_slot(pdb, "lifetime", LIFETIME_PERIOD_KEY, i.guild.id, i.user.id, key)
-                        if slot.get("progress", 0) >= target and slot.get("claimed", 0) < maxc:
+                        if p_life.get(key, {}).get("progress", 0) >= target and slot.get("claimed", 0) < maxc:
                             slot["claimed"] = int(slot.get("claimed", 0)) + 1
                             gained += reward
                             claimed_infos.append(("lifetime", q.get("name", key), reward))
 
-                    for meta_key, meta_q in qcfg.get("weekly", {}).items():
-                        if meta_q.get("type") == "quests_completed" and meta_key in assigned_weekly:
-                            meta_slot = _ensure_user_quest_slot(pdb, "weekly", week_key, i.guild.id, i.user.id, meta_key)
-                            meta_slot["progress"] = int(meta_slot.get("progress", 0)) + claimed_count
-                    
-                    for meta_key, meta_q in qcfg.get("lifetime", {}).items():
-                        if meta_q.get("type") == "quests_completed":
-                            meta_slot = _ensure_user_quest_slot(
-                                pdb, "lifetime", LIFETIME_PERIOD_KEY, i.guild.id, i.user.id, meta_key
-                            )
-                            meta_slot["progress"] = int(meta_slot.get("progress", 0)) + claimed_count
-
                     _save_quests_progress(pdb)
 
+                if claimed_count:
+                    await _quest_event(i.guild.id, i.user.id, "quests_completed", count=claimed_count)
+
                 if gained > 0 and isinstance(i.user, discord.Member):
                     gained = int(round(gained * points_multiplier_for(i.user)))
-                    new_total = await add_points(i.user.id, gained)
+                    new_total = await add_points(i.user.id, gained, reason="quest.claim")
 
                     # Envoi des logs de quêtes réclamées
                     try:
@@ -2359,10 +3829,9 @@ async def quests_cmd(interaction: discord.Interaction):
 
                     # Rafraîchir l’UI
                     async with _quests_progress_lock:
-                        pdb2     = _load_quests_progress()
-                        d2       = _get_user_all_quests(pdb2, "daily",    date_key,            i.guild.id, i.user.id)  # type: ignore
-                        w2       = _get_user_all_quests(pdb2, "weekly",   week_key,            i.guild.id, i.user.id)  # type: ignore
-                        life2    = _get_user_all_quests(pdb2, "lifetime", LIFETIME_PERIOD_KEY, i.guild.id, i.user.id)  # type: ignore
+                        pdb2 = _load_quests_progress()
+                        d2, w2, life2 = _quest_progress_maps(
+                            pdb2, _load_activity(), i.guild.id, i.user.id, date_key, week_key)  # type: ignore
                     await i.response.edit_message(embed=_make_embed(d2, w2, life2), view=self)
                     await i.followup.send(f"✅ **+{gained}** pts → total **{new_total}**.", ephemeral=True)
 
@@ -2370,9 +3839,9 @@ async def quests_cmd(interaction: discord.Interaction):
                     # Rien à réclamer → il faut recalculer l’embed (sinon 'embed' est undefined)
                     async with _quests_progress_lock:
                         pdb2 = _load_quests_progress()
-                        d2 = _get_user_all_quests(pdb2, "daily",  date_key, i.guild.id, i.user.id)  # type: ignore
-                        w2 = _get_user_all_quests(pdb2, "weekly", week_key,  i.guild.id, i.user.id)  # type: ignore
-                    await i.response.edit_message(embed=_make_embed(d2, w2), view=self)
+                        d2, w2, life2 = _quest_progress_maps(
+                            pdb2, _load_activity(), i.guild.id, i.user.id, date_key, week_key)  # type: ignore
+                    await i.response.edit_message(embed=_make_embed(d2, w2, life2), view=self)
                     try:
                         await i.followup.send("Rien à réclamer pour l’instant.", ephemeral=True)
                     except Exception:
@@ -2380,10 +3849,9 @@ async def quests_cmd(interaction: discord.Interaction):
 
             async def ref_cb(i: discord.Interaction):
                 async with _quests_progress_lock:
-                    pdb2  = _load_quests_progress()
-                    d2    = _get_user_all_quests(pdb2, "daily",    date_key,            i.guild.id, i.user.id)  # type: ignore
-                    w2    = _get_user_all_quests(pdb2, "weekly",   week_key,            i.guild.id, i.user.id)  # type: ignore
-                    life2 = _get_user_all_quests(pdb2, "lifetime", LIFETIME_PERIOD_KEY, i.guild.id, i.user.id)  # type: ignore
+                    pdb2 = _load_quests_progress()
+                    d2, w2, life2 = _quest_progress_maps(
+                        pdb2, _load_activity(), i.guild.id, i.user.id, date_key, week_key)  # type: ignore
                 await i.response.edit_message(embed=_make_embed(d2, w2, life2), view=self)
 
             btn_claim.callback = claim_cb
@@ -2403,7 +3871,7 @@ async def daily_cmd(interaction: discord.Interaction):
     uid = str(interaction.user.id)
 
     async with _daily_lock:
-        daily = _load_daily()
+        daily = dict(_load_daily())
         state = daily.get(uid, {"last": 0, "streak": 0})
         last = int(state.get("last", 0))
         streak = int(state.get("streak", 0))
@@ -2435,9 +3903,9 @@ async def daily_cmd(interaction: discord.Interaction):
         reward = max(0, reward)
 
         # Créditer & enregistrer
-        new_total = await add_points(interaction.user.id, reward)
+        new_total = await add_points(interaction.user.id, reward, reason="daily")
         daily[uid] = {"last": now_ts, "streak": new_streak, "warned": False}
-        _save_daily(daily)
+        _save_daily(daily, changed=(uid,))
 
     # Texte sympa
     streak_bar = "▰" * new_streak + "▱" * (STREAK_MAX - new_streak)
@@ -2447,21 +3915,7 @@ async def daily_cmd(interaction: discord.Interaction):
         f"🔥 Streak: **{new_streak}/{STREAK_MAX}** `{streak_bar}` — {next_hint}",
     )
     # Incrémenter la (ou les) quêtes "daily_claims_week"
-    async with _quests_progress_lock:
-        pdb   = _load_quests_progress()
-        qcfg  = _load_quests()
-        week_key = _week_str()
-        assigned_weekly = _ensure_assignments(pdb, qcfg, "weekly", week_key, interaction.guild.id, interaction.user.id, k=3)
-    
-        for qkey, q in qcfg.get("weekly", {}).items():
-            if qkey not in assigned_weekly:
-                continue
-            if q.get("type") == "daily_claims_week":
-                slot   = _ensure_user_quest_slot(pdb, "weekly", week_key, interaction.guild.id, interaction.user.id, qkey)
-                target = int(q.get("target", 5))
-                slot["progress"] = min(target, int(slot.get("progress", 0)) + 1)
-    
-        _save_quests_progress(pdb)
+    await _quest_event(interaction.guild.id, interaction.user.id, "daily_claim")
     # Marquer la quête d'usage de commande pour /daily
     await _mark_command_use(interaction.guild.id, interaction.user.id, "/daily")
     
@@ -2482,9 +3936,7 @@ async def purchases_cmd(
             ephemeral=True
         )
 
-    async with _purchases_lock:
-        p = _load_purchases()
-    items = p.get(str(target.id), {})
+    items = _load_purchases().get(str(target.id), {})
 
     if not items:
         return await interaction.response.send_message(
@@ -2492,8 +3944,7 @@ async def purchases_cmd(
         )
 
     # Noms jolis depuis le shop
-    async with _shop_lock:
-        shop = _load_shop()
+    shop = _load_shop()
 
     lines = [f"**Achats de {target.display_name} :**"]
     for key, count in items.items():
@@ -2502,6 +3953,109 @@ async def purchases_cmd(
 
     await interaction.response.send_message("\n".join(lines))
 
+# ---------- Historique des points ----------
+
+HISTORY_PAGE_SIZE = 10
+
+_LEDGER_REASON_LABELS = {
+    "game.roulette": "🎰 Roulette",
+    "game.slots": "🎰 Machine à sous",
+    "game.coinflip": "🪙 Pile ou face",
+    "game.king": "👑 King of the Hill",
+    "shop.purchase": "🛒 Achat boutique",
+    "daily": "📅 Daily",
+    "quest.claim": "🗺️ Quête",
+    "quest.validate": "🗺️ Quête validée",
+    "invite": "📨 Invitation",
+    "avent": "🎄 Calendrier de l'Avent",
+    "avent.annulation": "🎄 Calendrier de l'Avent (annulé)",
+    "admin.addpoints": "🛠️ Ajout admin",
+    "admin.removepoints": "🛠️ Retrait admin",
+    "admin.setpoints": "🛠️ Solde fixé par un admin",
+    "admin.bulk": "🛠️ Opération groupée admin",
+}
+
+def _render_history_page(target: discord.abc.User, entries: list[list], page: int, total: int) -> discord.Embed:
+    total_pages = max(1, (total + HISTORY_PAGE_SIZE - 1) // HISTORY_PAGE_SIZE)
+    embed = discord.Embed(title=f"📜 Historique de {target.display_name}", color=discord.Color.blurple())
+    lines = []
+    for ts, _uid, delta, reason, ref, bal in entries:
+        label = _LEDGER_REASON_LABELS.get(reason, reason or "Mouvement")
+        if reason == "shop.purchase" and ref:
+            label += f" (`{ref}`)"
+        lines.append(f"<t:{int(ts)}:R> · **{delta:+d}** pts · {label} → {bal} pts")
+    embed.description = "\n".join(lines) or "Aucun mouvement enregistré."
+    embed.set_footer(text=f"Page {page + 1}/{total_pages} · {total} mouvement(s)")
+    return embed
+
+class HistoryView(OwnedView):
+    def __init__(self, author_id: int, target: discord.abc.User, page: int, total: int):
+        super().__init__(author_id=author_id, timeout=120)
+        self.target = target
+        self.page = page
+        self.total = total
+        self.update_children()
+
+    @property
+    def total_pages(self) -> int:
+        return max(1, (self.total + HISTORY_PAGE_SIZE - 1) // HISTORY_PAGE_SIZE)
+
+    def update_children(self):
+        self.clear_items()
+        btn_prev = discord.ui.Button(emoji="◀️", style=discord.ButtonStyle.secondary, disabled=self.page <= 0)
+        btn_next = discord.ui.Button(emoji="▶️", style=discord.ButtonStyle.secondary,
+                                     disabled=self.page >= self.total_pages - 1)
+
+        async def _edit(i: discord.Interaction):
+            # Les nouveaux mouvements s'ajoutent en tête : la page 1 reste "les plus récents"
+            self.total, entries = await _history_page(self.target.id, self.page)
+            self.page = max(0, min(self.page, self.total_pages - 1))
+            self.update_children()
+            await i.response.edit_message(embed=_render_history_page(self.target, entries, self.page, self.total), view=self)
+
+        async def prev_cb(i: discord.Interaction): self.page = max(0, self.page - 1); await _edit(i)
+        async def next_cb(i: discord.Interaction): self.page = self.page + 1; await _edit(i)
+
+        btn_prev.callback = prev_cb
+        btn_next.callback = next_cb
+        self.add_item(btn_prev)
+        self.add_item(btn_next)
+
+async def _history_page(user_id: int, page: int) -> tuple[int, list[list]]:
+    def work():
+        _points_history.sync()
+        return (_points_history.count(user_id),
+                _points_history.page(user_id, page * HISTORY_PAGE_SIZE, HISTORY_PAGE_SIZE))
+    return await asyncio.to_thread(work)
+
+@tree.command(name="historique", description="Voir les derniers mouvements de points.")
+@guilds_decorator()
+@app_commands.describe(membre="(Optionnel) Le membre dont afficher l'historique", page="Page à afficher (défaut 1)")
+async def historique_cmd(
+    interaction: discord.Interaction,
+    membre: discord.Member | None = None,
+    page: app_commands.Range[int, 1, 10_000] = 1,
+):
+    target = membre or interaction.user  # type: ignore
+
+    if target.id != interaction.user.id and not interaction.user.guild_permissions.administrator:  # type: ignore
+        return await interaction.response.send_message(
+            "⛔ Tu ne peux voir que **ton** historique. (Réservé aux admins pour les autres.)",
+            ephemeral=True
+        )
+
+    await interaction.response.defer(ephemeral=True)
+    total, entries = await _history_page(target.id, page - 1)
+    if not total:
+        return await interaction.followup.send(f"📜 Aucun mouvement enregistré pour **{target.display_name}**.", ephemeral=True)
+
+    page0 = max(0, min(page - 1, (total - 1) // HISTORY_PAGE_SIZE))
+    if page0 != page - 1:
+        _total, entries = await _history_page(target.id, page0)
+    view = HistoryView(author_id=interaction.user.id, target=target, page=page0, total=total)
+    msg = await interaction.followup.send(embed=_render_history_page(target, entries, page0, total), view=view, ephemeral=True)
+    view.message = msg
+
 class KingOfTheHillView(discord.ui.View):
     def __init__(self, interaction: discord.Interaction, mise: int, solde_avant: int):
         super().__init__(timeout=60)  # 60s d'inactivité avant timeout
@@ -2553,10 +4107,7 @@ class KingOfTheHillView(discord.ui.View):
         self.finished = True
 
         # Sauvegarde des points
-        async with _points_lock:
-            data = _load_points()
-            data[self.uid] = max(0, solde_apres)
-            _save_points(data)
+        await add_points(int(self.uid), max(0, solde_apres) - self.solde_avant, reason="game.king")
 
         # Désactiver les boutons
         for child in self.children:
@@ -2791,11 +4342,10 @@ async def invites_cmd(interaction: discord.Interaction, membre: discord.Member |
     cible = membre or interaction.user  # type: ignore
 
     # --- Récupération des données depuis invites.json ---
-    async with _invites_lock:
-        db = _load_invites()
-        total = int(db.get("counts", {}).get(str(cible.id), 0))
-        # refs: { member_id(str): inviter_id(int) }
-        invitee_ids = [int(mid) for mid, iid in db.get("refs", {}).items() if int(iid) == int(cible.id)]
+    db = _load_invites()
+    total = int(db.get("counts", {}).get(str(cible.id), 0))
+    # refs: { member_id(str): inviter_id(int) }
+    invitee_ids = [int(mid) for mid, iid in db.get("refs", {}).items() if int(iid) == int(cible.id)]
 
     # --- Préparation des lignes affichées ---
     rows: List[Tuple[str, str]] = []
@@ -2819,7 +4369,16 @@ async def invites_cmd(interaction: discord.Interaction, membre: discord.Member |
 @tree.command(name="ping", description="Test rapide de réponse du bot.")
 @guilds_decorator()
 async def ping_cmd(interaction: discord.Interaction):
-    await interaction.response.send_message("Pong 🏓")
+    if isinstance(bot, commands.AutoShardedBot):
+        here = interaction.guild.shard_id if interaction.guild else None
+        lines = [f"Pong 🏓 — {len(bot.latencies)} shard(s) dans ce processus"]
+        for sid, lat in sorted(bot.latencies):
+            state = "✅" if sid in _shards_ready else "⏳"
+            mark = " ← ce serveur" if sid == here else ""
+            lines.append(f"{state} shard **{sid}** : {lat*1000:.0f} ms{mark}")
+        await interaction.response.send_message("\n".join(lines))
+    else:
+        await interaction.response.send_message(f"Pong 🏓 ({bot.latency*1000:.0f} ms)")
 
 @tree.command(name="addpoints", description="Ajouter des points à un membre (admin).")
 @guilds_decorator()
@@ -2827,7 +4386,7 @@ async def ping_cmd(interaction: discord.Interaction):
 @app_commands.checks.has_permissions(administrator=True)
 @app_commands.describe(membre="Le membre à créditer", points="Nombre de points à ajouter (>=1)")
 async def addpoints_cmd(interaction: discord.Interaction, membre: discord.Member, points: app_commands.Range[int, 1, 1_000_000]):
-    new_total = await add_points(membre.id, int(points))
+    new_total = await add_points(membre.id, int(points), reason="admin.addpoints", ref=str(interaction.user.id))
     await interaction.response.send_message(f"✅ **{membre.display_name}** a maintenant **{new_total}** points (+{int(points)}).")
     await _send_admin_log(
         interaction.guild,
@@ -2844,7 +4403,7 @@ async def addpoints_cmd(interaction: discord.Interaction, membre: discord.Member
 @app_commands.checks.has_permissions(administrator=True)
 @app_commands.describe(membre="Le membre à débiter", points="Nombre de points à retirer (>=1)")
 async def removepoints_cmd(interaction: discord.Interaction, membre: discord.Member, points: app_commands.Range[int, 1, 1_000_000]):
-    new_total = await remove_points(membre.id, int(points))
+    new_total = await remove_points(membre.id, int(points), reason="admin.removepoints", ref=str(interaction.user.id))
     await interaction.response.send_message(f"✅ **{membre.display_name}** a maintenant **{new_total}** points (-{int(points)}).")
     await _send_admin_log(
         interaction.guild,
@@ -2936,14 +4495,284 @@ async def mp_cmd(
 @app_commands.checks.has_permissions(administrator=True)
 @app_commands.describe(membre="Le membre", points="Nouveau solde (>=0)")
 async def setpoints_cmd(interaction: discord.Interaction, membre: discord.Member, points: app_commands.Range[int,0,1_000_000]):
-    async with _points_lock:
-        data = _load_points()
-        data[str(membre.id)] = int(points)
-        _save_points(data)
+    await set_points(membre.id, int(points), reason="admin.setpoints", ref=str(interaction.user.id))
     await interaction.response.send_message(f"🧮 Solde de **{membre.display_name}** fixé à **{int(points)}** pts.", ephemeral=True)
     await _send_admin_log(interaction.guild, interaction.user, "setpoints",
                           membre=f"{membre} ({membre.id})", points=int(points))
 
+BULK_CSV_MAX_BYTES = 1_000_000
+
+def _parse_bulk_csv(raw: bytes, default_points: int) -> tuple[Dict[int, int], int]:
+    """
+    Lignes « id[,points] » (id brut ou mention <@id>) ; en-tête et lignes invalides ignorées.
+    Retourne ({user_id: points}, nb de lignes ignorées). Un id répété cumule ses points.
+    """
+    amounts: Dict[int, int] = {}
+    skipped = 0
+    text = raw.decode("utf-8-sig", errors="replace")
+    dialect = csv.excel_tab if text.count("\t") > text.count(",") else csv.excel
+    for n, row in enumerate(csv.reader(io.StringIO(text), dialect)):
+        cells = [c.strip() for c in row]
+        if not cells or not any(cells):
+            continue
+        uid_txt = cells[0].strip("<@!>")
+        if not uid_txt.isdigit():
+            skipped += n > 0  # la première ligne peut être un en-tête
+            continue
+        pts = default_points
+        if len(cells) > 1 and cells[1]:
+            try:
+                pts = int(cells[1])
+            except ValueError:
+                skipped += 1
+                continue
+        if pts <= 0:
+            skipped += 1
+            continue
+        amounts[int(uid_txt)] = amounts.get(int(uid_txt), 0) + pts
+    return amounts, skipped
+
+@tree.command(name="bulkpoints", description="Créditer/débiter des points à tout un rôle, un salon vocal ou un CSV (admin).")
+@guilds_decorator()
+@app_commands.default_permissions(administrator=True)
+@app_commands.checks.has_permissions(administrator=True)
+@app_commands.describe(
+    operation="Ajouter ou retirer",
+    points="Points par membre (>=1) ; un CSV peut préciser un montant par ligne",
+    role="Tous les membres de ce rôle",
+    salon_vocal="Tous les membres connectés à ce salon vocal",
+    fichier="CSV « id,points » (points optionnel)",
+    paliers="Appliquer le multiplicateur de palier aux crédits",
+)
+@app_commands.choices(
+    operation=[
+        app_commands.Choice(name="➕ Ajouter", value="add"),
+        app_commands.Choice(name="➖ Retirer", value="remove"),
+    ]
+)
+async def bulkpoints_cmd(
+    interaction: discord.Interaction,
+    operation: app_commands.Choice[str],
+    points: app_commands.Range[int, 1, 1_000_000],
+    role: Optional[discord.Role] = None,
+    salon_vocal: Optional[discord.VoiceChannel] = None,
+    fichier: Optional[discord.Attachment] = None,
+    paliers: bool = False,
+):
+    sources = [x for x in (role, salon_vocal, fichier) if x is not None]
+    if len(sources) != 1:
+        return await interaction.response.send_message(
+            "❌ Indique exactement une cible : `role`, `salon_vocal` ou `fichier`.", ephemeral=True)
+    await interaction.response.defer(ephemeral=True)
+    guild = interaction.guild
+
+    skipped = 0
+    if fichier is not None:
+        if fichier.size > BULK_CSV_MAX_BYTES:
+            return await interaction.followup.send(
+                f"❌ Fichier trop gros (max {BULK_CSV_MAX_BYTES // 1000} Ko).", ephemeral=True)
+        amounts, skipped = _parse_bulk_csv(await fichier.read(), int(points))
+        source_txt = f"fichier `{fichier.filename}`"
+    else:
+        members = role.members if role is not None else salon_vocal.members
+        amounts = {m.id: int(points) for m in members if not m.bot}
+        source_txt = role.mention if role is not None else salon_vocal.mention
+    if not amounts:
+        return await interaction.followup.send("ℹ️ Aucun membre ciblé.", ephemeral=True)
+
+    sign = 1 if operation.value == "add" else -1
+    deltas: Dict[int, int] = {}
+    for uid, amount in amounts.items():
+        if sign > 0 and paliers:
+            member = guild.get_member(uid) if guild else None
+            if member:
+                amount = int(round(amount * points_multiplier_for(member)))
+        deltas[uid] = sign * amount
+
+    before = {uid: get_points(uid) for uid in deltas}
+    after = await add_points_many(deltas, reason="admin.bulk", ref=str(interaction.user.id))
+    moved = sum(after[uid] - before[uid] for uid in after)
+
+    verb = "crédités" if sign > 0 else "débités"
+    msg = f"✅ **{len(after)}** membre(s) {verb} ({source_txt}) — total **{moved:+d}** pts."
+    if skipped:
+        msg += f"\n⚠️ {skipped} ligne(s) ignorée(s) (id ou montant invalide)."
+    await interaction.followup.send(msg, ephemeral=True)
+    await _send_admin_log(
+        guild, interaction.user, "bulkpoints",
+        operation=operation.value, source=source_txt, membres=len(after),
+        points=int(points), paliers=paliers, total=moved, lignes_ignorees=skipped or None
+    )
+
+# ---------- Export des données (CSV / NDJSON) ----------
+# Partagé par /export (dans un thread) et `python datatool.py export` (hors ligne).
+EXPORT_TABLES: Dict[str, tuple[str, ...]] = {
+    "points":    ("user_id", "points"),
+    "purchases": ("user_id", "item", "count"),
+    "invites":   ("user_id", "invites"),
+    "tickets":   ("user_id", "tickets"),
+    "streaks":   ("user_id", "streak", "last_claim"),
+}
+EXPORT_MAX_BYTES = 8 * 1024 * 1024  # pièce jointe Discord ; au-delà, passer par datatool.py
+
+def _export_source(table: str) -> dict:
+    """
+    Données brutes d'une table, immuables une fois renvoyées ("points" est copié, les autres
+    sont des versions publiées). À appeler depuis la boucle : la résolution d'un instantané
+    peut relire le disque et notifier ses abonnés (_profiles) ; seul le dict part au thread.
+    """
+    if table == "points":
+        _points_ledger.refresh()
+        return dict(_points_ledger.balances)
+    if table == "purchases":
+        return _load_purchases()
+    if table == "invites":
+        return _load_invites().get("counts", {})
+    if table == "tickets":
+        return _load_tickets()
+    if table == "streaks":
+        return _load_daily()
+    raise ValueError(f"table inconnue: {table}")
+
+def _active_since(since_ts: int, daily: dict) -> set[str]:
+    """
+    Utilisateurs avec un mouvement de points ou un /daily (daily = _load_daily()) depuis since_ts.
+    Les segments du journal sont chronologiques : ceux modifiés avant since_ts sont sautés sans lecture.
+    """
+    active: set[str] = set()
+    for path in _ledger_segments(POINTS_LEDGER_PATH) + [POINTS_LEDGER_PATH]:
+        try:
+            if os.path.getmtime(path) < since_ts:
+                continue
+            with open(path, "rb") as f:
+                for line in f:
+                    try:
+                        ts, uid, *_rest = json.loads(line)
+                    except Exception:
+                        continue
+                    if ts >= since_ts:
+                        active.add(str(uid))
+        except FileNotFoundError:
+            continue
+    for uid, st in daily.items():
+        if int(st.get("last", 0)) >= since_ts:
+            active.add(uid)
+    return active
+
+def _export_rows(table: str, src: dict, top: int | None = None, user_ids: set[str] | None = None,
+                 since_ts: int | None = None, daily: dict | None = None):
+    """Lignes (tuples dans l'ordre de EXPORT_TABLES[table]), générées à la demande.
+    Filtre since_ts : passer `daily` (résolu depuis la boucle) si on tourne dans un thread."""
+    keep = user_ids
+    if since_ts is not None:
+        active = _active_since(since_ts, daily if daily is not None else _load_daily())
+        keep = active if keep is None else (keep & active)
+    uids = src.keys() if keep is None else (u for u in src.keys() if u in keep)
+    if table == "purchases":
+        score = lambda u: sum(src[u].values())  # noqa: E731
+    elif table == "streaks":
+        score = lambda u: int(src[u].get("streak", 0))  # noqa: E731
+    else:
+        score = lambda u: int(src[u])  # noqa: E731
+    if top:
+        uids = heapq.nlargest(int(top), uids, key=score)  # O(top) en mémoire
+    for uid in uids:
+        if table == "purchases":
+            for item, count in src[uid].items():
+                yield (uid, item, int(count))
+        elif table == "streaks":
+            last = int(src[uid].get("last", 0))
+            yield (uid, int(src[uid].get("streak", 0)),
+                   datetime.fromtimestamp(last, timezone.utc).isoformat() if last else "")
+        else:
+            yield (uid, int(src[uid]))
+
+def _write_export(fp, table: str, rows, fmt: str = "csv") -> int:
+    """Écrit les lignes au fil de l'eau dans fp (texte) ; retourne le nombre de lignes."""
+    cols = EXPORT_TABLES[table]
+    n = 0
+    if fmt == "ndjson":
+        for row in rows:
+            fp.write(json.dumps(dict(zip(cols, row)), ensure_ascii=False) + "\n")
+            n += 1
+        return n
+    w = csv.writer(fp)
+    w.writerow(cols)
+    for row in rows:
+        w.writerow(row)
+        n += 1
+    return n
+
+def _export_to_file(path: str, table: str, src: dict, fmt: str = "csv", top: int | None = None,
+                    user_ids: set[str] | None = None, since_ts: int | None = None,
+                    daily: dict | None = None) -> int:
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        return _write_export(f, table, _export_rows(table, src, top, user_ids, since_ts, daily), fmt)
+
+@tree.command(name="export", description="Exporter des données économiques en CSV / NDJSON (admin).")
+@guilds_decorator()
+@app_commands.default_permissions(administrator=True)
+@app_commands.checks.has_permissions(administrator=True)
+@app_commands.describe(
+    table="Données à exporter",
+    format="Format du fichier",
+    top="Seulement les N premiers (par solde / total)",
+    role="Seulement les membres de ce rôle",
+    depuis="Seulement les membres actifs depuis cette date (AAAA-MM-JJ, UTC)",
+)
+@app_commands.choices(
+    table=[app_commands.Choice(name=t, value=t) for t in EXPORT_TABLES],
+    format=[
+        app_commands.Choice(name="CSV", value="csv"),
+        app_commands.Choice(name="NDJSON", value="ndjson"),
+    ],
+)
+async def export_cmd(
+    interaction: discord.Interaction,
+    table: app_commands.Choice[str],
+    format: Optional[app_commands.Choice[str]] = None,
+    top: Optional[app_commands.Range[int, 1, 1_000_000]] = None,
+    role: Optional[discord.Role] = None,
+    depuis: Optional[str] = None,
+):
+    fmt = format.value if format else "csv"
+    since_ts = None
+    if depuis:
+        try:
+            since_ts = int(datetime.strptime(depuis.strip(), "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp())
+        except ValueError:
+            return await interaction.response.send_message("❌ Date invalide (format AAAA-MM-JJ).", ephemeral=True)
+    await interaction.response.defer(ephemeral=True)
+
+    user_ids = {str(m.id) for m in role.members} if role is not None else None
+    # Résolu ici, sur la boucle : le thread ne reçoit que des dicts immuables
+    src = _export_source(table.value)
+    daily = _load_daily() if since_ts is not None else None
+    fd, path = tempfile.mkstemp(prefix="export_", suffix=f".{fmt}")
+    os.close(fd)
+    try:
+        def run() -> int:
+            return _export_to_file(path, table.value, src, fmt, top, user_ids, since_ts, daily)
+        n = await asyncio.to_thread(run)  # la boucle continue de servir pendant l'export
+        size = os.path.getsize(path)
+        if size > EXPORT_MAX_BYTES:
+            return await interaction.followup.send(
+                f"❌ Export trop volumineux ({size / 1024 / 1024:.1f} Mo) : affine les filtres "
+                "ou utilise `python datatool.py export` sur l'hôte.", ephemeral=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M")
+        await interaction.followup.send(
+            f"📦 Export **{table.value}** : {n} ligne(s).",
+            file=discord.File(path, filename=f"{table.value}-{stamp}.{fmt}"),
+            ephemeral=True,
+        )
+    finally:
+        try: os.remove(path)
+        except FileNotFoundError: pass
+    await _send_admin_log(
+        interaction.guild, interaction.user, "export",
+        table=table.value, format=fmt, top=top, role=(role.name if role else None), depuis=depuis, lignes=n
+    )
+
 # ---------- Classement paginé ----------
 
 def _medal(idx: int) -> str:
@@ -3135,30 +4964,13 @@ async def classement_cmd(
 @app_commands.describe(membre="(Optionnel) Le membre dont afficher le profil")
 async def profile_cmd(interaction: discord.Interaction, membre: discord.Member | None = None):
     target: discord.Member = membre or interaction.user  # type: ignore
-    uid = str(target.id)
 
-    # --- Données ---
-    async with _points_lock:
-        points_map = _load_points()
-        pts = int(points_map.get(uid, 0))
-
-    async with _purchases_lock:
-        purchases_map = _load_purchases()
-        user_purchases = purchases_map.get(uid, {})
-
-    invites = await _get_invite_count(target.id)
-
-    # Daily (streak + cooldown)
-    last_ts = 0
-    streak = 0
-    try:
-        async with _daily_lock:
-            daily = _load_daily()
-            st = daily.get(uid, {"last": 0, "streak": 0})
-            last_ts = int(st.get("last", 0))
-            streak = int(st.get("streak", 0))
-    except Exception:
-        pass
+    # --- Données (une lecture de l'agrégat) ---
+    prof = _profile_view(target)
+    pts = prof["points"]
+    invites = prof["invites"]
+    last_ts = prof["daily_last"]
+    streak = prof["streak"]
 
     now_ts = int(datetime.now(timezone.utc).timestamp())
     daily_eta_txt = "✅ Disponible"
@@ -3169,23 +4981,14 @@ async def profile_cmd(interaction: discord.Interaction, membre: discord.Member |
             daily_eta_txt = f"⏳ Dans { _format_cooldown(remain) } ( <t:{now_ts + remain}:R> )"
 
     # Achats (aperçu)
-    async with _shop_lock:
-        shop_snapshot = _load_shop()
-
-    top_items = sorted(user_purchases.items(), key=lambda kv: (-int(kv[1]), str(kv[0])))[:6]
-    if top_items:
-        pretty_items = []
-        for key, qty in top_items:
-            it = shop_snapshot.get(key, {})
-            label = it.get("name", key)
-            pretty_items.append(f"• **{label}** × **{qty}**")
-        achats_preview = "\n".join(pretty_items)
+    if prof["purchases_preview"]:
+        achats_preview = "\n".join(f"• **{label}** × **{qty}**" for label, qty in prof["purchases_preview"])
     else:
         achats_preview = "_Aucun achat enregistré_"
-    total_achats = sum(int(v) for v in user_purchases.values()) if user_purchases else 0
+    total_achats = prof["purchases_total"]
 
     # --- Palier & aura ---
-    tier_key, tier_label, tier_perks = tier_info(target)
+    tier_key, tier_label, tier_perks = prof["tier"]
 
     # Couleur de l'embed : OR = doré (aura), sinon couleur du rôle le plus haut si dispo, sinon blurple
     if tier_key == "or":
@@ -3206,6 +5009,7 @@ async def profile_cmd(interaction: discord.Interaction, membre: discord.Member |
     embed.add_field(name="💰 Points", value=f"**{pts}**", inline=True)
     embed.add_field(name="🛒 Achats", value=f"**{total_achats}**", inline=True)
     embed.add_field(name="📨 Invitations", value=f"**{invites}**", inline=True)
+    embed.add_field(name="🎟️ Tickets", value=f"**{prof['tickets']}**", inline=True)
 
     # Daily + streak (0 si grace window dépassée)
     streak_preview = streak
@@ -3248,8 +5052,7 @@ async def profile_cmd(interaction: discord.Interaction, membre: discord.Member |
 @guilds_decorator()
 @app_commands.describe(top="Combien d'utilisateurs afficher (défaut 10)")
 async def topinvites_cmd(interaction: discord.Interaction, top: app_commands.Range[int,1,50]=10):
-    async with _invites_lock:
-        data = _load_invites().get("counts", {})
+    data = _load_invites().get("counts", {})
     if not data:
         return await interaction.response.send_message("Aucune invitation enregistrée.")
     pairs = sorted(((int(uid), c) for uid, c in data.items()), key=lambda x: x[1], reverse=True)[:top]
@@ -3264,122 +5067,50 @@ async def topinvites_cmd(interaction: discord.Interaction, top: app_commands.Ran
 @tree.command(name="boutique", description="Ouvre la boutique pour dépenser tes points.")
 @guilds_decorator()
 async def boutique_cmd(interaction: discord.Interaction):
-    PAGE_SIZE = 5
-
     # --- données fraîches ---
-    async with _points_lock:
-        points_data = _load_points()
-        user_points = int(points_data.get(str(interaction.user.id), 0))
-    async with _shop_lock:
-        shop = _load_shop()
-        
-    user_discount = 0.0
-    if isinstance(interaction.user, discord.Member):
-        user_discount = shop_discount_for(interaction.user)
+    user_points = get_points(interaction.user.id)
+    catalog_version, shop = _shop_catalog()
     # rien en boutique
     if not shop:
         return await interaction.response.send_message("La boutique est vide pour le moment.", ephemeral=True)
 
-    # enrichissement items (reste/limite/achetable)
-    enriched = []
-    for key, it in shop.items():
-        max_per   = int(it.get("max_per_user", -1))
-        already   = await get_user_purchase_count(interaction.user.id, key)
-        remaining = (max_per - already) if max_per >= 0 else -1
-    
-        base_cost = int(it.get("cost", 0))
-        final_cost = max(1, int(round(base_cost * (1.0 - user_discount))))  # <<< remise appliquée
-    
-        affordable = user_points >= final_cost                                 # <<< test avec prix remisé
-        role_id    = int(it.get("role_id", 0))
-    
-        badges = []
-        if role_id:
-            badges.append("🎖 rôle")
-        if max_per >= 0:
-            badges.append(f"🔢 {max_per} max")
-        if remaining == 0:
-            badges.append("⛔ limite atteinte")
-        if user_discount > 0:
-            badges.append(f"💸 -{int(user_discount*100)}%")                    # <<< badge remise
-    
-        enriched.append({
-            "key": key,
-            "name": it.get("name", key),
-            "cost": final_cost,                                               # <<< on stocke le prix remisé
-            "description": (it.get("description") or "").strip(),
-            "role_id": role_id,
-            "max_per": max_per,
-            "already": already,
-            "remaining": remaining,
-            "affordable": affordable,
-            "badges": " • ".join(badges) if badges else "—",
-            "base_cost": base_cost,                                           # (optionnel) pour affichage comparatif
-        })
-
-    # tri par défaut: coût croissant
-    def sort_items(items, mode: str):
-        if mode == "price_desc":
-            return sorted(items, key=lambda x: (-x["cost"], x["name"].lower()))
-        if mode == "name":
-            return sorted(items, key=lambda x: x["name"].lower())
-        if mode == "remaining":
-            # items illimités (= -1) en bas
-            return sorted(items, key=lambda x: (x["remaining"] == -1, x["remaining"] if x["remaining"]!=-1 else 1_000_000))
-        # default price_asc
-        return sorted(items, key=lambda x: (x["cost"], x["name"].lower()))
-
-    # rendu "carte" d'un item
-    def render_card(i, it, balance: int):
-        cost = it["cost"]
-        have = min(balance, cost)
-        filled = int((have / cost) * 10) if cost > 0 else 10
-        bar = "▰" * filled + "▱" * (10 - filled) if cost > 0 else "──────────"
-        lim_txt = "∞" if it["max_per"] < 0 else f"{max(0,it['max_per']-it['already'])}/{it['max_per']}"
-        can_buy = it["affordable"] and (it["remaining"] != 0)
-        status = "🟢 Achetable" if can_buy else ("🟡 Solde insuffisant" if not it["affordable"] else "🔴 Limite atteinte")
-        role_txt = f" | rôle: <@&{it['role_id']}>" if it["role_id"] else ""
-        desc = it["description"] or "_Aucune description_"
-        old = f" ~~{it['base_cost']}~~" if ("base_cost" in it and it["base_cost"] > it["cost"]) else ""
-        cost_line = f"— **{it['cost']}** pts{old}"
-    
-        return (
-    f"""**{i}. {it['name']}** {cost_line}{role_txt}
-    {desc}
-    `{bar}`  •  {status}  •  limite: **{lim_txt}**
-    *{it['badges']}*"""
-        )
-
+    tier = (member_tier_role(interaction.user) or 0) if isinstance(interaction.user, discord.Member) else 0
+    owned = await get_user_purchases(interaction.user.id)
 
-    def page_slice(items, page: int):
-        start = page * PAGE_SIZE
-        return items[start:start+PAGE_SIZE]
-
-    # Vue navigateur
+    # Vue navigateur : pages statiques en cache (_shop_page), solde/achats appliqués par-dessus
     class ShopBrowser(OwnedView):
-        def __init__(self, author_id: int, items: list[dict], page: int = 0, sort_mode: str = "price_asc"):
+        def __init__(self, author_id: int, tier: int, owned: Dict[str, int], balance: int, catalog_version: int,
+                     page: int = 0, sort_mode: str = "price_asc"):
             super().__init__(author_id=author_id, timeout=120)
-            self.items_all = items
+            self.tier = tier
+            self.owned = owned
+            self.balance = balance
+            self.catalog_version = catalog_version
             self.sort_mode = sort_mode
             self.page = page
             self.update_children()
 
         # helpers
+        async def _sync(self, user: discord.User | discord.Member, reload_owned: bool = False):
+            self.balance = get_points(user.id)
+            # /shopadmin a modifié le catalogue depuis l'ouverture : les limites ont pu changer
+            version = _shop_version()
+            if reload_owned or version != self.catalog_version:
+                self.owned = await get_user_purchases(user.id)
+                self.catalog_version = version
+
         async def _render_embed(self, user: discord.User | discord.Member, user_points: int):
-            items_sorted = sort_items(self.items_all, self.sort_mode)
-            page_items = page_slice(items_sorted, self.page)
-            total_pages = max(1, (len(items_sorted)+PAGE_SIZE-1)//PAGE_SIZE)
+            _v, total_pages, page_items = _shop_page(self.tier, self.sort_mode, self.page, self.owned)
             color = discord.Color.green() if user_points > 0 else discord.Color.dark_gray()
             title = f"🛒 Boutique — Page {self.page+1}/{total_pages}"
             remise_txt = ""
-            if isinstance(user, discord.Member):
-                d = shop_discount_for(user)
-                if d > 0:
-                    remise_txt = f" • Remise: **-{int(d*100)}%**"
+            d = float(SHOP_DISCOUNT.get(self.tier, 0.0)) if self.tier else 0.0
+            if d > 0:
+                remise_txt = f" • Remise: **-{int(d*100)}%**"
             desc_top = f"**Solde : {user_points} pts**{remise_txt}\n"
 
             if page_items:
-                lines = [render_card(i, it, user_points) for i, it in enumerate(page_items, start=1)]
+                lines = [_shop_card(i, e, user_points, self.owned) for i, e in enumerate(page_items, start=1)]
                 body = "\n\n".join(lines)
             else:
                 body = "_Aucun item sur cette page._"
@@ -3389,6 +5120,8 @@ async def boutique_cmd(interaction: discord.Interaction):
     
         def update_children(self):
             self.clear_items()
+            _v, total_pages, page_items = _shop_page(self.tier, self.sort_mode, self.page, self.owned)
+            self.page = min(self.page, total_pages - 1)
     
             # --- Select TRI ---
             sort_select = discord.ui.Select(
@@ -3406,26 +5139,24 @@ async def boutique_cmd(interaction: discord.Interaction):
                 self.sort_mode = sort_select.values[0]
                 self.page = 0
                 # recharger le solde pour l'embed
-                async with _points_lock:
-                    d = _load_points()
-                    me_pts = int(d.get(str(interaction_inner.user.id), 0))
+                await self._sync(interaction_inner.user)
                 self.update_children()
-                embed = await self._render_embed(interaction_inner.user, me_pts)
+                embed = await self._render_embed(interaction_inner.user, self.balance)
                 await interaction_inner.response.edit_message(embed=embed, view=self)
     
             sort_select.callback = sort_callback
             self.add_item(sort_select)
     
             # --- Sélecteur d’achat (items page) ---
-            page_items = page_slice(sort_items(self.items_all, self.sort_mode), self.page)
             options = []
-            for idx, it in enumerate(page_items, start=1):
-                label = f"{idx}. {it['name']}"
-                suffix = "" if it["affordable"] and it["remaining"] != 0 else (" (limite)" if it["remaining"]==0 else " (cher)")
+            for idx, e in enumerate(page_items, start=1):
+                remaining, affordable = _shop_overlay(e, self.balance, self.owned)
+                label = f"{idx}. {e['name']}"
+                suffix = "" if affordable and remaining != 0 else (" (limite)" if remaining==0 else " (cher)")
                 options.append(discord.SelectOption(
                     label=label[:100],
-                    description=f"{it['cost']} pts{suffix}"[:100],
-                    value=it["key"]
+                    description=f"{e['cost']} pts{suffix}"[:100],
+                    value=e["key"]
                 ))
             if not options:
                 options = [discord.SelectOption(label="Aucun item sur cette page", value="__none__", default=True)]
@@ -3441,9 +5172,8 @@ async def boutique_cmd(interaction: discord.Interaction):
                 if key == "__none__":
                     return await interaction_inner.response.send_message("Rien à acheter ici 🙂", ephemeral=True)
     
-                async with _shop_lock:
-                    snapshot = _load_shop()
-                    item = snapshot.get(key)
+                snapshot = _load_shop()
+                item = snapshot.get(key)
                 if not item:
                     return await interaction_inner.response.send_message("❌ Cet item n'existe plus.", ephemeral=True)
     
@@ -3451,9 +5181,7 @@ async def boutique_cmd(interaction: discord.Interaction):
                 role_id = int(item.get("role_id", 0))
                 max_per = int(item.get("max_per_user", -1))
                 already = await get_user_purchase_count(interaction_inner.user.id, key)
-                async with _points_lock:
-                    d = _load_points()
-                    me_pts = int(d.get(str(interaction_inner.user.id), 0))
+                me_pts = get_points(interaction_inner.user.id)
                     
                 disc = 0.0
                 if isinstance(interaction_inner.user, discord.Member):
@@ -3497,38 +5225,28 @@ async def boutique_cmd(interaction: discord.Interaction):
             btn_refresh = discord.ui.Button(label="🔄 Actualiser", style=discord.ButtonStyle.secondary)
             btn_close = discord.ui.Button(label="❌ Fermer", style=discord.ButtonStyle.danger)
     
-            total_pages = max(1, (len(self.items_all) + PAGE_SIZE - 1)//PAGE_SIZE)
             btn_prev.disabled = self.page <= 0
             btn_next.disabled = self.page >= (total_pages - 1)
     
             async def prev_callback(interaction_inner: discord.Interaction):
                 self.page = max(0, self.page - 1)
-                async with _points_lock:
-                    d = _load_points()
-                    me_pts = int(d.get(str(interaction_inner.user.id), 0))
+                await self._sync(interaction_inner.user)
                 self.update_children()
-                embed = await self._render_embed(interaction_inner.user, me_pts)
+                embed = await self._render_embed(interaction_inner.user, self.balance)
                 await interaction_inner.response.edit_message(embed=embed, view=self)
     
             async def next_callback(interaction_inner: discord.Interaction):
-                total = max(1, (len(self.items_all) + PAGE_SIZE - 1)//PAGE_SIZE)
-                self.page = min(total - 1, self.page + 1)
-                async with _points_lock:
-                    d = _load_points()
-                    me_pts = int(d.get(str(interaction_inner.user.id), 0))
-                self.update_children()
-                embed = await self._render_embed(interaction_inner.user, me_pts)
+                self.page = min(total_pages - 1, self.page + 1)
+                await self._sync(interaction_inner.user)
+                self.update_children()  # borne la page si le catalogue a rétréci
+                embed = await self._render_embed(interaction_inner.user, self.balance)
                 await interaction_inner.response.edit_message(embed=embed, view=self)
     
             async def refresh_callback(interaction_inner: discord.Interaction):
-                async with _points_lock:
-                    d = _load_points()
-                    me_pts = int(d.get(str(interaction_inner.user.id), 0))
-                # Recalculer "affordable" pour l'état visuel
-                for it in self.items_all:
-                    it["affordable"] = me_pts >= int(it["cost"])
+                # Recharger solde + achats (ex: après un achat) pour l'état visuel
+                await self._sync(interaction_inner.user, reload_owned=True)
                 self.update_children()
-                embed = await self._render_embed(interaction_inner.user, me_pts)
+                embed = await self._render_embed(interaction_inner.user, self.balance)
                 await interaction_inner.response.edit_message(embed=embed, view=self)
     
             async def close_callback(interaction_inner: discord.Interaction):
@@ -3565,9 +5283,7 @@ async def boutique_cmd(interaction: discord.Interaction):
 
         @discord.ui.button(label="Confirmer", style=discord.ButtonStyle.success)
         async def confirm(self, i: discord.Interaction, _):
-            async with _points_lock:
-                d = _load_points()
-                current_pts = int(d.get(str(self.user_id), 0))
+            current_pts = get_points(self.user_id)
             if current_pts < self.final_cost:
                 return await i.response.send_message("❌ Solde insuffisant au moment de la confirmation.", ephemeral=True)
             await _handle_purchase(i, self.key)
@@ -3588,7 +5304,8 @@ async def boutique_cmd(interaction: discord.Interaction):
                     pass
 
     # --- ouverture initiale ---
-    view = ShopBrowser(author_id=interaction.user.id, items=list(enriched), page=0, sort_mode="price_asc")
+    view = ShopBrowser(author_id=interaction.user.id, tier=tier, owned=owned, balance=user_points,
+                       catalog_version=catalog_version, page=0, sort_mode="price_asc")
     embed = await view._render_embed(interaction.user, user_points)
     await interaction.response.send_message(embed=embed, view=view, ephemeral=True)
     # enregistrer le message pour pouvoir le griser au timeout
@@ -3614,9 +5331,8 @@ async def _try_add_role(member: discord.Member, role: discord.Role, reason: str)
 
 async def _handle_purchase(interaction: discord.Interaction, key: str):
     # Item
-    async with _shop_lock:
-        shop = _load_shop()
-        item = shop.get(key)
+    shop = _load_shop()
+    item = shop.get(key)
     if not item:
         return await interaction.response.send_message("❌ Cet item n'existe plus.", ephemeral=True)
 
@@ -3648,17 +5364,13 @@ async def _handle_purchase(interaction: discord.Interaction, key: str):
     cost = max(1, int(round(base_cost * (1.0 - disc))))
     
     # Débit points (avec le coût remisé)
-    async with _points_lock:
-        data = _load_points()
-        user_points = int(data.get(str(interaction.user.id), 0))
-        if user_points < cost:
-            return await interaction.response.send_message(
-                f"❌ Il te manque **{cost - user_points}** points pour acheter **{name}**.",
-                ephemeral=True
-            )
-        remaining = user_points - cost
-        data[str(interaction.user.id)] = remaining
-        _save_points(data)
+    ok, balance = await spend_points(interaction.user.id, cost, reason="shop.purchase", ref=key)
+    if not ok:
+        return await interaction.response.send_message(
+            f"❌ Il te manque **{cost - balance}** points pour acheter **{name}**.",
+            ephemeral=True
+        )
+    remaining = balance
 
     # Récompense + logs
     role_id = int(item.get("role_id", 0))
@@ -3757,7 +5469,7 @@ async def shopadmin_menu(interaction: discord.Interaction):
                     return await modal_interaction.response.send_message("❌ ID de rôle invalide.", ephemeral=True)
 
             async with _shop_lock:
-                shop = _load_shop()
+                shop = _edit_shop()
                 k = str(self.key).strip()
                 if k in shop:
                     return await modal_interaction.response.send_message("❌ Cette clé existe déjà.", ephemeral=True)
@@ -3803,7 +5515,7 @@ async def shopadmin_menu(interaction: discord.Interaction):
                     except Exception:
                         return await mi.response.send_message("❌ Valeur invalide.", ephemeral=True)
                     async with _shop_lock:
-                        shop = _load_shop()
+                        shop = _edit_shop()
                         if key_ctx not in shop:
                             return await mi.response.send_message("❌ Clé introuvable.", ephemeral=True)
                         shop[key_ctx]["cost"] = c
@@ -3833,7 +5545,7 @@ async def shopadmin_menu(interaction: discord.Interaction):
                         except Exception:
                             return await mi.response.send_message("❌ ID invalide.", ephemeral=True)
                     async with _shop_lock:
-                        shop = _load_shop()
+                        shop = _edit_shop()
                         if key_ctx not in shop:
                             return await mi.response.send_message("❌ Clé introuvable.", ephemeral=True)
                         shop[key_ctx]["role_id"] = rid_val
@@ -3858,7 +5570,7 @@ async def shopadmin_menu(interaction: discord.Interaction):
                     except Exception:
                         return await mi.response.send_message("❌ Valeur invalide.", ephemeral=True)
                     async with _shop_lock:
-                        shop = _load_shop()
+                        shop = _edit_shop()
                         if key_ctx not in shop:
                             return await mi.response.send_message("❌ Clé introuvable.", ephemeral=True)
                         shop[key_ctx]["max_per_user"] = lim
@@ -3882,7 +5594,7 @@ async def shopadmin_menu(interaction: discord.Interaction):
 
                 async def on_submit(self, mi: discord.Interaction):
                     async with _shop_lock:
-                        shop = _load_shop()
+                        shop = _edit_shop()
                         if key_ctx not in shop:
                             return await mi.response.send_message("❌ Clé introuvable.", ephemeral=True)
                         shop[key_ctx]["description"] = str(self.desc)
@@ -3911,8 +5623,7 @@ async def shopadmin_menu(interaction: discord.Interaction):
 
         @discord.ui.button(label="✏️ Éditer un item", style=discord.ButtonStyle.primary)
         async def edit_item(self, btn_inter: discord.Interaction, button):
-            async with _shop_lock:
-                shop = _load_shop()
+            shop = _load_shop()
             if not shop:
                 return await btn_inter.response.send_message("La boutique est vide.", ephemeral=True)
 
@@ -3937,8 +5648,7 @@ async def shopadmin_menu(interaction: discord.Interaction):
 
         @discord.ui.button(label="🗑️ Supprimer un item", style=discord.ButtonStyle.secondary)
         async def remove_item(self, btn_inter: discord.Interaction, button):
-            async with _shop_lock:
-                shop = _load_shop()
+            shop = _load_shop()
             if not shop:
                 return await btn_inter.response.send_message("La boutique est vide.", ephemeral=True)
 
@@ -3955,7 +5665,7 @@ async def shopadmin_menu(interaction: discord.Interaction):
                 @discord.ui.button(label="Confirmer", style=discord.ButtonStyle.danger)
                 async def yes(self, ci: discord.Interaction, _):
                     async with _shop_lock:
-                        shop = _load_shop()
+                        shop = _edit_shop()
                         if self.key not in shop:
                             return await ci.response.send_message("❌ Clé introuvable.", ephemeral=True)
                         removed = shop.pop(self.key)
@@ -3987,8 +5697,7 @@ async def shopadmin_menu(interaction: discord.Interaction):
 
         @discord.ui.button(label="📜 Lister les items", style=discord.ButtonStyle.secondary)
         async def list_items(self, btn_inter: discord.Interaction, button):
-            async with _shop_lock:
-                shop = _load_shop()
+            shop = _load_shop()
             if not shop:
                 return await btn_inter.response.send_message("La boutique est vide.", ephemeral=True)
             lines = []
@@ -4013,8 +5722,7 @@ async def shopadmin_menu(interaction: discord.Interaction):
 
                 @discord.ui.button(label="Global", style=discord.ButtonStyle.primary)
                 async def global_stats(self, si, _):
-                    async with _purchases_lock:
-                        p = _load_purchases()
+                    p = _load_purchases()
                     if not p:
                         return await si.response.send_message("ℹ️ Aucun achat enregistré.", ephemeral=True)
                     lines = ["**Achats totaux (par membre) :**"]
@@ -4029,8 +5737,7 @@ async def shopadmin_menu(interaction: discord.Interaction):
 
                 @discord.ui.button(label="Par item", style=discord.ButtonStyle.secondary)
                 async def by_item(self, si, _):
-                    async with _shop_lock:
-                        shop = _load_shop()
+                    shop = _load_shop()
                     if not shop:
                         return await si.response.send_message("La boutique est vide.", ephemeral=True)
                     options = [discord.SelectOption(label=it["name"], value=k) for k, it in list(shop.items())[:25]]
@@ -4041,8 +5748,7 @@ async def shopadmin_menu(interaction: discord.Interaction):
                         @discord.ui.select(placeholder="Choisis un item…", min_values=1, max_values=1, options=options)
                         async def choose(self, pi_i: discord.Interaction, select: Select):
                             key = select.values[0]
-                            async with _purchases_lock:
-                                p = _load_purchases()
+                            p = _load_purchases()
                             found = False
                             lines = []
                             for uid, items in p.items():
@@ -4094,9 +5800,7 @@ async def shopadmin_menu(interaction: discord.Interaction):
                             if not member:
                                 return await mi.response.send_message("❌ Membre introuvable.", ephemeral=True)
 
-                            async with _purchases_lock:
-                                p = _load_purchases()
-                            items = p.get(str(member.id), {})
+                            items = _load_purchases().get(str(member.id), {})
                             if not items:
                                 return await mi.response.send_message("ℹ️ Aucun achat pour ce membre.", ephemeral=True)
                             lines = [f"**Achats de {member.display_name} :**"]
@@ -4131,6 +5835,245 @@ async def shopadmin_menu(interaction: discord.Interaction):
     # Première ouverture
     await interaction.response.send_message("**Panneau admin de la boutique**", view=RootView(), ephemeral=True)
 
+# ---------- Diagnostics (admin) ----------
+# Sections du rapport /metrics : chaque fournisseur renvoie des lignes de texte.
+_METRICS_SECTIONS: list[tuple[str, Callable[[], list[str]]]] = []
+
+def _metrics_section(title: str):
+    def deco(fn):
+        _METRICS_SECTIONS.append((title, fn))
+        return fn
+    return deco
+
+@_metrics_section("Verrous")
+def _lock_metrics_lines() -> list[str]:
+    lines = []
+    for lk in _ALL_LOCKS:
+        st = lk.stats()
+        if not st["acquisitions"]:
+            continue
+        lines.append(
+            f"{st['name']}: n={st['acquisitions']} cont={st['contended']} "
+            f"file={st['waiting']}/{st['max_waiting']} "
+            f"attente avg/p99/max={st['wait_avg_ms']:.1f}/{st['wait_p99_ms']:.1f}/{st['wait_max_ms']:.1f}ms "
+            f"détention avg/p99/max={st['hold_avg_ms']:.1f}/{st['hold_p99_ms']:.1f}/{st['hold_max_ms']:.1f}ms"
+        )
+    return lines or ["(aucune acquisition)"]
+
+@_metrics_section("Écritures disque")
+def _io_metrics_lines() -> list[str]:
+    lines = []
+    for path, (n, size, secs) in sorted(_io_stats.items(), key=lambda kv: -kv[1][1]):
+        lines.append(f"{os.path.basename(path)}: {n} écritures, {size/1024:.0f} Ko, {secs*1000/max(1, n):.1f} ms/écriture")
+    return lines or ["(aucune écriture)"]
+
+@_metrics_section("Journal des points")
+def _ledger_metrics_lines() -> list[str]:
+    size = os.path.getsize(POINTS_LEDGER_PATH) if os.path.exists(POINTS_LEDGER_PATH) else 0
+    balances = _points_ledger.balances or {}
+    return [
+        f"{len(balances)} soldes en mémoire, {_points_ledger.tail_entries} mouvements depuis l'instantané",
+        f"journal courant {size/1024:.0f} Ko (compaction à {POINTS_LEDGER_COMPACT_BYTES/1024:.0f} Ko), "
+        f"{len(_ledger_segments(POINTS_LEDGER_PATH))} segments archivés",
+    ]
+
+@_metrics_section("Calendrier de l'avent")
+def _avent_metrics_lines() -> list[str]:
+    b = _avent_claims
+    if not b.batches:
+        return ["(aucune ouverture)"]
+    return [f"{b.claims} ouvertures en {b.batches} lots (moyenne {b.claims / b.batches:.1f}, max {b.max_batch})"]
+
+@_metrics_section("Instantanés")
+def _snapshot_metrics_lines() -> list[str]:
+    snaps = (_tickets_snapshot, _purchases_snapshot, _invites_snapshot, _daily_snapshot)
+    lines = [f"{os.path.basename(sn.path)}: version {sn.version}, {len(sn.data)} entrées" for sn in snaps]
+    lines.append(f"profils en cache: {len(_profiles.entries)} (hits={_profiles.hits} misses={_profiles.misses})")
+    return lines
+
+def _metrics_report() -> str:
+    parts = []
+    for title, fn in _METRICS_SECTIONS:
+        try:
+            lines = fn()
+        except Exception:
+            logging.exception("Erreur section metrics %s", title)
+            lines = ["(erreur)"]
+        parts.append(f"[{title}]\n" + "\n".join(lines))
+    return "\n\n".join(parts)
+
+class _LoopWatchdog:
+    """
+    Détecte les blocages de la boucle asyncio.
+    - une coroutine "battement" met à jour un horodatage toutes les threshold/4 ;
+    - un thread daemon vérifie cet horodatage ; au-delà du seuil il capture la pile
+      du thread de la boucle + la tâche courante et les écrit dans les logs ;
+    - à la reprise, la durée totale du blocage est rangée dans un top-N.
+    """
+    def __init__(self, threshold_ms: int, top_n: int):
+        self.threshold = max(10, threshold_ms) / 1000
+        self.top_n = max(1, top_n)
+        self.interval = self.threshold / 4
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.loop_thread_id: int | None = None
+        self.last_tick = time.monotonic()
+        self.total_stalls = 0
+        self.worst: list[dict] = []          # trié par durée décroissante
+        self._pending: dict | None = None    # blocage en cours, capturé par le thread
+        self._guard = threading.Lock()
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        if self.loop is not None:
+            return
+        self.loop = loop
+        self.loop_thread_id = threading.get_ident()
+        self.last_tick = time.monotonic()
+        loop.create_task(self._heartbeat())
+        threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = now - self.last_tick - self.interval
+            self.last_tick = now
+            if lag >= self.threshold:
+                with self._guard:
+                    pending, self._pending = self._pending, None
+                self._record(lag, pending)
+
+    def _watch(self):
+        while True:
+            time.sleep(self.interval)
+            lag = time.monotonic() - self.last_tick
+            if lag < self.threshold + self.interval:
+                continue
+            try:
+                with self._guard:
+                    if self._pending is not None:
+                        continue
+                    # copie locale : _heartbeat peut remettre _pending à None dès la sortie du verrou
+                    pending = self._pending = self._capture()
+                logging.warning(
+                    "Boucle bloquée depuis %.0f ms — tâche: %s\n%s",
+                    lag * 1000, pending["task"], pending["stack"],
+                )
+            except Exception:
+                # le thread doit survivre : sinon plus aucune détection, sans le moindre signe
+                logging.exception("Erreur loop-watchdog")
+
+    def _capture(self) -> dict:
+        frame = sys._current_frames().get(self.loop_thread_id or 0)
+        stack = "".join(traceback.format_stack(frame)) if frame else "(pile indisponible)"
+        task_name = None
+        try:
+            task = asyncio.current_task(self.loop)
+            if task is not None:
+                task_name = task.get_name()
+                coro = task.get_coro()
+                task_name += f" ({getattr(coro, '__qualname__', coro)})"
+        except Exception:
+            pass
+        top = "?"
+        if frame is not None:
+            top = f"{frame.f_code.co_name}:{frame.f_lineno}"
+        return {"stack": stack, "task": task_name, "where": top}
+
+    def _record(self, duration: float, pending: dict | None):
+        self.total_stalls += 1
+        entry = {
+            "duration_ms": duration * 1000,
+            "at": datetime.now(timezone.utc),
+            "where": (pending or {}).get("where", "?"),
+            "task": (pending or {}).get("task"),
+            "stack": (pending or {}).get("stack", ""),
+        }
+        logging.warning("Blocage boucle terminé : %.0f ms (%s)", entry["duration_ms"], entry["where"])
+        self.worst.append(entry)
+        self.worst.sort(key=lambda e: -e["duration_ms"])
+        del self.worst[self.top_n:]
+
+    def reset(self):
+        self.total_stalls = 0
+        self.worst.clear()
+
+_loop_watchdog = _LoopWatchdog(LOOP_STALL_THRESHOLD_MS, LOOP_STALL_TOP_N)
+
+@_metrics_section("Boucle asyncio")
+def _stall_metrics_lines() -> list[str]:
+    wd = _loop_watchdog
+    lines = [f"seuil={wd.threshold*1000:.0f}ms blocages={wd.total_stalls}"]
+    for e in wd.worst[:5]:
+        lines.append(f"{e['duration_ms']:.0f}ms @ {e['where']} ({e['at']:%Y-%m-%d %H:%M:%S})")
+    return lines
+
+@tree.command(name="stalls", description="(admin) Pires blocages de la boucle asyncio.")
+@guilds_decorator()
+@app_commands.default_permissions(administrator=True)
+@app_commands.checks.has_permissions(administrator=True)
+@app_commands.describe(reset="Vider le classement après affichage")
+async def stalls_cmd(interaction: discord.Interaction, reset: bool = False):
+    wd = _loop_watchdog
+    embed = discord.Embed(
+        title="🐢 Blocages de la boucle",
+        description=f"Seuil **{wd.threshold*1000:.0f} ms** • blocages détectés : **{wd.total_stalls}**",
+        color=discord.Color.dark_orange(),
+    )
+    for idx, e in enumerate(wd.worst, 1):
+        ts = int(e["at"].timestamp())
+        # Les dernières lignes de la pile sont les plus utiles (là où ça bloque)
+        tail = "\n".join(e["stack"].strip().splitlines()[-6:])
+        value = f"<t:{ts}:R> • `{e['where']}`" + (f" • tâche `{e['task']}`" if e["task"] else "")
+        if tail:
+            value += f"\n```{tail[-800:]}```"
+        embed.add_field(name=f"#{idx} — {e['duration_ms']:.0f} ms", value=value[:1024], inline=False)
+    if not wd.worst:
+        embed.add_field(name="—", value="_Aucun blocage enregistré._", inline=False)
+    if reset:
+        wd.reset()
+        embed.set_footer(text="Classement vidé.")
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+@tree.command(name="lockstats", description="(admin) Contention des verrous internes.")
+@guilds_decorator()
+@app_commands.default_permissions(administrator=True)
+@app_commands.checks.has_permissions(administrator=True)
+@app_commands.describe(reset="Remettre les compteurs à zéro après affichage")
+async def lockstats_cmd(interaction: discord.Interaction, reset: bool = False):
+    embed = discord.Embed(title="🔒 Verrous — contention", color=discord.Color.dark_teal())
+    rows = sorted((lk.stats() for lk in _ALL_LOCKS), key=lambda st: -st["wait_max_ms"])
+    for st in rows[:25]:
+        value = (
+            f"acq **{st['acquisitions']}** • contendues **{st['contended']}** • file {st['waiting']} (max {st['max_waiting']})\n"
+            f"attente avg {st['wait_avg_ms']:.1f} / p99 {st['wait_p99_ms']:.1f} / max {st['wait_max_ms']:.1f} ms"
+            + (f" (`{st['wait_max_site']}`)" if st["wait_max_site"] else "") + "\n"
+            f"détention avg {st['hold_avg_ms']:.1f} / p99 {st['hold_p99_ms']:.1f} / max {st['hold_max_ms']:.1f} ms"
+            + (f" (`{st['hold_max_site']}`)" if st["hold_max_site"] else "")
+        )
+        if st["holder_site"]:
+            value += f"\n🔐 détenu par `{st['holder_site']}`"
+        embed.add_field(name=st["name"], value=value[:1024], inline=False)
+    if reset:
+        for lk in _ALL_LOCKS:
+            lk.reset()
+        embed.set_footer(text="Compteurs remis à zéro.")
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+@tree.command(name="metrics", description="(admin) Rapport de performance interne.")
+@guilds_decorator()
+@app_commands.default_permissions(administrator=True)
+@app_commands.checks.has_permissions(administrator=True)
+async def metrics_cmd(interaction: discord.Interaction):
+    report = _metrics_report()
+    if len(report) > 1900:
+        await interaction.response.send_message(
+            "📈 Rapport complet en pièce jointe.",
+            file=discord.File(io.BytesIO(report.encode("utf-8")), filename="metrics.txt"),
+            ephemeral=True,
+        )
+    else:
+        await interaction.response.send_message(f"```\n{report}\n```", ephemeral=True)
+
 # ---------- Erreurs commandes ----------
 @tree.error
 async def on_app_command_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
@@ -4196,29 +6139,12 @@ async def on_reaction_add(reaction, user):
     if author.bot:
         return
 
-    # Charger les quêtes
-    qcfg = _load_quests()
-    async with _quests_progress_lock:
-        pdb = _load_quests_progress()
-        date_key = _today_str()
-        week_key = _week_str()
-
-        # --- Cas 1 : réaction d’un modérateur
-        if any(r.permissions.administrator or r.permissions.manage_messages for r in user.roles):
-            for qkey, q in qcfg.get("daily", {}).items():
-                if q.get("type") == "reaction_mod":
-                    slot = _ensure_user_quest_slot(pdb, "daily", date_key, message.guild.id, author.id, qkey)
-                    slot["progress"] = min(q["target"], slot.get("progress", 0) + 1)
-
-        # --- Cas 2 : total de réactions sur un message
-        total_reacts = sum(r.count for r in message.reactions)
-        for qkey, q in qcfg.get("daily", {}).items():
-            if q.get("type") == "reaction_total":
-                if total_reacts >= q["target"]:
-                    slot = _ensure_user_quest_slot(pdb, "daily", date_key, message.guild.id, author.id, qkey)
-                    slot["progress"] = q["target"]
-
-        _save_quests_progress(pdb)
+    # reaction_mod : réaction d’un modérateur ; reaction_total : total de réactions sur le message
+    await _quest_event(
+        message.guild.id, author.id, "reaction",
+        from_mod=any(r.permissions.administrator or r.permissions.manage_messages for r in user.roles),
+        total=sum(r.count for r in message.reactions),
+    )
 
 @bot.event
 async def on_invite_create(invite: discord.Invite):
@@ -4259,38 +6185,7 @@ async def on_voice_state_update(member: discord.Member, before: discord.VoiceSta
                 delta_secs = max(0, now - start)
                 delta_min = delta_secs // 60
                 if delta_min > 0:
-                    date_key = _today_str()
-                    week_key = _week_str()
-                    async with _quests_progress_lock:
-                        pdb  = _load_quests_progress()
-                        qcfg = _load_quests()
-                        
-                        # <-- récupère les quêtes assignées (sets de clés)
-                        assigned_daily  = _ensure_assignments(pdb, qcfg, "daily",  date_key, guild.id, member.id)
-                        assigned_weekly = _ensure_assignments(pdb, qcfg, "weekly", week_key,  guild.id, member.id)
-
-                        # DAILY
-                        for qkey, q in qcfg.get("daily", {}).items():
-                            if q.get("type") == "voice_minutes" and qkey in assigned_daily:
-                                slot = _ensure_user_quest_slot(pdb, "daily", date_key, guild.id, member.id, qkey)
-                                slot["progress"] = int(slot.get("progress", 0)) + int(delta_min)
-                    
-                        # WEEKLY
-                        for qkey, q in qcfg.get("weekly", {}).items():
-                            if q.get("type") == "voice_minutes" and qkey in assigned_weekly:
-                                slot = _ensure_user_quest_slot(pdb, "weekly", week_key, guild.id, member.id, qkey)
-                                slot["progress"] = int(slot.get("progress", 0)) + int(delta_min)
-                    
-                        # ✅ Lifetime: voice_minutes
-                        for qkey, q in qcfg.get("lifetime", {}).items():
-                            if q.get("type") == "voice_minutes":
-                                slot = _ensure_user_quest_slot(
-                                    pdb, "lifetime", LIFETIME_PERIOD_KEY, guild.id, member.id, qkey
-                                )
-                                target = int(q.get("target", 0))
-                                slot["progress"] = min(target, int(slot.get("progress", 0)) + int(delta_min))
-                                
-                        _save_quests_progress(pdb)
+                    await _quest_event(guild.id, member.id, "voice", minutes=int(delta_min))
 
         # Changement de salon vocal (on clôture + rouvre pour être simple)
         elif was_in and now_in and before.channel != after.channel:
@@ -4299,38 +6194,7 @@ async def on_voice_state_update(member: discord.Member, before: discord.VoiceSta
                 delta_secs = max(0, now - start)
                 delta_min = delta_secs // 60
                 if delta_min > 0:
-                    date_key = _today_str()
-                    week_key = _week_str()
-                    async with _quests_progress_lock:
-                        pdb  = _load_quests_progress()
-                        qcfg = _load_quests()
-                    
-                        # <-- récupère les quêtes assignées (sets de clés)
-                        assigned_daily  = _ensure_assignments(pdb, qcfg, "daily",  date_key, guild.id, member.id)
-                        assigned_weekly = _ensure_assignments(pdb, qcfg, "weekly", week_key,  guild.id, member.id)
-                    
-                        # DAILY
-                        for qkey, q in qcfg.get("daily", {}).items():
-                            if q.get("type") == "voice_minutes" and qkey in assigned_daily:
-                                slot = _ensure_user_quest_slot(pdb, "daily", date_key, guild.id, member.id, qkey)
-                                slot["progress"] = int(slot.get("progress", 0)) + int(delta_min)
-                    
-                        # WEEKLY
-                        for qkey, q in qcfg.get("weekly", {}).items():
-                            if q.get("type") == "voice_minutes" and qkey in assigned_weekly:
-                                slot = _ensure_user_quest_slot(pdb, "weekly", week_key, guild.id, member.id, qkey)
-                                slot["progress"] = int(slot.get("progress", 0)) + int(delta_min)
-
-                         # ✅ Lifetime: voice_minutes
-                        for qkey, q in qcfg.get("lifetime", {}).items():
-                            if q.get("type") == "voice_minutes":
-                                slot = _ensure_user_quest_slot(
-                                    pdb, "lifetime", LIFETIME_PERIOD_KEY, guild.id, member.id, qkey
-                                )
-                                target = int(q.get("target", 0))
-                                slot["progress"] = min(target, int(slot.get("progress", 0)) + int(delta_min))
-                                
-                        _save_quests_progress(pdb)
+                    await _quest_event(guild.id, member.id, "voice", minutes=int(delta_min))
             # nouvelle session dans le nouveau salon
             _voice_sessions[key] = now
 
@@ -4339,24 +6203,60 @@ async def on_voice_state_update(member: discord.Member, before: discord.VoiceSta
 
 @bot.event
 async def setup_hook():
-    if GUILD_ID:
+    if SHARD_COUNT > 0 and SHARD_IDS is not None and 0 not in SHARD_IDS:
+        # Un seul processus synchronise l'arbre de commandes (celui du shard 0)
+        logging.info("Shards %s : synchronisation des commandes laissée au shard 0", SHARD_IDS)
+    elif GUILD_ID:
         cmds = await tree.sync(guild=discord.Object(id=GUILD_ID))
         logging.info("Synced %d cmd(s) pour la guilde %s", len(cmds), GUILD_ID)
     else:
         cmds = await tree.sync()
         logging.info("Synced %d cmd(s) globales", len(cmds))
 
+    _loop_watchdog.start(asyncio.get_running_loop())
     asyncio.create_task(quests_midnight_rollover())
     asyncio.create_task(streak_monitor())
+    asyncio.create_task(points_ledger_compactor())
+    asyncio.create_task(activity_flusher())
+    _load_assignments()
+    asyncio.create_task(asyncio.to_thread(_points_history.sync))  # index /historique construit d'avance
 
 @bot.event
 async def on_ready():
     logging.info("Connecté en tant que %s (%s)", bot.user, bot.user.id)  # type: ignore
-    # Précharger le cache d’invites pour toutes les guildes
+    # Nouvelle session : des mises à jour de rôles ont pu être manquées pendant la coupure,
+    # les paliers seront recalculés à la demande
+    _tier_cache.clear()
+    # Précharger le cache d’invites pour toutes les guildes, à chaque ready : après une
+    # ré-identification, des arrivées ont pu être manquées et le cache serait périmé
     for g in bot.guilds:
         await _refresh_invite_cache(g)
     logging.info("Prêt.")
 
+@bot.event
+async def on_shard_ready(shard_id: int):
+    # Chaque shard charge les invites de SES guildes dès qu'il est prêt
+    guilds = [g for g in bot.guilds if g.shard_id == shard_id]
+    for g in guilds:
+        _tier_cache.pop(g.id, None)  # nouvelle session : des mises à jour de rôles ont pu être manquées
+        await _refresh_invite_cache(g)
+    _shards_ready.add(shard_id)
+    logging.info("Shard %s prêt (%d guilde(s)).", shard_id, len(guilds))
+
+@bot.event
+async def on_shard_disconnect(shard_id: int):
+    _shards_ready.discard(shard_id)
+
+@bot.event
+async def on_shard_resumed(shard_id: int):
+    # RESUME : la session continue (événements manqués rejoués), rien à recharger
+    _shards_ready.add(shard_id)
+
+@bot.event
+async def on_guild_remove(guild: discord.Guild):
+    _invite_cache.pop(guild.id, None)
+    _tier_cache.pop(guild.id, None)
+
 @bot.event
 async def on_guild_join(guild: discord.Guild):
     await _refresh_invite_cache(guild)
@@ -4364,28 +6264,22 @@ async def on_guild_join(guild: discord.Guild):
 @bot.event
 async def on_member_update(before: discord.Member, after: discord.Member):
     """Détecte quand un membre commence à booster le serveur pour la quête lifetime."""
+    if before.roles != after.roles:
+        _tier_cache.setdefault(after.guild.id, {})[after.id] = _compute_tier_role(after)
     try:
         # Le membre commence à booster ce serveur
         if before.premium_since is None and after.premium_since is not None:
-            guild = after.guild
-
-            async with _quests_progress_lock:
-                pdb  = _load_quests_progress()
-                qcfg = _load_quests()
-
-                # On marque toutes les quêtes lifetime de type "server_boost" comme faites
-                for qkey, q in qcfg.get("lifetime", {}).items():
-                    if q.get("type") != "server_boost":
-                        continue
-                    slot = _ensure_user_quest_slot(pdb, "lifetime", LIFETIME_PERIOD_KEY, guild.id, after.id, qkey)
-                    # On met au moins 1 de progression (pour target=1)
-                    slot["progress"] = max(int(slot.get("progress", 0)), 1)
-
-                _save_quests_progress(pdb)
+            await _quest_event(after.guild.id, after.id, "boost")
 
     except Exception:
         logging.exception("Erreur on_member_update / server_boost quest")
 
+@bot.event
+async def on_guild_role_delete(role: discord.Role):
+    # Un rôle de palier supprimé change le palier de tous ses membres
+    if role.id in (OR, ARGENT, BRONZE):
+        _tier_cache.pop(role.guild.id, None)
+
 @bot.event
 async def on_member_join(member: discord.Member):
     guild = member.guild
@@ -4394,7 +6288,7 @@ async def on_member_join(member: discord.Member):
     # re-fetch après le join — avec retries pour laisser le temps à l’API de propager les uses
     code = None
     inviter_id = None
-    for delay in (0.5, 1.5, 3.0):  # 3 tentatives espacées
+    for delay in _INVITE_DETECT_DELAYS:  # 3 tentatives espacées
         await asyncio.sleep(delay)
         await _refresh_invite_cache(guild)
         after = _invite_cache.get(guild.id, {})
@@ -4413,42 +6307,9 @@ async def on_member_join(member: discord.Member):
 
     if inviter_id:
         total = await _add_invite_for(inviter_id, member.id)
-        # Quêtes 'invites' (daily + weekly) pour l'invitant
+        # Quêtes 'invites' (daily + weekly + lifetime) pour l'invitant
         try:
-            date_key = _today_str()
-            week_key = _week_str()
-            # … après avoir trouvé inviter_id …
-            async with _quests_progress_lock:
-                pdb  = _load_quests_progress()
-                qcfg = _load_quests()
-            
-                date_key = _today_str()
-                week_key = _week_str()
-            
-                assigned_daily  = _ensure_assignments(pdb, qcfg, "daily",  date_key, member.guild.id, inviter_id, k=3)
-                assigned_weekly = _ensure_assignments(pdb, qcfg, "weekly", week_key,  member.guild.id, inviter_id, k=3)
-            
-                for qkey, q in qcfg.get("daily", {}).items():
-                    if qkey in assigned_daily and q.get("type") == "invites":
-                        slot = _ensure_user_quest_slot(pdb, "daily", date_key, member.guild.id, inviter_id, qkey)
-                        slot["progress"] = int(slot.get("progress", 0)) + 1
-            
-                for qkey, q in qcfg.get("weekly", {}).items():
-                    if qkey in assigned_weekly and q.get("type") == "invites":
-                        slot = _ensure_user_quest_slot(pdb, "weekly", week_key, member.guild.id, inviter_id, qkey)
-                        slot["progress"] = int(slot.get("progress", 0)) + 1
-                
-                # ✅ Lifetime: invites
-                for qkey, q in qcfg.get("lifetime", {}).items():
-                    if q.get("type") == "invites":
-                        slot = _ensure_user_quest_slot(
-                            pdb, "lifetime", LIFETIME_PERIOD_KEY, guild.id, inviter_id, qkey
-                        )
-                        target = int(q.get("target", 0))
-                        slot["progress"] = min(target, int(slot.get("progress", 0)) + 1)
-                        
-                _save_quests_progress(pdb)
-
+            await _quest_event(guild.id, inviter_id, "invite")
         except Exception:
             logging.exception("Erreur incrément quêtes invites")
 
@@ -4470,7 +6331,7 @@ async def on_member_join(member: discord.Member):
                     mul = points_multiplier_for(inviter) if inviter else 1.0
                 
                     gained_pts = int(round(INVITE_REWARD_POINTS * mul))
-                    new_total_pts = await add_points(inviter_id, gained_pts)
+                    new_total_pts = await add_points(inviter_id, gained_pts, reason="invite", ref=str(member.id))
                 
                     # 🎟️ +1 ticket à chaque premier join crédité
                     new_total_tickets = await add_tickets(inviter_id, 1)
@@ -4528,6 +6389,7 @@ async def on_member_join(member: discord.Member):
 @bot.event
 async def on_member_remove(member: discord.Member):
     guild = member.guild
+    _tier_cache.get(guild.id, {}).pop(member.id, None)
     inviter_id, new_total = await _remove_invite_for_member(member.id)
     actor = bot.user or member  # pour le log
 
@@ -4612,92 +6474,10 @@ async def on_message(message: discord.Message):
 
     # --- Quêtes: compter les messages en serveur ---
     if message.guild:
-        date_key = _today_str()
-        week_key = _week_str()
-        # dans on_message (partie "Quêtes: compter les messages en serveur")
-        async with _quests_progress_lock:
-            pdb  = _load_quests_progress()
-            qcfg = _load_quests()
-        
-            # Assigner si besoin
-            assigned_daily  = _ensure_assignments(pdb, qcfg, "daily",  date_key, message.guild.id, message.author.id, k=3)
-            assigned_weekly = _ensure_assignments(pdb, qcfg, "weekly", week_key,  message.guild.id, message.author.id, k=3)
-        
-            # DAILY
-            for qkey, q in qcfg.get("daily", {}).items():
-                if qkey not in assigned_daily:
-                    continue
-                qtype = q.get("type")
-            
-                if qtype == "messages":
-                    slot = _ensure_user_quest_slot(pdb, "daily", date_key, message.guild.id, message.author.id, qkey)
-                    slot["progress"] = int(slot.get("progress", 0)) + 1
-            
-                elif qtype == "message_exact":
-                    wanted = str(q.get("text", "")).strip()
-                    if wanted and message.content.strip() == wanted:
-                        ch_ok = True
-                        cid = q.get("channel_id")
-                        if cid:
-                            ch_ok = (int(cid) == message.channel.id)
-                        if ch_ok:
-                            slot = _ensure_user_quest_slot(pdb, "daily", date_key, message.guild.id, message.author.id, qkey)
-                            slot["progress"] = min(1, int(slot.get("progress", 0)) + 1)
-            
-                elif qtype == "messages_time_window":
-                    # Fenêtre horaire locale, ex: 22 -> 2 en Europe/Paris
-                    tz_name   = str(q.get("tz", "UTC"))
-                    start_h   = int(q.get("start_hour", 0))
-                    end_h     = int(q.get("end_hour", 0))
-                    target    = int(q.get("target", 1))
-            
-                    # created_at est en UTC (aware) -> converti dans le fuseau demandé
-                    local_dt  = message.created_at.astimezone(ZoneInfo(tz_name))
-                    hour      = local_dt.hour
-            
-                    if start_h == end_h:
-                        in_window = True  # toute la journée (cas limite)
-                    elif start_h < end_h:
-                        # fenêtre simple, ex 10 -> 18
-                        in_window = (start_h <= hour < end_h)
-                    else:
-                        # fenêtre chevauchant minuit, ex 22 -> 2
-                        in_window = (hour >= start_h or hour < end_h)
-            
-                    if in_window:
-                        slot = _ensure_user_quest_slot(pdb, "daily", date_key, message.guild.id, message.author.id, qkey)
-                        slot["progress"] = min(target, int(slot.get("progress", 0)) + 1)
-
-            # WEEKLY
-            for qkey, q in qcfg.get("weekly", {}).items():
-                if qkey not in assigned_weekly:
-                    continue
-                qtype = q.get("type")
-                if qtype == "messages":
-                    slot = _ensure_user_quest_slot(pdb, "weekly", week_key, message.guild.id, message.author.id, qkey)
-                    slot["progress"] = int(slot.get("progress", 0)) + 1
-                elif qtype == "message_exact":
-                    wanted = str(q.get("text", "")).strip()
-                    if wanted and message.content.strip() == wanted:
-                        ch_ok = True
-                        cid = q.get("channel_id")
-                        if cid:
-                            ch_ok = (int(cid) == message.channel.id)
-                        if ch_ok:
-                            slot = _ensure_user_quest_slot(pdb, "weekly", week_key, message.guild.id, message.author.id, qkey)
-                            slot["progress"] = min(1, int(slot.get("progress", 0)) + 1)
-
-            # ✅ Lifetime: messages
-            for qkey, q in qcfg.get("lifetime", {}).items():
-                if q.get("type") == "messages":
-                    slot = _ensure_user_quest_slot(
-                        pdb, "lifetime", LIFETIME_PERIOD_KEY, message.guild.id, message.author.id, qkey
-                    )
-                    target = int(q.get("target", 0))
-                    slot["progress"] = min(target, int(slot.get("progress", 0)) + 1)
-
-            _save_quests_progress(pdb)
-
+        await _quest_event(
+            message.guild.id, message.author.id, "message",
+            content=message.content, channel_id=message.channel.id, ts=message.created_at.timestamp(),
+        )
 
     # Propager aux autres commandes
     await bot.process_commands(message)
@@ -4712,37 +6492,16 @@ async def quests_midnight_rollover():
             if now_day != last_day:
                 # On ferme proprement toutes les sessions vocales ouvertes (créditées sur "hier").
                 now_ts = int(datetime.now(timezone.utc).timestamp())
-                closings = list(_voice_sessions.items())
-                _voice_sessions.clear()
-                if closings:
-                    async with _quests_progress_lock:
-                        pdb  = _load_quests_progress()
-                        qcfg = _load_quests()
-                
-                        # last_day est déjà défini au-dessus
-                        y, m, d = map(int, last_day.split("-"))
-                        from datetime import date as _date
-                        iso_year, iso_week, _ = _date(y, m, d).isocalendar()
-                        last_week = f"{iso_year}-W{iso_week:02d}"
-                
-                        for (guild_id, user_id), start in closings:
-                            delta_min = max(0, (now_ts - start) // 60)
-                            if delta_min <= 0:
-                                continue
-                            # DAILY -> veille (last_day)
-                            assigned_daily  = _ensure_assignments(pdb, "daily",  last_day,  guild_id, user_id)
-                            for qkey, q in qcfg.get("daily", {}).items():
-                                if q.get("type") == "voice_minutes" and qkey in assigned_daily:
-                                    slot = _ensure_user_quest_slot(pdb, "daily", last_day, guild_id, user_id, qkey)
-                                    slot["progress"] = int(slot.get("progress", 0)) + int(delta_min)
-                            
-                            # WEEKLY -> semaine de la veille (last_week)
-                            assigned_weekly = _ensure_assignments(pdb, "weekly", last_week, guild_id, user_id)
-                            for qkey, q in qcfg.get("weekly", {}).items():
-                                if q.get("type") == "voice_minutes" and qkey in assigned_weekly:
-                                    slot = _ensure_user_quest_slot(pdb, "weekly", last_week, guild_id, user_id, qkey)
-                                    slot["progress"] = int(slot.get("progress", 0)) + int(delta_min)
-                        _save_quests_progress(pdb)
+                closings = [(k, v) for k, v in _voice_sessions.items() if _owns_guild(k[0])]
+                for k, _start in closings:
+                    _voice_sessions.pop(k, None)
+                if closings and _quest_has_subscribers("voice"):
+                    for (guild_id, user_id), start in closings:
+                        delta_min = max(0, (now_ts - start) // 60)
+                        if delta_min <= 0:
+                            continue
+                        # minutes créditées sur la veille (donc aussi sur la semaine de la veille)
+                        _activity_log.record(guild_id, user_id, "voice", {"minutes": int(delta_min)}, day=last_day)
                 last_day = now_day
         except Exception:
             logging.exception("Erreur quests_midnight_rollover")
@@ -4751,13 +6510,16 @@ async def quests_midnight_rollover():
 async def streak_monitor():
     """Vérifie régulièrement les streaks daily et prévient les utilisateurs."""
     await bot.wait_until_ready()
+    if not _runs_global_tasks():
+        logging.info("streak_monitor : géré par un autre processus (shards %s)", SHARD_IDS)
+        return
     while not bot.is_closed():
         try:
-            async with _daily_lock:
-                daily = _load_daily()
+            daily = _load_daily()
 
             now_ts = int(datetime.now(timezone.utc).timestamp())
-            updated = False
+            # uid -> (last lu, nouvel état) : réappliqué sur une relecture fraîche à la fin
+            changes: Dict[str, tuple[int, dict]] = {}
 
             for uid, state in list(daily.items()):
                 last = int(state.get("last", 0))
@@ -4783,21 +6545,25 @@ async def streak_monitor():
                             await user.send("⚠️ **Votre daily streak expire bientôt !** (~30 min restantes) ⏰")
                         except Exception:
                             pass
-                        state["warned"] = True
-                        updated = True
+                        changes[uid] = (last, {"last": last, "streak": streak, "warned": True})
 
                 # 💀 Expiration
                 elif elapsed >= STREAK_GRACE:
-                    daily[uid] = {"last": last, "streak": 0, "warned": False}
-                    updated = True
+                    changes[uid] = (last, {"last": last, "streak": 0, "warned": False})
                     try:
                         await user.send("💀 **Votre daily streak a expiré !** Tu repars à 0 😿")
                     except Exception:
                         pass
 
-            if updated:
+            if changes:
+                # Relecture sous verrou : un /daily pris entre-temps (ici ou dans un autre
+                # processus) a changé "last" et ne doit pas être écrasé.
                 async with _daily_lock:
-                    _save_daily(daily)
+                    fresh = dict(_load_daily())
+                    for uid, (seen_last, new_state) in changes.items():
+                        if int(fresh.get(uid, {}).get("last", 0)) == seen_last:
+                            fresh[uid] = new_state
+                    _save_daily(fresh, changed=changes.keys())
 
         except Exception as e:
             logging.exception("Erreur dans streak_monitor: %s", e)
@@ -4806,7 +6572,113 @@ async def streak_monitor():
         await asyncio.sleep(60)
 
 # ---------- Run ----------
+# ---------- Schéma des fichiers de données (migrations) ----------
+# Les anciens formats sont convertis une seule fois au démarrage, puis la version est notée
+# dans schema.json : les _load_* n'ont plus qu'à parser. Une migration reçoit le contenu brut
+# du fichier et renvoie le contenu au format de la version suivante.
+
+def _migrate_points_v1(raw: dict) -> dict:
+    return {str(k): int(v) for k, v in raw.items()}
+
+def _migrate_purchases_v1(raw: dict) -> dict:
+    return {str(uid): {str(k): int(v) for k, v in items.items()} for uid, items in raw.items()}
+
+def _migrate_invites_v1(raw: dict) -> dict:
+    return {
+        "counts": {str(k): int(v) for k, v in raw.get("counts", {}).items()},
+        "refs": {str(k): int(v) for k, v in raw.get("refs", {}).items()},
+    }
+
+def _migrate_invite_rewards_v1(raw: dict) -> dict:
+    return {"rewarded": {str(mid): int(iid) for mid, iid in raw.get("rewarded", {}).items()}}
+
+def _migrate_daily_v1(raw: dict) -> dict:
+    data = {}
+    for k, v in raw.items():
+        if isinstance(v, dict):
+            data[str(k)] = {"last": int(v.get("last", 0)), "streak": int(v.get("streak", 0)),
+                            "warned": bool(v.get("warned", False))}
+        else:
+            # Ancien format : juste un timestamp -> on démarre à streak 1 si déjà réclamé
+            data[str(k)] = {"last": int(v), "streak": 1 if int(v) > 0 else 0, "warned": False}
+    return data
+
+def _migrate_tickets_v1(raw: dict) -> dict:
+    return {str(k): int(v) for k, v in raw.items()}
+
+def _migrate_avent_v1(raw: dict) -> dict:
+    """Listes de jours -> masque 24 bits par utilisateur et année."""
+    masks: Dict[str, Dict[str, int]] = {}
+    for uid, years in raw.items():
+        for y, days in years.items():
+            if isinstance(days, list):
+                m = 0
+                for d in days:
+                    if 1 <= int(d) <= 24:
+                        m |= 1 << (int(d) - 1)
+                days = m
+            masks.setdefault(str(uid), {})[str(y)] = int(days)
+    return masks
+
+def _migrate_quests_progress_v1(raw: dict) -> dict:
+    # ancien format "plat" -> ranger dans daily
+    if "daily" not in raw and "weekly" not in raw and "lifetime" not in raw:
+        raw = {"daily": raw, "weekly": {}, "lifetime": {}}
+    for bucket in ("daily", "weekly", "lifetime"):
+        raw.setdefault(bucket, {})
+    return raw
+
+# fichier -> (variable de chemin, migrations vers v1, v2, ...)
+_SCHEMA_MIGRATIONS: Dict[str, tuple[str, list[Callable[[dict], dict]]]] = {
+    "points":          ("POINTS_DB_PATH", [_migrate_points_v1]),
+    "purchases":       ("PURCHASES_DB_PATH", [_migrate_purchases_v1]),
+    "invites":         ("INVITES_DB_PATH", [_migrate_invites_v1]),
+    "invites_rewards": ("INVITE_REWARDS_DB_PATH", [_migrate_invite_rewards_v1]),
+    "daily":           ("DAILY_DB_PATH", [_migrate_daily_v1]),
+    "tickets":         ("TICKETS_DB_PATH", [_migrate_tickets_v1]),
+    "avent":           ("AVENT_DB_PATH", [_migrate_avent_v1]),
+    "quests_progress": ("QUESTS_PROGRESS_DB_PATH", [_migrate_quests_progress_v1]),
+}
+
+def _load_schema() -> Dict[str, int]:
+    try:
+        return _read_data(SCHEMA_PATH)
+    except FileNotFoundError:
+        return {}
+
+def _pending_migrations() -> list[str]:
+    """Fichiers présents sur disque mais pas encore à la dernière version inscrite dans schema.json."""
+    schema = _load_schema()
+    return [store for store, (path_var, steps) in _SCHEMA_MIGRATIONS.items()
+            if int(schema.get(store, 0)) < len(steps) and os.path.exists(globals()[path_var])]
+
+def _migrate_data() -> list[str]:
+    """
+    Amène chaque fichier à la dernière version (écriture atomique) et l'inscrit dans schema.json.
+    À lancer avant le démarrage du bot. Retourne les migrations appliquées ("daily v1", ...).
+    Un fichier absent sera créé au format courant par son _ensure_* : il est noté à jour.
+    """
+    schema = _load_schema()
+    applied = []
+    for store, (path_var, steps) in _SCHEMA_MIGRATIONS.items():
+        current = int(schema.get(store, 0))
+        if current >= len(steps):
+            continue
+        path = globals()[path_var]
+        if os.path.exists(path):
+            data = _read_data(path)
+            for version in range(current + 1, len(steps) + 1):
+                data = steps[version - 1](data)
+                applied.append(f"{store} v{version}")
+            _atomic_write(path, data)
+        schema[store] = len(steps)
+    if applied or not os.path.exists(SCHEMA_PATH):
+        _atomic_write(SCHEMA_PATH, schema)
+    return applied
+
 if __name__ == "__main__":
+    for step in _migrate_data():
+        logging.info("Migration des données : %s", step)
     # Crée les fichiers si absents
     for ensure in (_ensure_points_exists, _ensure_shop_exists, _ensure_purchases_exists, _ensure_quests_exists, _ensure_quests_progress_exists):
         try:
@@ -4814,6 +6686,7 @@ if __name__ == "__main__":
         except Exception:
             pass
     bot.run(TOKEN)
+    _activity_log.flush()  # compteurs encore en file à l'arrêt
 
 
 